@@ -1,20 +1,83 @@
 from confluence.api import ConfluenceAPI
+from confluence.extraction import PageExtractor, content_information_types, page_digest
 from database.api import DatabaseAPI
-from flatdict import FlatDict
 import pandas as pd
 import config_parser
 import os
-import re
 import logging
 import datetime
+import dateutil.parser
 import argparse
+import sys
+import itertools
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 VERSION = '1.3.4'
+# The number of stored rows handled at a time when iterating over a table.
+BATCH_SIZE = 1000
+
+
+def get_table_name(table_prefix, page_identifier):
+    """Gets the name of the table that stores the pages matching a page identifier.
+
+    Args:
+        table_prefix (str): The current database table name prefix.
+        page_identifier (str): The label or title that the pages are identified by.
+
+    Returns:
+        str: The table name.
+    """
+    # table = table_prefix + '_' + page_type + '_' + page_identifier
+    return table_prefix.replace(' ', '') + '_' + page_identifier.replace('_', '').replace(' ', '')[:5].lower()
+
+
+def batches(rows, size=BATCH_SIZE):
+    """Splits an iterable of rows into lists of at most size rows.
+
+    Args:
+        rows (iterable): The rows, i.e. from DatabaseAPI.stream.
+        size (int): The maximum number of rows in each batch.
+
+    Yields:
+        list: Each batch of rows.
+    """
+    rows = iter(rows)
+    batch = list(itertools.islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(rows, size))
+
+
+def run_jobs(jobs, max_workers=1):
+    """Runs crawl jobs until there is no more work left.
+
+    A job is a tuple of a function and its arguments, each job returns a list of further jobs to run (i.e. the child
+    pages and subtrees that it discovered). With a max_workers of 1 the jobs are run depth first in series, otherwise
+    siblings and subtrees are run concurrently on a bounded pool of worker threads.
+
+    Args:
+        jobs (list): A list of (function, args) tuples to run.
+        max_workers (int): The maximum number of jobs to run at the same time.
+    """
+    jobs = list(jobs)
+    if max_workers <= 1:
+        while jobs:
+            function, args = jobs.pop(0)
+            jobs[:0] = function(*args)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {executor.submit(function, *args) for function, args in jobs}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for function, args in future.result():
+                        pending.add(executor.submit(function, *args))
 
 
 # noinspection PyTypeChecker,PyShadowingNames
 def child_page_recursive(pages, space_id, parent_page_id, table_prefix, recheck_pages_meet_criteria=False,
-                         config_modified=False):
+                         config_modified=False, max_workers=1):
     """Recursively inserts page information into the database after making requests to the Confluence API.
 
     Args:
@@ -25,144 +88,264 @@ def child_page_recursive(pages, space_id, parent_page_id, table_prefix, recheck_
         recheck_pages_meet_criteria (bool): Ensures that all current pages meet the criteria set out in the config file.
             If this is False, it will assume that all pages in the database meet the criteria and will only take delta changes for these.
         config_modified (bool): Whether the config has been modified since last launch.
+        max_workers (int): The maximum number of pages to crawl at the same time.
     """
+    run_jobs([(crawl_child_pages, (pages, space_id, parent_page_id, table_prefix, recheck_pages_meet_criteria,
+                                   config_modified))], max_workers)
+
+
+# noinspection PyTypeChecker,PyShadowingNames
+def crawl_child_pages(pages, space_id, parent_page_id, table_prefix, recheck_pages_meet_criteria=False,
+                      config_modified=False):
+    """Creates the tables for a level of the page tree and lists the child pages of the parent page.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        space_id (int): The top level space_id that the information relates to.
+        parent_page_id (int): The current pages parent page id.
+        table_prefix (str): The current database table name prefix.
+        recheck_pages_meet_criteria (bool): Ensures that all current pages meet the criteria set out in the config file.
+        config_modified (bool): Whether the config has been modified since last launch.
+
+    Returns:
+        list: A job for each of the child pages.
+    """
+    jobs = []
+    # When rechecking the criteria, only the matching children of each page type are retrieved through a CQL search.
+    # Otherwise all children are listed once and checked against the pages stored in the database.
+    criteria_search = recheck_pages_meet_criteria or config_modified
+    child_pages = {}
+    if not criteria_search:
+        try:
+            child_pages = ConfluenceAPI.get_child_pages(parent_page_id)
+        except:
+            logger.warning(
+                'child_page_recursive: Unable to get child pages for: %s' % str(parent_page_id))
+            return jobs
+
     # if the child page has not been updated since we last stored the information, then no need to check labels/title!
     for page_type in pages:
         for page_identifier in pages[page_type]:
 
             # Create tables to store the pages in and the information they contain.
-            # table = table_prefix + '_' + page_type + '_' + page_identifier
-            table = table_prefix.replace(
-                ' ', '') + '_' + page_identifier.replace('_', '').replace(' ', '')[:5].lower()
+            table = get_table_name(table_prefix, page_identifier)
             DatabaseAPI.create_table(table)
             info_table = table + '__info'
             DatabaseAPI.create_table(info_table, True)
 
-            try:
-                child_pages = ConfluenceAPI.get_child_page_ids(parent_page_id)
-            except:
-                logger.warning(
-                    'child_page_recursive: Unable to get child pages for: %s' % str(parent_page_id))
-                continue
+            if criteria_search:
+                try:
+                    if page_type == 'labels':
+                        child_pages = ConfluenceAPI.get_child_pages(parent_page_id, label=page_identifier)
+                    elif page_type == 'titles':
+                        child_pages = ConfluenceAPI.get_child_pages(parent_page_id, title=page_identifier)
+                    else:
+                        child_pages = ConfluenceAPI.get_child_pages(parent_page_id)
+                except:
+                    logger.warning(
+                        'child_page_recursive: Unable to search child pages for: %s' % str(parent_page_id))
+                    continue
+
+                # Cleanup the pages that are stored but no longer meet the criteria.
+                # A search can leave pages out (i.e. while the search index is rebuilt), so each page is checked on its
+                # own before it is deleted. Pages that no longer exist are left to the cleanup.
+                for stored_page in DatabaseAPI.select(table, parent_page_id):
+                    if stored_page['key'] in child_pages:
+                        continue
+                    try:
+                        child_page = ConfluenceAPI.get_page_record(stored_page['key'])
+                    except:
+                        logger.warning(
+                            'child_page_recursive: Unable to check page: %s' % str(stored_page['key']))
+                        continue
+                    if child_page is None:
+                        continue
+                    if child_page['ancestors'][-1:] == [parent_page_id] and \
+                            meets_criteria(page_type, page_identifier, child_page):
+                        # The page was left out of the search.
+                        child_pages[stored_page['key']] = child_page
+                    else:
+                        DatabaseAPI.delete(table, parent_page_id, stored_page['key'])
+                        DatabaseAPI.delete(info_table, stored_page['key'])
+                        DatabaseAPI.delete_digest(table, stored_page['key'])
+
             for child_page_id in child_pages:
+                jobs.append((process_child_page, (pages, page_type, page_identifier, space_id, parent_page_id, table,
+                                                  child_page_id, child_pages[child_page_id],
+                                                  recheck_pages_meet_criteria, config_modified)))
+    return jobs
+
+
+def meets_criteria(page_type, page_identifier, child_page):
+    """Checks whether a page meets the criteria of a node in the config file.
+
+    Args:
+        page_type (str): The page navigation type, i.e. labels or titles.
+        page_identifier (str): The label or title that the page should have.
+        child_page (dict): The page record, as returned by ConfluenceAPI.get_child_pages.
+
+    Returns:
+        bool: Whether the page is labelled as something/title is something.
+    """
+    if page_type == 'titles':
+        return child_page['name'] == page_identifier
+    elif page_type == 'labels':
+        return page_identifier in child_page['labels']
+    return False
+
 
-                # Decision tree to see if the current page meets the criteria provided in the config file.
-                # if we are not forced to recheck the page meets the criteria then use the pages in the database table.
-                # else, check to see if the page meets either criteria.
-                page_meets_criteria = False
-                if not recheck_pages_meet_criteria and not config_modified:
-                    if DatabaseAPI.check_data_exists(table, parent_page_id, child_page_id):
-                        # If the page already exists in the database ignore
-                        # checking the page meets the criteria, unless forced to.
-                        page_meets_criteria = True
-                else:
-                    if page_type == 'titles':
-                        if child_pages[child_page_id]['name'] == page_identifier:
-                            page_meets_criteria = True
-                    elif page_type == 'labels':
-                        try:
-                            if page_identifier in ConfluenceAPI.get_page_labels(child_page_id):
-                                # Check that the page meets the criteria given,
-                                # i.e. it is labelled as something/title is something and needs to be updated.
-                                page_meets_criteria = True
-                        except:
-                            logger.warning(
-                                'child_page_recursive: Unable to retrieve labels for: %s' % str(child_page_id))
-                            continue
-
-                if page_meets_criteria:
-                    page_updated = DatabaseAPI.insert_or_update(
-                        table, parent_page_id, child_page_id, child_pages[child_page_id]['name'],
-                        child_pages[child_page_id]['last_updated'], True)
-
-                    # If the current page information was updated since the last run,
-                    # delete all children information and re-fill it.
-                    page_content = ''
-                    if page_updated or config_modified:
-                        logger.info('Updating information in space %s for page: %s' % (
-                            str(space_id), child_pages[child_page_id]['name']))
-                        DatabaseAPI.delete(info_table, child_page_id)
-                        try:
-                            page_content = ConfluenceAPI.get_page_content(
-                                child_page_id)
-                        except:
-                            logger.warning(
-                                'child_page_recursive: Unable to get page content for: %s' % str(child_page_id))
-                            continue
-
-                    for page_info_type in pages[page_type][page_identifier]:
-                        if page_info_type == 'pages':
-                            child_page_recursive(pages[page_type][page_identifier][page_info_type], space_id,
-                                                 child_page_id, table, recheck_pages_meet_criteria, config_modified)
-                        else:
-                            if page_updated or config_modified:
-                                try:
-                                    if page_info_type == 'panels':
-                                        for panel_identifier in pages[page_type][page_identifier][page_info_type]:
-                                            panel = FlatDict(ConfluenceAPI.get_panel(
-                                                page_content, panel_identifier, space_id))
-                                            for k, v in panel.items():
-                                                # For each key remove list numbers.
-                                                # i.e. FlatDict will put in :0, :1: for each list element.
-                                                k = re.sub(':(\d+)', '', k)
-                                                k = re.sub(':(\d+):', ':', k)
-                                                DatabaseAPI.insert_or_update(
-                                                    info_table, child_page_id, k, v,
-                                                    child_pages[child_page_id]['last_updated'])
-                                    elif page_info_type == 'page_properties':
-                                        # Get all page properties and put the values into the database.
-                                        page_properties = ConfluenceAPI.get_page_properties(
-                                            child_page_id, space_id, pages[page_type][page_identifier][page_info_type])
-                                        for page_property in page_properties:
-                                            for val in page_properties[page_property]:
-                                                DatabaseAPI.insert_or_update(
-                                                    info_table, child_page_id, page_property, val,
-                                                    child_pages[child_page_id]['last_updated'])
-                                    elif page_info_type == 'headings':
-                                        for heading_identifier in pages[page_type][page_identifier][page_info_type]:
-                                            heading = FlatDict(ConfluenceAPI.get_heading(
-                                                page_content, heading_identifier))
-                                            for k, v in heading.items():
-                                                # For each key remove list numbers.
-                                                # i.e. FlatDict will put in :0, :1: for each list element.
-                                                k = re.sub(':(\d+)', '', k)
-                                                k = re.sub(':(\d+):', ':', k)
-                                                DatabaseAPI.insert_or_update(
-                                                    info_table, child_page_id, k, v,
-                                                    child_pages[child_page_id]['last_updated'])
-                                    elif page_info_type == 'page':
-                                        page_information = FlatDict(ConfluenceAPI.get_page(
-                                            page_content, child_pages[child_page_id]['name']))
-                                        for k, v in page_information.items():
-                                            # For each key remove list numbers.
-                                            # i.e. FlatDict will put in :0, :1: for each list element.
-                                            k = re.sub(':(\d+)', '', k)
-                                            k = re.sub(':(\d+):', ':', k)
-                                            DatabaseAPI.insert_or_update(
-                                                info_table, child_page_id, k, v,
-                                                child_pages[child_page_id]['last_updated'])
-                                    elif page_info_type == 'url':
-                                        for url_type in pages[page_type][page_identifier][page_info_type]:
-                                            url = ConfluenceAPI.get_page_urls(
-                                                child_page_id, url_type)
-                                            DatabaseAPI.insert_or_update(
-                                                info_table, child_page_id, url_type, url,
-                                                child_pages[child_page_id]['last_updated'])
-                                    else:
-                                        logger.warning(
-                                            'child_page_recursive: Unknown page information retrieval type: %s' % page_info_type)
-                                except:
-                                    logger.error(
-                                        'child_page_recursive: Error inserting data for page with id: %s, name: %s' % (
-                                            str(child_page_id), child_pages[child_page_id]['name']))
-                else:
-                    # Cleanup the ignore, info and default table by removing any information associated with page.
-                    # Child pages get cleaned up by the cleanup method.
-                    DatabaseAPI.delete(table, parent_page_id, child_page_id)
-                    DatabaseAPI.delete(info_table, child_page_id)
-
-
-def recursive_db_cleanup(pages, space_id, table_prefix, mode):
+# noinspection PyTypeChecker,PyShadowingNames
+def process_child_page(pages, page_type, page_identifier, space_id, parent_page_id, table, child_page_id, child_page,
+                       recheck_pages_meet_criteria=False, config_modified=False):
+    """Inserts a single child pages information into the database if it meets the criteria in the config file.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        page_type (str): The page navigation type, i.e. labels or titles.
+        page_identifier (str): The label or title that the page should have.
+        space_id (int): The top level space_id that the information relates to.
+        parent_page_id (int): The current pages parent page id.
+        table (str): The table that the page is stored in.
+        child_page_id (int): The id of the child page.
+        child_page (dict): The child page record, as returned by ConfluenceAPI.get_child_pages.
+        recheck_pages_meet_criteria (bool): Ensures that all current pages meet the criteria set out in the config file.
+        config_modified (bool): Whether the config has been modified since last launch.
+
+    Returns:
+        list: A job for each of the subtrees below the child page.
+    """
+    jobs = []
+    info_table = table + '__info'
+
+    # Decision tree to see if the current page meets the criteria provided in the config file.
+    # if we are not forced to recheck the page meets the criteria then use the pages in the database table.
+    # else, check to see if the page meets either criteria.
+    page_meets_criteria = False
+    if not recheck_pages_meet_criteria and not config_modified:
+        if DatabaseAPI.check_data_exists(table, parent_page_id, child_page_id):
+            # If the page already exists in the database ignore
+            # checking the page meets the criteria, unless forced to.
+            page_meets_criteria = True
+    else:
+        page_meets_criteria = meets_criteria(page_type, page_identifier, child_page)
+
+    if page_meets_criteria:
+        page_updated = DatabaseAPI.insert_or_update(
+            table, parent_page_id, child_page_id, child_page['name'],
+            child_page['last_updated'], True)
+
+        # If the current page information was updated since the last run,
+        # delete all children information and re-fill it.
+        # A page without a content digest did not have all of its information stored, i.e. it could not be extracted
+        # or its batch was rolled back, so it is extracted again.
+        if page_updated or config_modified or not DatabaseAPI.has_digest(table, child_page_id):
+            update_page_information(pages, page_type, page_identifier, space_id, table, child_page_id, child_page)
+
+        if 'pages' in pages[page_type][page_identifier]:
+            jobs.append((crawl_child_pages, (pages[page_type][page_identifier]['pages'], space_id,
+                                             child_page_id, table, recheck_pages_meet_criteria,
+                                             config_modified)))
+    else:
+        # Cleanup the ignore, info and default table by removing any information associated with page.
+        # Child pages get cleaned up by the cleanup method.
+        DatabaseAPI.delete(table, parent_page_id, child_page_id)
+        DatabaseAPI.delete(info_table, child_page_id)
+        DatabaseAPI.delete_digest(table, child_page_id)
+    return jobs
+
+
+# noinspection PyShadowingNames
+def update_page_information(pages, page_type, page_identifier, space_id, table, child_page_id, child_page,
+                            check_digest=True, keep_incomplete=False):
+    """Replaces the stored information of a page with the information extracted from the page record.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        page_type (str): The page navigation type, i.e. labels or titles.
+        page_identifier (str): The label or title that the page should have.
+        space_id (int): The top level space_id that the information relates to.
+        table (str): The table that the page is stored in.
+        child_page_id (int): The id of the page.
+        child_page (dict): The page record, as returned by ConfluenceAPI.get_child_pages.
+        check_digest (bool): Whether to leave the information as it is if the content digest of the page is unchanged.
+        keep_incomplete (bool): Whether to leave the stored information as it is if some of the information could not
+            be retrieved, rather than replacing it with the information that could.
+    """
+    info_table = table + '__info'
+
+    # Unless the content, labels and configuration of the page are unchanged (i.e. only a macro or comment changed
+    # the page version), in which case the stored information is still correct.
+    digest = page_digest(child_page['content'], child_page['name'], pages[page_type][page_identifier],
+                         child_page['labels'])
+    if check_digest and DatabaseAPI.get_digest(table, child_page_id) == digest:
+        logger.info('Information in space %s is unchanged for page: %s' % (
+            str(space_id), child_page['name']))
+        return
+
+    logger.info('Updating information in space %s for page: %s' % (
+        str(space_id), child_page['name']))
+
+    # The information that only depends on the page content is extracted in one go, the page is only parsed
+    # once (possibly in an extraction worker process).
+    extracted = {}
+    plan = [(page_info_type, pages[page_type][page_identifier][page_info_type])
+            for page_info_type in pages[page_type][page_identifier]
+            if page_info_type in content_information_types]
+    if plan:
+        extracted = PageExtractor.extract(child_page['content'], plan, space_id, child_page['name'])
+
+    # The rows of the page are collected and written in one go, only the rows that changed are written.
+    rows = []
+    information_complete = True
+    for page_info_type in pages[page_type][page_identifier]:
+        if page_info_type == 'pages':
+            continue
+        try:
+            if page_info_type in content_information_types:
+                if extracted[page_info_type] is None:
+                    raise ValueError('Unable to extract %s' % page_info_type)
+                for k, v in extracted[page_info_type]:
+                    rows.append((k, v, child_page['last_updated']))
+            elif page_info_type == 'page_properties':
+                # Get all page properties and put the values into the database.
+                page_properties = ConfluenceAPI.get_page_properties(
+                    child_page_id, space_id, pages[page_type][page_identifier][page_info_type])
+                for page_property in page_properties:
+                    for val in page_properties[page_property]:
+                        rows.append((page_property, val, child_page['last_updated']))
+            elif page_info_type == 'url':
+                for url_type in pages[page_type][page_identifier][page_info_type]:
+                    url = ConfluenceAPI.get_page_urls(
+                        child_page_id, url_type, child_page['links'])
+                    rows.append((url_type, url, child_page['last_updated']))
+            else:
+                logger.warning(
+                    'child_page_recursive: Unknown page information retrieval type: %s' % page_info_type)
+        except:
+            information_complete = False
+            logger.error(
+                'child_page_recursive: Error retrieving data for page with id: %s, name: %s' % (
+                    str(child_page_id), child_page['name']))
+
+    # When re-extracting from the archive the missing information can not be retrieved, so rather than losing its
+    # stored rows the page is left as it is. The digest is deleted so that the page is extracted on the next sync.
+    if not information_complete and keep_incomplete:
+        logger.warning('child_page_recursive: Information is incomplete, keeping the stored information for page with '
+                       'id: %s, name: %s' % (str(child_page_id), child_page['name']))
+        DatabaseAPI.delete_digest(table, child_page_id)
+        return
+
+    # The digest is only stored if all of the information was retrieved, so that a failed page is tried again on the
+    # next run.
+    try:
+        DatabaseAPI.sync(info_table, child_page_id, rows, table, digest if information_complete else None)
+    except:
+        logger.error(
+            'child_page_recursive: Error inserting data for page with id: %s, name: %s' % (
+                str(child_page_id), child_page['name']))
+
+
+def recursive_db_cleanup(pages, space_id, table_prefix, mode, nested=False):
     """Recursively remove page information from the database by checking if the current page still exists in the database.
 
     Args:
@@ -170,64 +353,283 @@ def recursive_db_cleanup(pages, space_id, table_prefix, mode):
         space_id (int): The top level space_id that the information relates to.
         table_prefix (str): The current database table name prefix.
         mode (bool): Only perform cleanup during a full sync.
+        nested (bool): Whether the table_prefix is the table of the parent pages, i.e. this is not the top level.
     """
     if mode:
         for page_type in pages:
             for page_identifier in pages[page_type]:
                 # Determine the table name that we are looking in.
-                table = table_prefix.replace(
-                    ' ', '') + '_' + page_identifier.replace('_', '').replace(' ', '')[:5].lower()
+                table = get_table_name(table_prefix, page_identifier)
                 info_table = table + '__info'
-                child_pages = DatabaseAPI.select(table)
-
-                # For each of the child pages check to see if they still exist, if they do not then delete the page.
-                for child_page in child_pages:
-                    # See if the parent page exists in the database if not then we can immediately delete this child
-                    # page.
-                    parent_exists = True
-                    if space_id != child_page['parent']:
-                        parent_exists = len(DatabaseAPI.select(
-                            table_prefix.replace(' ', ''), None, child_page['parent'])) != 0
-                    exists = ConfluenceAPI.check_page_exists(child_page['key'])
-
-                    # The page does not exist on the wiki or the parent does not exist so delete it from the database
-                    # along with the info.
-                    if not parent_exists or not exists:
-                        logger.info("recursive_db_cleanup: Deleting page with id: %s, Name: %s" % (
-                            str(child_page['key']), child_page['value']))
-                        DatabaseAPI.delete(
-                            table, child_page['parent'], child_page['key'])
-                        DatabaseAPI.delete(info_table, child_page['key'])
+
+                # Pages whose parent page does not exist in the database can be deleted immediately. The top level
+                # pages have the space homepage as their parent.
+                orphans = set()
+                if nested:
+                    orphans = set(child_page['id'] for child_page in
+                                  DatabaseAPI.select_orphans(table, table_prefix.replace(' ', '')))
+
+                # Check which of the child pages still exist in batches, if they do not then delete the page. The
+                # table is streamed so that only a batch of pages is held in memory at a time.
+                for child_pages in batches(DatabaseAPI.stream(table)):
+                    existing = ConfluenceAPI.get_existing_page_ids(set(child_page['key'] for child_page in child_pages))
+                    for child_page in child_pages:
+                        # The page does not exist on the wiki or the parent does not exist so delete it from the
+                        # database along with the info.
+                        if child_page['id'] in orphans or child_page['key'] not in existing:
+                            logger.info("recursive_db_cleanup: Deleting page with id: %s, Name: %s" % (
+                                str(child_page['key']), child_page['value']))
+                            DatabaseAPI.delete(
+                                table, child_page['parent'], child_page['key'])
+                            DatabaseAPI.delete(info_table, child_page['key'])
+                            DatabaseAPI.delete_digest(table, child_page['key'])
 
                 # Go down the next level and remove these pages.
                 for page_info_type in pages[page_type][page_identifier]:
                     if page_info_type == 'pages':
                         recursive_db_cleanup(
-                            pages[page_type][page_identifier][page_info_type], space_id, table, mode)
+                            pages[page_type][page_identifier][page_info_type], space_id, table, mode, True)
+
+
+def get_page_tree_nodes(pages, table_prefix, parent_table=None):
+    """Flattens the configured page tree into a list of nodes.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        table_prefix (str): The current database table name prefix.
+        parent_table (str): The table that stores the parent pages of this level (None for the top level).
+
+    Returns:
+        list: A (pages, page_type, page_identifier, table, parent_table) tuple for each node in the tree.
+    """
+    nodes = []
+    for page_type in pages:
+        for page_identifier in pages[page_type]:
+            table = get_table_name(table_prefix, page_identifier)
+            nodes.append((pages, page_type, page_identifier, table, parent_table))
+            if 'pages' in pages[page_type][page_identifier]:
+                nodes += get_page_tree_nodes(pages[page_type][page_identifier]['pages'], table, table)
+    return nodes
+
+
+# noinspection PyShadowingNames
+def incremental_sync(pages, space, space_id, table_prefix, since, config_modified=False, max_workers=1,
+                     timezone=None):
+    """Re-extracts only the pages of a space that have been modified since the last successful sync.
+
+    Each modified page is mapped to its place in the configured page tree through its parent page, which must either be
+    the space homepage or a page that is already stored in the parent table of a node in the tree. Pages are processed
+    from the top of the space down, so a page that newly meets the criteria is stored before its modified children.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        space (str): The key of the space.
+        space_id (int): The top level space_id that the information relates to.
+        table_prefix (str): The current database table name prefix.
+        since (datetime.datetime): The watermark of the last successful sync.
+        config_modified (bool): Whether the config has been modified since last launch.
+        max_workers (int): The maximum number of pages to process at the same time.
+        timezone (datetime.tzinfo): The timezone of the wiki, that the CQL search reads the watermark in.
+    """
+    nodes = get_page_tree_nodes(pages, table_prefix)
+    for node in nodes:
+        DatabaseAPI.create_table(node[3])
+        DatabaseAPI.create_table(node[3] + '__info', True)
+
+    modified_pages = ConfluenceAPI.get_pages_modified_since(space, since, timezone)
+    logger.info('incremental_sync: %d pages modified in space %s since %s' % (
+        len(modified_pages), space, since.strftime('%Y-%m-%d %H:%M:%S')))
+
+    depths = sorted(set(len(page['ancestors']) for page in modified_pages.values()))
+    for depth in depths:
+        jobs = []
+        for page_id, page in modified_pages.items():
+            if len(page['ancestors']) != depth or depth == 0:
+                continue
+            parent_page_id = page['ancestors'][-1]
+            for node_pages, page_type, page_identifier, table, parent_table in nodes:
+                if parent_table is None:
+                    if parent_page_id != space_id:
+                        continue
+                elif not DatabaseAPI.check_key_exists(parent_table, parent_page_id):
+                    continue
+                jobs.append((process_modified_page, (node_pages, page_type, page_identifier, space_id, parent_page_id,
+                                                     table, page_id, page, config_modified)))
+        run_jobs(jobs, max_workers)
+
+
+# noinspection PyShadowingNames
+def process_modified_page(pages, page_type, page_identifier, space_id, parent_page_id, table, page_id, page,
+                          config_modified=False):
+    """Rechecks and re-extracts a modified page, crawling its subtree only if the page was not stored before.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        page_type (str): The page navigation type, i.e. labels or titles.
+        page_identifier (str): The label or title that the page should have.
+        space_id (int): The top level space_id that the information relates to.
+        parent_page_id (int): The current pages parent page id.
+        table (str): The table that the page is stored in.
+        page_id (int): The id of the modified page.
+        page (dict): The page record, as returned by ConfluenceAPI.get_pages_modified_since.
+        config_modified (bool): Whether the config has been modified since last launch.
+
+    Returns:
+        list: A job for each of the subtrees below the page if it newly meets the criteria.
+    """
+    stored = DatabaseAPI.check_data_exists(table, parent_page_id, page_id)
+    jobs = process_child_page(pages, page_type, page_identifier, space_id, parent_page_id, table, page_id, page,
+                              True, config_modified)
+    return [] if stored else jobs
+
+
+# noinspection PyShadowingNames
+def reextract(pages, space_id, table_prefix, max_workers=1):
+    """Rebuilds the information of all of the stored pages of a space from the local page archive.
+
+    No requests are made to Confluence, so only the pages that are already stored are re-extracted, a full sync is
+    needed to pick up pages that newly meet the criteria in the config file.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        space_id (int): The top level space_id that the information relates to.
+        table_prefix (str): The current database table name prefix.
+        max_workers (int): The maximum number of pages to process at the same time.
+    """
+    jobs = []
+    for node_pages, page_type, page_identifier, table, parent_table in get_page_tree_nodes(pages, table_prefix):
+        DatabaseAPI.create_table(table)
+        DatabaseAPI.create_table(table + '__info', True)
+        for page_id in set(stored_page['key'] for stored_page in DatabaseAPI.stream(table)):
+            jobs.append((reextract_page, (node_pages, page_type, page_identifier, space_id, table, page_id)))
+    run_jobs(jobs, max_workers)
+
+
+# noinspection PyShadowingNames
+def reextract_page(pages, page_type, page_identifier, space_id, table, page_id):
+    """Rebuilds the information of a single stored page from the local page archive.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        page_type (str): The page navigation type, i.e. labels or titles.
+        page_identifier (str): The label or title that the page should have.
+        space_id (int): The top level space_id that the information relates to.
+        table (str): The table that the page is stored in.
+        page_id (int): The id of the page.
+
+    Returns:
+        list: No further jobs.
+    """
+    page = ConfluenceAPI.get_archived_page(page_id)
+    if page is None:
+        logger.warning('reextract_page: Page with id %s is not in the archive, skipping.' % str(page_id))
+        return []
+    update_page_information(pages, page_type, page_identifier, space_id, table, page_id, page, False, True)
+    return []
 
 
 def dump_application_inventory(mode):
     if mode:
         logger.info("dump_application_inventory: Creating CSV dump file.")
-        dump = pd.DataFrame(DatabaseAPI.select('wiki_app_info_full'))
-        dump.to_csv(os.path.dirname(os.path.realpath(__file__)) + "/application_inventory/dump/" +
-                    datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S') + ".csv", index=None)
+        path = os.path.dirname(os.path.realpath(__file__)) + "/application_inventory/dump/" + \
+            datetime.datetime.now().strftime('%Y-%m-%d-%H:%M:%S') + ".csv"
+        # The view is streamed and written a batch at a time, so the dump is never held in memory in full.
+        open(path, 'w').close()
+        for i, rows in enumerate(batches(DatabaseAPI.stream('wiki_app_info_full', order_by=None))):
+            pd.DataFrame(rows).to_csv(path, mode='a', header=i == 0, index=None)
+
+
+def begin_rebuild(pages, table_prefix):
+    """Starts a bulk rebuild of the information tables of the configured page tree.
+
+    Args:
+        pages (dict): A dictionary of pages to crawl through, have a look at the example config for more information.
+        table_prefix (str): The current database table name prefix.
+    """
+    DatabaseAPI.begin_rebuild(sorted(set(table + '__info' for node_pages, page_type, page_identifier, table, parent_table
+                                         in get_page_tree_nodes(pages, table_prefix))))
 
 
 def run(conf, mode, conf_modified):
+    """Runs a full or half sync of all the configured spaces.
+
+    Returns:
+        bool: Whether all of the spaces were synced without error.
+    """
+    success = True
     for space, value in conf['wiki']['spaces'].items():
         try:
             space_id = ConfluenceAPI.get_homepage_id_of_space(space)
             DatabaseAPI.update_spaces(
                 space_id, space, ConfluenceAPI.get_last_update_time_of_content(space_id))
+            # After a config change the information of every page is written again, so the tables are bulk rebuilt.
+            if conf_modified and conf.get('sync', {}).get('bulk_rebuild', False):
+                begin_rebuild(value['pages'], conf['mysql']['table_prefix'])
             child_page_recursive(value['pages'], space_id, space_id,
-                                 conf['mysql']['table_prefix'], mode, conf_modified)
+                                 conf['mysql']['table_prefix'], mode, conf_modified,
+                                 conf.get('sync', {}).get('max_workers', 1))
+            # The queued information is written before the cleanup, so that none is written for deleted pages.
+            DatabaseAPI.flush()
+            DatabaseAPI.finish_rebuild()
             recursive_db_cleanup(value['pages'], space_id,
                                  conf['mysql']['table_prefix'], mode)
             # dump_application_inventory(mode)
         except:
             logger.error('run: Error retrieving information for space: %s' % space)
+            DatabaseAPI.abort_rebuild()
+            success = False
+    return success
+
 
+def run_incremental(conf, since, conf_modified):
+    """Runs an incremental sync of all the configured spaces.
+
+    The pages modified since a safety margin (`sync.watermark_margin` minutes) before the watermark are synced, which
+    covers clock differences and the rounding of the CQL search to the minute. The pages that have been deleted are
+    removed with the batched existence check of a full sync.
+
+    Returns:
+        bool: Whether all of the spaces were synced without error.
+    """
+    success = True
+    since -= datetime.timedelta(minutes=conf.get('sync', {}).get('watermark_margin', 60))
+    for space, value in conf['wiki']['spaces'].items():
+        try:
+            space_id = ConfluenceAPI.get_homepage_id_of_space(space)
+            last_updated = ConfluenceAPI.get_last_update_time_of_content(space_id)
+            DatabaseAPI.update_spaces(space_id, space, last_updated)
+            # The times of the pages are given in the timezone of the wiki, which the CQL search reads times in.
+            incremental_sync(value['pages'], space, space_id, conf['mysql']['table_prefix'], since, conf_modified,
+                             conf.get('sync', {}).get('max_workers', 1), last_updated.tzinfo)
+            DatabaseAPI.flush()
+            recursive_db_cleanup(value['pages'], space_id, conf['mysql']['table_prefix'], True)
+        except:
+            logger.error('run_incremental: Error retrieving information for space: %s' % space)
+            success = False
+    return success
+
+
+def run_reextract(conf):
+    """Rebuilds the information of all the configured spaces from the local page archive.
+
+    Returns:
+        bool: Whether all of the spaces were re-extracted without error.
+    """
+    success = True
+    space_ids = {space['name']: space['space_id'] for space in DatabaseAPI.get_spaces()}
+    for space, value in conf['wiki']['spaces'].items():
+        try:
+            if conf.get('sync', {}).get('bulk_rebuild', False):
+                begin_rebuild(value['pages'], conf['mysql']['table_prefix'])
+            reextract(value['pages'], space_ids[space], conf['mysql']['table_prefix'],
+                      conf.get('sync', {}).get('max_workers', 1))
+            DatabaseAPI.flush()
+            DatabaseAPI.finish_rebuild()
+        except:
+            logger.error('run_reextract: Error re-extracting information for space: %s' % space)
+            DatabaseAPI.abort_rebuild()
+            success = False
+    return success
 
 if __name__ == '__main__':
     # Argument parsing.
@@ -242,6 +644,10 @@ if __name__ == '__main__':
                         help='runs the application in full sync mode. i.e. pages are checked to ensure they meet the criteria in the config file.')
     parser.add_argument('--half-sync', action='store_true',
                         help='runs the application in half sync mode. i.e. no new pages will be added to the database.')
+    parser.add_argument('--incremental-sync', action='store_true',
+                        help='runs the application in incremental sync mode. i.e. only pages modified since the last successful full or incremental sync are updated.')
+    parser.add_argument('--reextract', action='store_true',
+                        help='rebuilds the information of the stored pages from the local page archive, without making any requests to the wiki.')
     parser.add_argument('--version', action='version',
                         version='Conflex Version: ' + VERSION)
     args = parser.parse_args()
@@ -257,13 +663,28 @@ if __name__ == '__main__':
     DatabaseAPI.connect(config)
     DatabaseAPI.create_spaces_table()
     DatabaseAPI.create_application_table()
-
-    # Setup the confluence API.
-    ConfluenceAPI.setup(config)
-
-    # Store Last config modified time in database.
-    config_data = DatabaseAPI.update_conflex_application(
-        'last_config_change', str(config['config_modified_time']))
+    DatabaseAPI.create_digests_table()
+    # The page tables can not be written safely without the indexes of the latest schema version, so the application
+    # stops if they can not be added.
+    try:
+        DatabaseAPI.migrate([table for space in config['wiki']['spaces'].values()
+                             for node_pages, page_type, page_identifier, table, parent_table
+                             in get_page_tree_nodes(space['pages'], config['mysql']['table_prefix'])])
+    except:
+        logger.error('Unable to upgrade the database schema, stopping.')
+        DatabaseAPI.disconnect()
+        sys.exit(1)
+
+    # Setup the confluence API and the page extraction workers.
+    ConfluenceAPI.setup(config, args.reextract)
+    PageExtractor.setup(config)
+
+    # Compare the config modified time with the one stored in the database.
+    # The time is only stored once a sync has run successfully with the config, so that a sync that fails (or a bulk
+    # rebuild that is abandoned) is run with the config change again on the next run. A re-extraction does not recheck
+    # which pages meet the criteria, so the config change is left for the next sync.
+    config_data = DatabaseAPI.get_conflex_application('last_config_change')
+    config_synced = False
     config_modified = False
     if config_data:
         if float(config_data['value']) != config['config_modified_time']:
@@ -276,18 +697,55 @@ if __name__ == '__main__':
     #     datastore.run(config)
 
     # Run the main application in the appropriate mode.
+    # The start time of a full or incremental sync is stored as the watermark for the next incremental sync once all
+    # spaces have been synced successfully. The time is taken from the wiki server and stored in UTC, so that it does
+    # not depend on the clock or timezone of this machine.
+    sync_start_time = ConfluenceAPI.get_server_time()
     if args.full_sync:
         logger.info('Application starting at: %s, running in full sync mode.' %
                     datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        run(config, True, config_modified)
+        if run(config, True, config_modified):
+            DatabaseAPI.update_conflex_application('last_successful_sync',
+                                                   sync_start_time.strftime('%Y-%m-%d %H:%M:%S%z'))
+            config_synced = True
+
+    if args.incremental_sync:
+        watermark = DatabaseAPI.get_conflex_application('last_successful_sync')
+        if watermark is None or config_modified:
+            # Without a watermark (or after a config change) every page has to be checked.
+            logger.info('Application starting at: %s, running in full sync mode as an incremental sync is not possible.' %
+                        datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            success = run(config, True, config_modified)
+        else:
+            logger.info('Application starting at: %s, running in incremental sync mode.' %
+                        datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+            # A watermark without a timezone was stored in the local time by an older version.
+            since = dateutil.parser.parse(watermark['value'])
+            if since.tzinfo is None:
+                since = since.astimezone()
+            success = run_incremental(config, since, config_modified)
+        if success:
+            DatabaseAPI.update_conflex_application('last_successful_sync',
+                                                   sync_start_time.strftime('%Y-%m-%d %H:%M:%S%z'))
+            config_synced = True
 
     if args.half_sync:
         logger.info('Application starting at: %s, running in half sync mode.' %
                     datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
-        run(config, False, config_modified)
+        config_synced = run(config, False, config_modified) or config_synced
+
+    if args.reextract:
+        logger.info('Application starting at: %s, re-extracting information from the page archive.' %
+                    datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
+        run_reextract(config)
+
+    if config_synced:
+        DatabaseAPI.update_conflex_application('last_config_change', str(config['config_modified_time']))
 
-    # Disconnect from the database.
+    # Disconnect from the database and close the connections to Confluence.
     DatabaseAPI.disconnect()
+    ConfluenceAPI.teardown()
+    PageExtractor.teardown()
 
     logger.info('Application finished updating at: %s' %
                 datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'))
@@ -1,14 +1,23 @@
+import datetime
+import email.utils
 import json
 import logging
 import re
+import time
 
 import unicodedata
 
 import backoff
 import dateutil.parser
 
-from bs4 import BeautifulSoup, NavigableString
-from urllib import request, parse, error
+from bs4 import BeautifulSoup, FeatureNotFound, NavigableString, Tag
+from urllib import parse, error
+
+from confluence.archive import PageArchive
+from confluence.cache import ResponseCache
+from confluence.document import NodeView, PageDocument, parse_html
+from confluence.pool import ConnectionPool
+from confluence.ratelimit import AdaptiveRateLimiter
 
 logger = logging.getLogger(__name__)
 
@@ -20,14 +29,151 @@ class ConfluenceAPI(object):
     """
     empty_contents = ['', ',', '.', ' ']
     host = None
+    html_parser = 'html.parser'
+    offline = False
     __username = None
     __password = None
+    __pool = None
+    __cache = None
+    __archive = None
+    __limiter = None
+    __max_tries = 8
+    # The difference between the clock of the wiki server and the local clock, from the Date header of the responses.
+    __clock_skew = None
 
     @classmethod
-    def setup(cls, config):
+    def setup(cls, config, offline=False):
         cls.host = config['confluence']['host']
+        cls.offline = offline
         cls.__username = config['confluence']['username']
         cls.__password = config['confluence']['password']
+        cls.set_html_parser(config['confluence'].get('html_parser', 'html.parser'))
+        cls.teardown()
+        cls.__pool = ConnectionPool(cls.host, config['confluence'].get('pool_size', 4),
+                                    config['confluence'].get('timeout', 30))
+        cache = config['confluence'].get('cache')
+        if cache:
+            cls.__cache = ResponseCache(cache['path'], cache.get('max_size', 100 * 1024 * 1024))
+        archive = config['confluence'].get('archive')
+        if archive:
+            cls.__archive = PageArchive(archive['path'])
+        rate_limit = config['confluence'].get('rate_limit') or {}
+        cls.__limiter = AdaptiveRateLimiter(rate_limit.get('requests_per_second', 20),
+                                            rate_limit.get('max_concurrency', config['confluence'].get('pool_size', 4)),
+                                            rate_limit.get('min_requests_per_second', 0.5))
+        cls.__max_tries = rate_limit.get('max_tries', 8)
+        cls.__clock_skew = None
+
+    @classmethod
+    def set_html_parser(cls, html_parser):
+        """Sets the parser backend used by all of the extractors.
+
+        If the parser is not installed, the built in html.parser is used instead.
+
+        Args:
+            html_parser (str): The BeautifulSoup tree builder, i.e. html.parser, lxml or html5lib.
+
+        """
+        try:
+            BeautifulSoup('', html_parser)
+            cls.html_parser = html_parser
+        except FeatureNotFound:
+            logger.warning('set_html_parser: The html parser %s is not installed, using html.parser.' % html_parser)
+            cls.html_parser = 'html.parser'
+
+    @classmethod
+    def __parse(cls, content):
+        """Parses html content with the configured parser backend.
+
+        Args:
+            content (str): The content to parse.
+
+        Returns:
+            list: The top level nodes of the content, (not including the html and body elements that some parsers add).
+
+        """
+        if cls.html_parser == 'html.parser':
+            return parse_html(content, cls.html_parser).contents
+        # The other parsers drop the whitespace before the first node of a document (so a whitespace only section
+        # would have no nodes at all), which is kept inside an explicit body.
+        html = parse_html('<body>' + content + '</body>', cls.html_parser)
+        if html.body is None:
+            return html.contents
+        return html.body.contents
+
+    @classmethod
+    def teardown(cls):
+        """Closes all the connections that are kept alive to the Confluence host, the response cache and the archive."""
+        if cls.__pool is not None:
+            cls.__pool.close()
+        if cls.__cache is not None:
+            cls.__cache.close()
+            cls.__cache = None
+        if cls.__archive is not None:
+            cls.__archive.close()
+            cls.__archive = None
+
+    @classmethod
+    def __get(cls, path, cache_key=None):
+        """Makes a GET request on a pooled keep-alive connection and decodes the JSON response.
+
+        If the response cache is enabled, a conditional request is made for responses that have been cached before so
+        that unchanged responses are returned from the cache. All requests go through the shared rate limiter, and
+        requests that are throttled by the server (429/503) are retried once the limiter allows it.
+
+        Args:
+            path (str): The path (and query) of the resource, relative to the host.
+            cache_key (str): The key to cache the response under, (not cached if not provided).
+
+        Returns:
+            dict: The decoded response from the server.
+
+        """
+        cached = None
+        headers = {}
+        if cls.__cache is not None and cache_key is not None:
+            cached = cls.__cache.get(cache_key)
+            if cached is not None:
+                if cached[0]:
+                    headers['If-None-Match'] = cached[0]
+                if cached[1]:
+                    headers['If-Modified-Since'] = cached[1]
+
+        attempt = 0
+        while True:
+            attempt += 1
+            cls.__limiter.acquire()
+            start = time.monotonic()
+            status = None
+            retry_after = None
+            try:
+                status, response_headers, body = cls.__pool.get_response(path, headers)
+                break
+            except error.HTTPError as e:
+                status = e.code
+                retry_after = e.headers.get('Retry-After') if e.headers is not None else None
+                if e.code not in AdaptiveRateLimiter.throttle_codes or attempt >= cls.__max_tries:
+                    raise
+                logger.warning('get: Request throttled with HTTP %d, retrying.' % e.code)
+            finally:
+                cls.__limiter.release(time.monotonic() - start, status, retry_after)
+
+        date = response_headers.get('Date')
+        if date:
+            try:
+                cls.__clock_skew = email.utils.parsedate_to_datetime(date) - datetime.datetime.now(datetime.timezone.utc)
+            except (TypeError, ValueError):
+                pass
+
+        if status == 304 and cached is not None:
+            logger.debug('get: Response not modified: %s' % cache_key)
+            body = cached[2]
+        elif cls.__cache is not None and cache_key is not None and status == 200:
+            etag = response_headers.get('ETag')
+            last_modified = response_headers.get('Last-Modified')
+            if etag or last_modified:
+                cls.__cache.put(cache_key, etag, last_modified, body)
+        return json.loads(unicodedata.normalize("NFKD", body.decode('utf-8')))
 
     @classmethod
     @backoff.on_exception(backoff.expo, (error.URLError, error.ContentTooShortError, ConnectionResetError, ConnectionRefusedError, ConnectionAbortedError, ConnectionError), max_tries=8)
@@ -45,12 +191,15 @@ class ConfluenceAPI(object):
             dict: Returns the response from the server.
 
         """
+        if cls.offline:
+            logger.error('__make_rest_request: Unable to make request with id: %s while offline' % content_id)
+            return
         params = parse.urlencode(
             {**url_params, 'os_username': cls.__username, 'os_password': cls.__password})
-        url = cls.host + '/rest/api/' + api_endpoint + '/' + content_id + '?%s' % params
-        logger.debug('make_rest_request: URL requested : %s' % url)
+        path = '/rest/api/' + api_endpoint + '/' + content_id + '?%s' % params
+        logger.debug('make_rest_request: URL requested : %s' % cls.host + path)
         try:
-            return json.loads(unicodedata.normalize("NFKD", request.urlopen(url).read().decode('utf-8')))
+            return ConfluenceAPI.__get(path, ResponseCache.key('api', api_endpoint, content_id, url_params))
         except error.HTTPError as e:
             logger.error(e)
             return e
@@ -74,12 +223,23 @@ class ConfluenceAPI(object):
             dict: Returns the response from the server.
 
         """
+        key = ResponseCache.key('masterdetail', url_params)
+        if cls.offline:
+            body = cls.__archive.get_response(key) if cls.__archive is not None else None
+            if body is None:
+                logger.error('__make_master_detail_request: Master details are not archived for: %s' % url_params)
+                return
+            return json.loads(body.decode('utf-8'))
+
         params = parse.urlencode(
             {**url_params, 'os_username': cls.__username, 'os_password': cls.__password})
-        url = cls.host + '/rest/masterdetail/1.0/detailssummary/lines' + '?%s' % params
-        logger.debug('make_master_detail_request: URL requested: %s' % url)
+        path = '/rest/masterdetail/1.0/detailssummary/lines' + '?%s' % params
+        logger.debug('make_master_detail_request: URL requested: %s' % cls.host + path)
         try:
-            return json.loads(unicodedata.normalize("NFKD", request.urlopen(url).read().decode('utf-8')))
+            response = ConfluenceAPI.__get(path, key)
+            if cls.__archive is not None:
+                cls.__archive.put_response(key, json.dumps(response).encode('utf-8'))
+            return response
         except error.HTTPError as e:
             return e
         except:
@@ -93,24 +253,42 @@ class ConfluenceAPI(object):
         This method extracts all information beneath a heading.
 
         Args:
-            content (str): The content to extract the text from.
+            content (str|PageDocument): The content to extract the text from.
             heading (str): The heading to extract the information below.
 
         Returns:
             dict: The extracted text in the heading.
 
+        """
+        return ConfluenceAPI.__extract_headings_information(content, [heading])
+
+    @classmethod
+    def __extract_headings_information(cls, content, headings):
+        """Extracts all information beneath a number of headings.
+
+        All of the headings are found in a single pass over the content.
+
+        Args:
+            content (str|PageDocument): The content to extract the text from.
+            headings (list): The headings to extract the information below.
+
+        Returns:
+            dict: The extracted text in each heading.
+
         """
         logger.debug(
-            'extract_heading_information: Heading to extract information from: %s' % heading)
-        html = BeautifulSoup(content, 'html.parser')
-        heading_container = ''
-        try:
-            heading_container = str(
-                html.find(string=heading).parent.next_sibling)
-        except:
-            logger.warning(
-                '__extract_heading_information: The following heading does not exists for the content provided: %s' % heading)
-        return ConfluenceAPI.__handle_html_information(heading_container, heading)
+            'extract_headings_information: Headings to extract information from: %s' % ', '.join(headings))
+        sections = ConfluenceAPI.parse_content(content).find_sections(headings=headings)['headings']
+        information = {}
+        for heading in headings:
+            heading_container = ''
+            if heading in sections:
+                heading_container = sections[heading]
+            else:
+                logger.warning(
+                    '__extract_headings_information: The following heading does not exists for the content provided: %s' % heading)
+            information.update(ConfluenceAPI.__handle_html_information(heading_container, heading))
+        return information
 
     @classmethod
     def __extract_page_information(cls, content, page):
@@ -119,13 +297,13 @@ class ConfluenceAPI(object):
         This method extracts all the text information from a page.
 
         Args:
-            content (str): The content to extract the text from.
+            content (str|PageDocument): The content to extract the text from.
             page (str): The title of the page that the information was taken from.
         Returns:
             dict: The extracted text.
 
         """
-        return ConfluenceAPI.__handle_html_information(content, page)
+        return ConfluenceAPI.__handle_html_information(ConfluenceAPI.parse_content(content).content, page)
 
     @classmethod
     def __extract_page_properties_from_page(cls, content, label):
@@ -163,7 +341,7 @@ class ConfluenceAPI(object):
         if len(content['detailLines']) > 0:
             keys = []
             for k in content['renderedHeadings']:
-                keys.append(BeautifulSoup(k, 'html.parser').getText().strip())
+                keys.append(BeautifulSoup(k, cls.html_parser).getText().strip())
 
             values = []
 
@@ -227,24 +405,42 @@ class ConfluenceAPI(object):
         """Extracts panel information given some content.
 
         Args:
-            content (str): The content to abstract the panel information from.
+            content (str|PageDocument): The content to abstract the panel information from.
             panel (str): The panel identifier.
 
         Returns:
             dict: The extracted panel information
 
+        """
+        return ConfluenceAPI.__extract_panels_information(content, [panel])
+
+    @classmethod
+    def __extract_panels_information(cls, content, panels):
+        """Extracts the information of a number of panels given some content.
+
+        All of the panels are found in a single pass over the content.
+
+        Args:
+            content (str|PageDocument): The content to abstract the panel information from.
+            panels (list): The panel identifiers.
+
+        Returns:
+            dict: The extracted information of each panel.
+
         """
         logger.debug(
-            'extract_panel_information: Panel to extract information from: %s' % panel)
-        html = BeautifulSoup(content, 'html.parser')
-        panel_container = ''
-        try:
-            panel_container = str(
-                html.find('b', string=panel).parent.next_sibling)
-        except:
-            logger.warning(
-                '__extract_panel_information: The following panel does not exists for the content provided: %s' % panel)
-        return ConfluenceAPI.__handle_html_information(panel_container, panel)
+            'extract_panels_information: Panels to extract information from: %s' % ', '.join(panels))
+        sections = ConfluenceAPI.parse_content(content).find_sections(panels=panels)['panels']
+        information = {}
+        for panel in panels:
+            panel_container = ''
+            if panel in sections:
+                panel_container = sections[panel]
+            else:
+                logger.warning(
+                    '__extract_panels_information: The following panel does not exists for the content provided: %s' % panel)
+            information.update(ConfluenceAPI.__handle_html_information(panel_container, panel))
+        return information
 
     @classmethod
     def get_homepage_id_of_space(cls, space):
@@ -262,6 +458,26 @@ class ConfluenceAPI(object):
                      (space, int(response['_expandable']['homepage'].replace('/rest/api/content/', ''))))
         return int(response['_expandable']['homepage'].replace('/rest/api/content/', ''))
 
+    @classmethod
+    def get_server_time(cls):
+        """Gets the current time of the wiki server.
+
+        The time is taken from the Date header of the responses of the server, so it does not depend on the clock of
+        the machine running conflex. A request is made if no response has been received yet, and the local clock is
+        used if the server can not be reached.
+
+        Returns:
+            datetime.datetime: The time, in UTC.
+
+        """
+        if cls.__clock_skew is None and not cls.offline:
+            try:
+                cls.__get('/rest/api/space?%s' % parse.urlencode(
+                    {'limit': 1, 'os_username': cls.__username, 'os_password': cls.__password}))
+            except:
+                logger.warning('get_server_time: Unable to get the time of the server, using the local time.')
+        return datetime.datetime.now(datetime.timezone.utc) + (cls.__clock_skew or datetime.timedelta(0))
+
     @classmethod
     def get_last_update_time_of_content(cls, content_id):
         """Gets the last update time provided some content_id.
@@ -308,6 +524,37 @@ class ConfluenceAPI(object):
         """
         return ConfluenceAPI.__make_rest_request('content', str(content_id), {'expand': 'body.view'})['body']['view']['value']
 
+    @classmethod
+    def get_archived_page(cls, content_id, version=None):
+        """Gets a page from the local archive, without making a request.
+
+        Args:
+            content_id (int): The id of the page.
+            version (int): The version of the page, (the latest archived version if not provided).
+
+        Returns:
+            dict: The page record, as returned by get_child_pages, or None if the page is not archived.
+
+        """
+        if cls.__archive is None:
+            return None
+        return cls.__archive.get_page(content_id, version)
+
+    @classmethod
+    def parse_content(cls, content):
+        """Parses page content into a document that can be shared between the extractors.
+
+        Args:
+            content (str|PageDocument): The content of the page, (returned as is if it has already been parsed).
+
+        Returns:
+            PageDocument: The parsed document.
+
+        """
+        if isinstance(content, PageDocument):
+            return content
+        return PageDocument(content, cls.html_parser)
+
     @classmethod
     def get_panel(cls, content, panel, space_id):
         """Gets a panels information
@@ -315,7 +562,7 @@ class ConfluenceAPI(object):
         This method also performs cleanup on the Overview panel from the APPLCTN space.
 
         Args:
-            content (str): The content to search in.
+            content (str|PageDocument): The content to search in.
             panel (str): Name of the panel to retrieve information for.
             space_id (int): id of the space the information is coming from.
 
@@ -323,10 +570,28 @@ class ConfluenceAPI(object):
             dict: The information from the panel.
 
         """
-        panel_info = ConfluenceAPI.__extract_panel_information(content, panel)
-        if panel == 'Overview' and space_id == 65013279:
+        return ConfluenceAPI.get_panels(content, [panel], space_id)
+
+    @classmethod
+    def get_panels(cls, content, panels, space_id):
+        """Gets the information of a number of panels
+
+        The panels are all found in a single pass over the content. This method also performs cleanup on the Overview
+        panel from the APPLCTN space.
+
+        Args:
+            content (str|PageDocument): The content to search in.
+            panels (list): Names of the panels to retrieve information for.
+            space_id (int): id of the space the information is coming from.
+
+        Returns:
+            dict: The information from each panel.
+
+        """
+        panels_info = ConfluenceAPI.__extract_panels_information(content, panels)
+        if 'Overview' in panels_info and space_id == 65013279:
             overview = {'Overview': ['']}
-            for info in panel_info['Overview']:
+            for info in panels_info['Overview']:
                 if type(info) is str:
                     overview['Overview'][0] = overview['Overview'][0] + info
                 else:
@@ -334,29 +599,45 @@ class ConfluenceAPI(object):
             temp = overview['Overview'][0].split(
                 'The application is accessible from these locations')
             overview['Overview'][0] = temp[0]
-            return overview
-        return panel_info
+            panels_info.update(overview)
+        return panels_info
 
     @classmethod
     def get_heading(cls, content, heading):
         """Gets a heading information
 
         Args:
-            content (str): The content to search in.
+            content (str|PageDocument): The content to search in.
             heading (str): Name of the heading to retrieve information for.
 
         Returns:
             dict: The information from the heading.
 
         """
-        return ConfluenceAPI.__extract_heading_information(content, heading)
+        return ConfluenceAPI.get_headings(content, [heading])
+
+    @classmethod
+    def get_headings(cls, content, headings):
+        """Gets the information of a number of headings
+
+        The headings are all found in a single pass over the content.
+
+        Args:
+            content (str|PageDocument): The content to search in.
+            headings (list): Names of the headings to retrieve information for.
+
+        Returns:
+            dict: The information from each heading.
+
+        """
+        return ConfluenceAPI.__extract_headings_information(content, headings)
 
     @classmethod
     def get_page(cls, content, page_title):
         """Gets a whole pages information
 
         Args:
-            content (str): The content to search in.
+            content (str|PageDocument): The content to search in.
             page_title (str): The name of the page.
 
         Returns:
@@ -377,13 +658,19 @@ class ConfluenceAPI(object):
         Returns:
             dict: The page properties.
 
+        Raises:
+            ValueError: If the page properties could not be retrieved (or are not archived while offline).
+
         """
         cql = 'label in ('
         for label in labels[:-1]:
             cql += "'" + label + "',"
         cql += "'" + labels[-1] + "') "
         cql += 'AND id = ' + str(content_id)
-        return ConfluenceAPI.__extract_page_properties(ConfluenceAPI.__make_master_detail_request({'cql': cql, 'spaceKey': space_key}))
+        response = ConfluenceAPI.__make_master_detail_request({'cql': cql, 'spaceKey': space_key})
+        if not isinstance(response, dict):
+            raise ValueError('Unable to retrieve the page properties of page with id: %s' % str(content_id))
+        return ConfluenceAPI.__extract_page_properties(response)
 
     @classmethod
     def check_page_exists(cls, page_id):
@@ -399,19 +686,64 @@ class ConfluenceAPI(object):
                 return True
 
     @classmethod
-    def get_page_urls(cls, content_id, url_type):
+    def get_existing_page_ids(cls, page_ids, chunk_size=200):
+        """Checks which pages still exist on the wiki in batches.
+
+        This method makes a CQL search per chunk of page ids instead of a request per page. If a chunk can not be
+        checked then all of its pages are assumed to exist, like check_page_exists does for unknown errors.
+
+        Args:
+            page_ids (list): The ids of the pages to check.
+            chunk_size (int): The number of page ids to check in each CQL search.
+
+        Returns:
+            set: The ids of the pages that exist.
+
+        """
+        page_ids = list(page_ids)
+        existing = set()
+        for i in range(0, len(page_ids), chunk_size):
+            chunk = page_ids[i:i + chunk_size]
+            cql = 'id in (' + ','.join(str(page_id) for page_id in chunk) + ')'
+            # The results are paged on the `next` link, as the server may return fewer results per page than the limit
+            # asked for. If any page of the results can not be read, the whole chunk is assumed to exist.
+            page = 0
+            while True:
+                response = ConfluenceAPI.__make_rest_request('content', 'search',
+                                                             {'cql': cql, 'start': page, 'limit': chunk_size})
+                if type(response) is not dict:
+                    logger.info(
+                        "get_existing_page_ids: Unknown error for pages with ids: %s" % ', '.join(map(str, chunk)))
+                    existing.update(int(page_id) for page_id in chunk)
+                    break
+                page += response['size']
+                existing.update(int(result['id']) for result in response['results'])
+                if '_links' in response:
+                    more = 'next' in response['_links']
+                else:
+                    more = response['size'] >= response.get('limit', chunk_size)
+                if not more or response['size'] == 0:
+                    break
+        return existing
+
+    @classmethod
+    def get_page_urls(cls, content_id, url_type, links=None):
         """Gets page urls
 
         Args:
             content_id (int): The id of the content page to retrieve the urls for.
             url_type (str): The url type that the user has requested.
+            links (dict): The `_links` of the page (including `base`) if they are already known, i.e. from
+                get_child_pages, in which case no request is made.
 
         Returns:
             str: The page url.
 
         """
-        result = ConfluenceAPI.__make_rest_request(
-            'content', str(content_id), {})['_links']
+        result = links
+        if result is None:
+            result = ConfluenceAPI.__make_rest_request(
+                'content', str(content_id), {})['_links']
         return result['base'] + result[url_type]
 
     @classmethod
@@ -426,21 +758,177 @@ class ConfluenceAPI(object):
             list: A list of all the child ids of the parent page.
 
         """
-        page = 0
-        size = 25
         children_id = {}
-        while size == 25:
-            response = ConfluenceAPI.__make_rest_request('content', str(parent_id) + '/child/page',
-                                                         {'start': page, 'limit': 25, 'size': size,
-                                                          'expand': 'version'})
-            results = response['results']
-            size = response['size']
-            page += response['size']
-            for result in results:
-                children_id[int(result['id'])] = {
-                    'name': result['title'], 'last_updated': dateutil.parser.parse(result['version']['when'])}
+        for result, links in ConfluenceAPI.__paginate(str(parent_id) + '/child/page', {'expand': 'version'}):
+            children_id[int(result['id'])] = {
+                'name': result['title'], 'last_updated': dateutil.parser.parse(result['version']['when'])}
         return children_id
 
+    @classmethod
+    def get_child_pages(cls, parent_id, label=None, title=None):
+        """Gets the child pages given a parent page id, along with their labels, body and links.
+
+        Unlike get_child_page_ids, this method expands the labels and body of each child page in the listing so that
+        no further requests need to be made for each child page. If a label or title is given, the children are
+        filtered on the server with a CQL search so that only the matching child pages are returned.
+
+        Args:
+            parent_id (int): Id of the parent page to get the children of.
+            label (str): Only return the child pages with this label (if provided).
+            title (str): Only return the child pages with this title (if provided).
+
+        Returns:
+            dict: The child pages keyed by id, each with a name, last_updated, version, labels, content and links.
+
+        """
+        if label is not None or title is not None:
+            cql = 'type = page AND parent = ' + str(parent_id)
+            if label is not None:
+                cql += ' AND label = ' + ConfluenceAPI.__cql_string(label)
+            if title is not None:
+                cql += ' AND title = ' + ConfluenceAPI.__cql_string(title)
+            return ConfluenceAPI.search(cql)
+
+        children = {}
+        for result, links in ConfluenceAPI.__paginate(str(parent_id) + '/child/page',
+                                                      {'expand': 'version,metadata.labels,body.view'}):
+            children[int(result['id'])] = ConfluenceAPI.__page_record(result, links['base'])
+        return children
+
+    @classmethod
+    def get_page_record(cls, content_id):
+        """Gets a single page, in the same form as get_child_pages.
+
+        Args:
+            content_id (int): The id of the page.
+
+        Returns:
+            dict: The page record, with the ids of its ancestors, or None if the page does not exist.
+
+        """
+        response = ConfluenceAPI.__make_rest_request('content', str(content_id),
+                                                     {'expand': 'version,metadata.labels,body.view,ancestors'})
+        if type(response) is error.HTTPError and response.code == 404:
+            return None
+        if type(response) is not dict:
+            raise ValueError('Unable to get page with id: %s' % str(content_id))
+        return ConfluenceAPI.__page_record(response, response['_links']['base'])
+
+    @classmethod
+    def search(cls, cql, ancestors=False):
+        """Searches for pages using CQL.
+
+        Args:
+            cql (str): The CQL query, i.e. parent = 123 AND label = "application".
+            ancestors (bool): Whether to also return the ids of the ancestors of each page.
+
+        Returns:
+            dict: The matching pages keyed by id, each with a name, last_updated, version, labels, content and links.
+
+        """
+        logger.debug('search: CQL: %s' % cql)
+        expand = 'version,metadata.labels,body.view'
+        if ancestors:
+            expand += ',ancestors'
+        pages = {}
+        for result, links in ConfluenceAPI.__paginate('search', {'cql': cql, 'expand': expand}):
+            pages[int(result['id'])] = ConfluenceAPI.__page_record(result, links['base'])
+        return pages
+
+    @classmethod
+    def __paginate(cls, content_id, url_params, limit=25):
+        """Makes a paginated content request, following the pages of the results until there are none left.
+
+        The results are paged on the `next` link of each response, as the server may return fewer results per page than
+        the limit asked for (i.e. a search leaves out the results that the user can not see).
+
+        Args:
+            content_id (str): The content path to request, i.e. search.
+            url_params (dict): A dictionary of url params, without the start and limit.
+            limit (int): The number of results to ask for in each request.
+
+        Yields:
+            tuple: Each result, along with the `_links` of the response it was in.
+
+        """
+        start = 0
+        while True:
+            response = ConfluenceAPI.__make_rest_request('content', content_id,
+                                                         {**url_params, 'start': start, 'limit': limit})
+            if type(response) is not dict:
+                raise ValueError('Unable to get the results of: %s' % content_id)
+            for result in response['results']:
+                yield result, response['_links']
+            start += response['size']
+            if '_links' in response:
+                more = 'next' in response['_links']
+            else:
+                more = response['size'] >= response.get('limit', limit)
+            if not more or response['size'] == 0:
+                return
+
+    @classmethod
+    def get_pages_modified_since(cls, space, since, timezone=None):
+        """Gets the pages in a space that have been modified since a point in time.
+
+        CQL reads the time in the timezone of the wiki (to the minute), so the time is converted to it first. The time
+        is rounded down to the minute, so pages modified in the same minute are included.
+
+        Args:
+            space (str): The key of the space, i.e. APPLCTN.
+            since (datetime.datetime): The time to get the modifications since, a time without a timezone is taken to
+                be in the timezone of the wiki.
+            timezone (datetime.tzinfo): The timezone of the wiki, i.e. of the `version.when` times of its pages.
+
+        Returns:
+            dict: The modified pages keyed by id, each page also has its ancestors ids from the top of the space down.
+
+        """
+        if since.tzinfo is not None and timezone is not None:
+            since = since.astimezone(timezone)
+        cql = 'type = page AND space = ' + ConfluenceAPI.__cql_string(space)
+        cql += ' AND lastmodified >= ' + ConfluenceAPI.__cql_string(since.strftime('%Y/%m/%d %H:%M'))
+        return ConfluenceAPI.search(cql, True)
+
+    @classmethod
+    def __cql_string(cls, value):
+        """Quotes a value for use in a CQL query.
+
+        Args:
+            value (str): The value to quote.
+
+        Returns:
+            str: The quoted value.
+
+        """
+        return '"' + str(value).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+    @classmethod
+    def __page_record(cls, result, base):
+        """Turns a page returned with expanded version, labels and body into a page record.
+
+        The record is also stored in the page archive, if one is configured.
+
+        Args:
+            result (dict): The page as returned by the Confluence API.
+            base (str): The base url of the wiki, as given in the `_links` of the response.
+
+        Returns:
+            dict: The name, last_updated, version, labels, content and links (and ancestors if expanded) of the page.
+
+        """
+        record = {'name': result['title'],
+                  'last_updated': dateutil.parser.parse(result['version']['when']),
+                  'version': result['version']['number'],
+                  'labels': [label['name'] for label in result['metadata']['labels']['results']],
+                  'content': result['body']['view']['value'],
+                  'links': {**result['_links'], 'base': base}}
+        if 'ancestors' in result:
+            record['ancestors'] = [int(ancestor['id']) for ancestor in result['ancestors']]
+        if cls.__archive is not None:
+            cls.__archive.put_page(int(result['id']), record)
+        return record
+
     @classmethod
     def __handle_html_information(cls, content, content_name):
         """Handles html information
@@ -448,7 +936,8 @@ class ConfluenceAPI(object):
         This method will handle the HTML input, returning it as a dictionary.
 
         Args:
-            content (str): The content to turn into a usable dictionary.
+            content (str|PageElement): The content to turn into a usable dictionary, either as a string or a node of
+                an already parsed document.
             content_name (str): The name/heading/label associated with the content.
 
         Returns:
@@ -461,50 +950,75 @@ class ConfluenceAPI(object):
     def __recursive_html_handler(cls, content):
         """Handles html information
 
-        This method will handle the HTML input, returning it as a dictionary.
+        This method will handle the HTML input, returning it as a dictionary. A node of an already parsed document is
+        handled in place, as if it had been turned back into a string and handled on its own.
 
         Args:
-            content (str): The content to turn into a usable dictionary.
+            content (str|PageElement): The content to turn into a usable dictionary.
 
         Returns:
             list: A list dictionary that contains the content only (no HTML).
 
         """
+        if isinstance(content, Tag):
+            return ConfluenceAPI.__recursive_node_handler([content], NodeView(True))
+        if content is None or isinstance(content, NavigableString):
+            content = str(content)
+
         # Remove all newline characters and remove all spaces between two tags.
         content = re.sub('>+\s+<', '><', content.replace('\n', ''))
+        return ConfluenceAPI.__recursive_node_handler(ConfluenceAPI.__parse(content), NodeView(False))
+
+    @classmethod
+    def __recursive_node_handler(cls, nodes, view):
+        """Handles html information
+
+        This method will handle the HTML nodes, returning them as a dictionary. Nested tables, lists and heading
+        sections are handled in place rather than being turned back into a string and parsed again.
+
+        Args:
+            nodes (list): The top level nodes of the content to turn into a usable dictionary.
+            view (NodeView): The view to see the nodes through.
+
+        Returns:
+            list: A list dictionary that contains the content only (no HTML).
+
+        """
         heading = ['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'h7']
         supported_tags = ['p', 'span', 'h1', 'h2', 'h3',
                           'h4', 'h5', 'h6', 'h7', 'a', 'ul', 'table']
         content_list = []
-        html = BeautifulSoup(content, 'html.parser')
+        nested_view = NodeView(True)
 
         # Go down the hierarchy until we are at a non-div element.
-        contents = html
-        if contents.contents:
-            while contents.contents[0].name == 'div':
-                contents = contents.contents[0]
+        contents = nodes
+        if contents:
+            while contents[0].name == 'div':
+                contents = view.children(contents[0])
 
         # Look at each of the provided html's children tags and handle data for different cases.
-        for tag in contents.children:
+        for i, tag in enumerate(contents):
             # Check if previous sibling was a heading.
-            if tag.previous_sibling:
-                if tag.previous_sibling.name in heading:
+            if i > 0 and contents[i - 1]:
+                if contents[i - 1].name in heading:
                     continue
 
             # Making sure we are at the lowest element in the current tag.
+            next_sibling = contents[i + 1] if i + 1 < len(contents) else None
             while tag.name == 'div':
-                tag = tag.contents[0]
+                tag = view.children(tag)[0]
+                next_sibling = view.next_sibling(tag)
 
             if tag.name == 'ul':
                 # List handling
-                for child in tag.children:
-                    child_to_insert = child.getText().strip()
+                for child in view.children(tag):
+                    child_to_insert = view.text(child).strip()
                     if child.find('table', recursive=False):
-                        child_to_insert = ConfluenceAPI.__recursive_html_handler(
-                            str(child.find('table', recursive=False)))
+                        child_to_insert = ConfluenceAPI.__recursive_node_handler(
+                            [child.find('table', recursive=False)], nested_view)
                     if child.find('ul', recursive=False):
-                        child_to_insert = ConfluenceAPI.__recursive_html_handler(
-                            str(child.find('ul', recursive=False)))
+                        child_to_insert = ConfluenceAPI.__recursive_node_handler(
+                            [child.find('ul', recursive=False)], nested_view)
                     if child_to_insert not in ConfluenceAPI.empty_contents:
                         content_list.append(child_to_insert)
 
@@ -514,28 +1028,28 @@ class ConfluenceAPI(object):
                 horizontal_headings = []
                 vertical_heading = None
                 table_dict = {}
-                for row in table.children:
+                for row in view.children(table):
                     # noinspection PyBroadException
                     try:
                         current_column = 0
                         headings_only_row = not row.find('td')
-                        for data in row.children:
+                        for data in view.children(row):
                             if headings_only_row:
                                 horizontal_headings.append(
-                                    data.getText().strip())
+                                    view.text(data).strip())
                             else:
                                 # Data could be a heading or actual data depending on layout of
                                 # table.
                                 if data.name == 'th':
-                                    vertical_heading = data.getText().strip()
+                                    vertical_heading = view.text(data).strip()
                                 else:
-                                    data_to_insert = data.getText().strip()
+                                    data_to_insert = view.text(data).strip()
                                     if data.find('table', recursive=False):
-                                        data_to_insert = ConfluenceAPI.__recursive_html_handler(
-                                            str(data.find('table', recursive=False)))
+                                        data_to_insert = ConfluenceAPI.__recursive_node_handler(
+                                            [data.find('table', recursive=False)], nested_view)
                                     if data.find('ul', recursive=False):
-                                        data_to_insert = ConfluenceAPI.__recursive_html_handler(
-                                            str(data.find('ul', recursive=False)))
+                                        data_to_insert = ConfluenceAPI.__recursive_node_handler(
+                                            [data.find('ul', recursive=False)], nested_view)
 
                                     if data_to_insert not in ConfluenceAPI.empty_contents:
                                         if len(horizontal_headings) == 0 and vertical_heading is None:
@@ -569,36 +1083,36 @@ class ConfluenceAPI(object):
                             current_column += 1
                     except:
                         logger.error(
-                            'recursive_html_handler: Unable to parse table: %s', tag.getText().strip())
+                            'recursive_html_handler: Unable to parse table: %s', view.text(tag).strip())
                 if table_dict != {}:
                     content_list.append(table_dict)
             elif tag.name in heading:
-                heading_to_insert = tag.getText().strip()
-                heading_content = ConfluenceAPI.__recursive_html_handler(
-                    str(tag.next_sibling))
+                heading_to_insert = view.text(tag).strip()
+                heading_content = ConfluenceAPI.__recursive_html_handler(next_sibling)
                 content_list.append({heading_to_insert: heading_content})
             elif tag.name in supported_tags:
-                information_to_insert = tag.getText().strip()
+                information_to_insert = view.text(tag).strip()
                 if tag.find('table', recursive=False):
-                    information_to_insert = ConfluenceAPI.__recursive_html_handler(
-                        str(tag.find('table', recursive=False)))
+                    information_to_insert = ConfluenceAPI.__recursive_node_handler(
+                        [tag.find('table', recursive=False)], nested_view)
                 if tag.find('ul', recursive=False):
-                    information_to_insert = ConfluenceAPI.__recursive_html_handler(
-                        str(tag.find('ul', recursive=False)))
+                    information_to_insert = ConfluenceAPI.__recursive_node_handler(
+                        [tag.find('ul', recursive=False)], nested_view)
                 # Content does not contain any lists, tables or links to a user so just return the information.
                 if tag.find('a', class_='user-mention') or 'data-username' in tag.attrs:
                     if tag.find('a', class_='user-mention'):
                         for user in tag.find_all('a', class_='user-mention'):
-                            if user.string is not None and 'data-username' in user.attrs:
-                                content_list.append(user.string + " (" + user.attrs['data-username'] + ")")
+                            if view.string(user) is not None and 'data-username' in user.attrs:
+                                content_list.append(
+                                    view.string(user) + " (" + view.attribute(user, 'data-username') + ")")
                     else:
                         content_list.append(
-                            tag.string + " (" + tag.attrs['data-username'] + ")")
+                            view.string(tag) + " (" + view.attribute(tag, 'data-username') + ")")
                 else:
                     if information_to_insert not in ConfluenceAPI.empty_contents:
                         content_list.append(information_to_insert)
 
             elif type(tag) is NavigableString:
-                content_list.append(str(tag.string).strip())
+                content_list.append(view.string(tag).strip())
 
         return content_list
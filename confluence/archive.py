@@ -0,0 +1,133 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import zlib
+
+import dateutil.parser
+
+logger = logging.getLogger(__name__)
+
+
+class PageArchive(object):
+    """Local archive of fetched pages.
+
+    This class keeps the body of every page version that has been fetched, along with the rest of its page record, and
+    the master detail (page properties) responses, so that the information of the pages can be extracted again without
+    making any requests to Confluence. Bodies are stored compressed and content addressed, so a body that is fetched
+    more than once (i.e. a page whose version changed without changing its content) is only stored once. The archive is
+    safe to share between threads.
+    """
+
+    def __init__(self, path):
+        """Opens (or creates) a page archive.
+
+        Args:
+            path (str): The location of the archive file.
+
+        """
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS `objects` (`digest` TEXT PRIMARY KEY, "
+                                  "`body` BLOB NOT NULL)")
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS `pages` (`page_id` INTEGER NOT NULL, "
+                                  "`version` INTEGER NOT NULL, `record` TEXT NOT NULL, `digest` TEXT NOT NULL, "
+                                  "PRIMARY KEY (`page_id`, `version`))")
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS `responses` (`key` TEXT PRIMARY KEY, "
+                                  "`digest` TEXT NOT NULL)")
+        self.__connection.commit()
+
+    def __put_object(self, body):
+        """Stores a body under the digest of its content (must be called while holding the lock).
+
+        Returns:
+            str: The digest of the body.
+
+        """
+        digest = hashlib.sha1(body).hexdigest()
+        self.__connection.execute("INSERT OR IGNORE INTO `objects` (`digest`, `body`) VALUES (?, ?)",
+                                  (digest, zlib.compress(body)))
+        return digest
+
+    def __get_object(self, digest):
+        row = self.__connection.execute("SELECT `body` FROM `objects` WHERE `digest`=?", (digest,)).fetchone()
+        return zlib.decompress(row[0]) if row is not None else None
+
+    def put_page(self, page_id, record):
+        """Stores a version of a page.
+
+        Args:
+            page_id (int): The id of the page.
+            record (dict): The page record, as returned by ConfluenceAPI.get_child_pages.
+
+        """
+        metadata = {k: v for k, v in record.items() if k != 'content'}
+        metadata['last_updated'] = record['last_updated'].isoformat()
+        with self.__lock:
+            digest = self.__put_object(record['content'].encode('utf-8'))
+            self.__connection.execute("REPLACE INTO `pages` (`page_id`, `version`, `record`, `digest`) "
+                                      "VALUES (?, ?, ?, ?)",
+                                      (page_id, record['version'], json.dumps(metadata), digest))
+            self.__connection.commit()
+
+    def get_page(self, page_id, version=None):
+        """Gets an archived version of a page.
+
+        Args:
+            page_id (int): The id of the page.
+            version (int): The version of the page, (the latest archived version if not provided).
+
+        Returns:
+            dict: The page record, or None if the page (version) is not archived.
+
+        """
+        with self.__lock:
+            if version is None:
+                row = self.__connection.execute("SELECT `record`, `digest` FROM `pages` WHERE `page_id`=? "
+                                                "ORDER BY `version` DESC LIMIT 1", (page_id,)).fetchone()
+            else:
+                row = self.__connection.execute("SELECT `record`, `digest` FROM `pages` WHERE `page_id`=? "
+                                                "AND `version`=?", (page_id, version)).fetchone()
+            if row is None:
+                return None
+            body = self.__get_object(row[1])
+        if body is None:
+            logger.warning('PageArchive: The body of page %s is missing from the archive.' % str(page_id))
+            return None
+        record = json.loads(row[0])
+        record['last_updated'] = dateutil.parser.parse(record['last_updated'])
+        record['content'] = body.decode('utf-8')
+        return record
+
+    def put_response(self, key, body):
+        """Stores a response.
+
+        Args:
+            key (str): The key of the request, i.e. from ResponseCache.key.
+            body (bytes): The body of the response.
+
+        """
+        with self.__lock:
+            digest = self.__put_object(body)
+            self.__connection.execute("REPLACE INTO `responses` (`key`, `digest`) VALUES (?, ?)", (key, digest))
+            self.__connection.commit()
+
+    def get_response(self, key):
+        """Gets an archived response.
+
+        Args:
+            key (str): The key of the request.
+
+        Returns:
+            bytes: The body of the response, or None if it is not archived.
+
+        """
+        with self.__lock:
+            row = self.__connection.execute("SELECT `digest` FROM `responses` WHERE `key`=?", (key,)).fetchone()
+            return self.__get_object(row[0]) if row is not None else None
+
+    def close(self):
+        """Closes the archive file."""
+        with self.__lock:
+            self.__connection.close()
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache(object):
+    """Persistent HTTP response cache.
+
+    This class stores responses on disk along with their ETag and Last-Modified validators so that they can be
+    revalidated with a conditional request on later runs. The cache is bounded in size, evicting the least recently used
+    responses first. The cache is safe to share between threads.
+    """
+
+    def __init__(self, path, max_size=100 * 1024 * 1024):
+        """Opens (or creates) a response cache.
+
+        Args:
+            path (str): The location of the cache file.
+            max_size (int): The maximum size in bytes of the (compressed) responses kept in the cache.
+
+        """
+        self.max_size = max_size
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute("CREATE TABLE IF NOT EXISTS `responses` (`key` TEXT PRIMARY KEY, `etag` TEXT, "
+                                  "`last_modified` TEXT, `body` BLOB NOT NULL, `size` INTEGER NOT NULL, "
+                                  "`last_access` REAL NOT NULL)")
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS `last_access__index` ON `responses` (`last_access`)")
+        self.__connection.commit()
+        self.__size = self.__connection.execute("SELECT COALESCE(SUM(`size`), 0) FROM `responses`").fetchone()[0]
+
+    @staticmethod
+    def key(*args):
+        """Creates a cache key.
+
+        Args:
+            *args: JSON serialisable parts of the request, i.e. the endpoint, content id and url params.
+
+        Returns:
+            str: The cache key.
+
+        """
+        return hashlib.sha1(json.dumps(args, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Gets a cached response.
+
+        Args:
+            key (str): The cache key of the request.
+
+        Returns:
+            tuple: The ETag (str), Last-Modified (str) and body (bytes) of the response, or None if it is not cached.
+
+        """
+        with self.__lock:
+            row = self.__connection.execute("SELECT `etag`, `last_modified`, `body` FROM `responses` WHERE `key`=?",
+                                            (key,)).fetchone()
+            if row is None:
+                return None
+            self.__connection.execute("UPDATE `responses` SET `last_access`=? WHERE `key`=?", (time.time(), key))
+            self.__connection.commit()
+            return row[0], row[1], zlib.decompress(row[2])
+
+    def put(self, key, etag, last_modified, body):
+        """Stores a response, evicting the least recently used responses if the cache is full.
+
+        Args:
+            key (str): The cache key of the request.
+            etag (str): The ETag header of the response.
+            last_modified (str): The Last-Modified header of the response.
+            body (bytes): The body of the response.
+
+        """
+        compressed = zlib.compress(body)
+        if len(compressed) > self.max_size:
+            return
+        with self.__lock:
+            row = self.__connection.execute("SELECT `size` FROM `responses` WHERE `key`=?", (key,)).fetchone()
+            if row is not None:
+                self.__size -= row[0]
+            self.__connection.execute("REPLACE INTO `responses` (`key`, `etag`, `last_modified`, `body`, `size`, "
+                                      "`last_access`) VALUES (?, ?, ?, ?, ?, ?)",
+                                      (key, etag, last_modified, compressed, len(compressed), time.time()))
+            self.__size += len(compressed)
+
+            while self.__size > self.max_size:
+                oldest = self.__connection.execute("SELECT `key`, `size` FROM `responses` WHERE `key`!=? "
+                                                   "ORDER BY `last_access` LIMIT 1", (key,)).fetchone()
+                if oldest is None:
+                    break
+                self.__connection.execute("DELETE FROM `responses` WHERE `key`=?", (oldest[0],))
+                self.__size -= oldest[1]
+                logger.debug('ResponseCache: Evicted response: %s' % oldest[0])
+            self.__connection.commit()
+
+    def close(self):
+        """Closes the cache file."""
+        with self.__lock:
+            self.__connection.close()
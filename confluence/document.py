@@ -0,0 +1,180 @@
+from bs4 import BeautifulSoup, NavigableString
+
+
+# The characters that the whitespace only strings are made of, i.e. BeautifulSoup.ASCII_SPACES.
+_ASCII_SPACES = dict.fromkeys(map(ord, '\x20\x0a\x09\x0c\x0d'))
+
+
+def parse_html(content, parser='html.parser'):
+    """Parses html content, collapsing the whitespace only strings the same way with every parser backend.
+
+    html.parser and lxml turn a string of whitespace between tags into a single newline (if it has one) or space, but
+    html5lib keeps it as it is, so its strings are collapsed here (except inside the tags that preserve whitespace).
+
+    Args:
+        content (str): The content to parse.
+        parser (str): The BeautifulSoup tree builder to parse the content with.
+
+    Returns:
+        BeautifulSoup: The parsed content.
+
+    """
+    html = BeautifulSoup(content, parser)
+    if parser == 'html5lib':
+        for string in html.find_all(string=True):
+            if type(string) is NavigableString and string not in ('\n', ' ') and \
+                    not string.translate(_ASCII_SPACES) and string.find_parent(['pre', 'textarea']) is None:
+                string.replace_with('\n' if '\n' in string else ' ')
+    return html
+
+
+class PageDocument(object):
+    """Parsed page document.
+
+    This class holds the content of a page along with its parsed HTML, so that the page is only parsed once no matter
+    how many panels, headings or other information are extracted from it.
+    """
+
+    def __init__(self, content, parser='html.parser'):
+        """Creates a document from the content of a page.
+
+        Args:
+            content (str): The HTML content of the page, i.e. the 'body.view' value.
+            parser (str): The BeautifulSoup tree builder to parse the content with.
+
+        """
+        self.content = content
+        self.parser = parser
+        self.__html = None
+        self.__sections = {'panels': {}, 'headings': {}}
+        self.__searched = {'panels': set(), 'headings': set()}
+
+    @property
+    def html(self):
+        """BeautifulSoup: The parsed content, which is parsed the first time it is used."""
+        if self.__html is None:
+            self.__html = parse_html(self.content, self.parser)
+        return self.__html
+
+    def find_sections(self, panels=(), headings=()):
+        """Finds the sections below a number of panel and heading titles in a single pass over the document.
+
+        A panel title is the first <b> tag whose string is the title and a heading title is the first string that is
+        equal to the heading, the section is the node following the parent of the title. The sections found are kept,
+        so the document is only searched again for titles that have not been searched for before.
+
+        Args:
+            panels (list): The panel titles to find.
+            headings (list): The heading titles to find.
+
+        Returns:
+            dict: The 'panels' and 'headings' sections found, by title. Titles that are not in the document are left
+                out, and the section of a title without a following node is None.
+
+        """
+        wanted_panels = set(panels) - self.__searched['panels']
+        wanted_headings = set(headings) - self.__searched['headings']
+        self.__searched['panels'].update(wanted_panels)
+        self.__searched['headings'].update(wanted_headings)
+
+        for node in self.html.descendants:
+            if not wanted_panels and not wanted_headings:
+                break
+            if isinstance(node, NavigableString):
+                if node in wanted_headings:
+                    wanted_headings.remove(node)
+                    self.__sections['headings'][str(node)] = node.parent.next_sibling
+            elif node.name == 'b' and node.string in wanted_panels:
+                wanted_panels.remove(node.string)
+                self.__sections['panels'][str(node.string)] = node.parent.next_sibling
+
+        return {'panels': {panel: self.__sections['panels'][panel] for panel in panels
+                           if panel in self.__sections['panels']},
+                'headings': {heading: self.__sections['headings'][heading] for heading in headings
+                             if heading in self.__sections['headings']}}
+
+
+class NodeView(object):
+    """A view over the nodes of a parsed document.
+
+    The string based html handling removed all newline characters and the whitespace between tags before parsing each
+    nested table, list or heading section again. This class gives the same view of the existing nodes without
+    serialising and parsing them again, by skipping the whitespace only strings between tags and removing newline
+    characters from the text when normalise is set. Without normalise the nodes are seen as they are.
+    """
+
+    def __init__(self, normalise):
+        """Creates a view.
+
+        Args:
+            normalise (bool): Whether to remove newline characters and the whitespace only strings between tags.
+
+        """
+        self.normalise = normalise
+
+    @staticmethod
+    def __ignored(node):
+        return type(node) is NavigableString and node.isspace()
+
+    def children(self, node):
+        """Gets the children of a node.
+
+        Returns:
+            list: The child nodes.
+
+        """
+        if not self.normalise:
+            return node.contents
+        return [child for child in node.children if not NodeView.__ignored(child)]
+
+    def next_sibling(self, node):
+        """Gets the next sibling of a node.
+
+        Returns:
+            PageElement: The next sibling, or None if it is the last child.
+
+        """
+        if not self.normalise:
+            return node.next_sibling
+        sibling = node.next_sibling
+        while sibling is not None and NodeView.__ignored(sibling):
+            sibling = sibling.next_sibling
+        return sibling
+
+    def text(self, node):
+        """Gets all of the text of a node, i.e. Tag.getText.
+
+        Returns:
+            str: The text.
+
+        """
+        if not self.normalise:
+            return node.getText()
+        return ''.join(string for string in node.strings if not NodeView.__ignored(string)).replace('\n', '')
+
+    def string(self, node):
+        """Gets the single string of a node, i.e. Tag.string.
+
+        Returns:
+            str: The string, or None if the node does not contain exactly one string.
+
+        """
+        if not self.normalise:
+            return node.string
+        if isinstance(node, NavigableString):
+            return str(node).replace('\n', '')
+        children = self.children(node)
+        if len(children) != 1:
+            return None
+        return self.string(children[0])
+
+    def attribute(self, node, name):
+        """Gets an attribute value of a node.
+
+        Returns:
+            str: The attribute value.
+
+        """
+        if not self.normalise:
+            return node.attrs[name]
+        return node.attrs[name].replace('\n', '')
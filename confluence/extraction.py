@@ -0,0 +1,158 @@
+import hashlib
+import json
+import logging
+import multiprocessing
+import re
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from flatdict import FlatDict
+
+from confluence.api import ConfluenceAPI
+
+logger = logging.getLogger(__name__)
+
+# The page information retrieval types that are extracted from the page content alone.
+content_information_types = ['panels', 'headings', 'page']
+
+
+def flatten_information(information):
+    """Flattens extracted information into key value rows.
+
+    Args:
+        information (dict): The information extracted from a page, i.e. from ConfluenceAPI.get_panel.
+
+    Returns:
+        list: A (key, value) tuple for each value.
+    """
+    rows = []
+    for k, v in FlatDict(information).items():
+        # For each key remove list numbers.
+        # i.e. FlatDict will put in :0, :1: for each list element.
+        k = re.sub(':(\\d+)', '', k)
+        k = re.sub(':(\\d+):', ':', k)
+        rows.append((k, v))
+    return rows
+
+
+def page_digest(content, page_title, node_config, labels=()):
+    """Computes a digest of everything that the information extracted from a page depends on.
+
+    Args:
+        content (str): The content of the page.
+        page_title (str): The title of the page.
+        node_config (dict): The configuration of the information to retrieve from the page, the configuration of any
+            child pages is left out as it does not change the information of this page.
+        labels (list): The labels of the page, the page properties are only retrieved for pages with the configured
+            labels.
+
+    Returns:
+        str: The hex digest.
+    """
+    node_config = {k: v for k, v in node_config.items() if k != 'pages'}
+    payload = json.dumps([content, page_title, ConfluenceAPI.html_parser, node_config, sorted(labels)],
+                         sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def extract_page_rows(content, plan, space_id, page_title):
+    """Extracts the information from a page as flattened rows.
+
+    This function is run in the extraction worker processes, so it only takes and returns plain data.
+
+    Args:
+        content (str): The content of the page.
+        plan (list): A (page_info_type, identifiers) tuple for each type of information to extract, where the
+            identifiers are the panel or heading names.
+        space_id (int): The top level space_id that the information relates to.
+        page_title (str): The title of the page.
+
+    Returns:
+        dict: The (key, value) rows for each page_info_type, or None for a type that could not be extracted.
+    """
+    document = ConfluenceAPI.parse_content(content)
+    try:
+        # Find the sections of all of the panels and headings in one pass over the page.
+        document.find_sections(panels=[panel for page_info_type, identifiers in plan if page_info_type == 'panels'
+                                       for panel in identifiers],
+                               headings=[heading for page_info_type, identifiers in plan
+                                         if page_info_type == 'headings' for heading in identifiers])
+    except:
+        logger.warning('extract_page_rows: Unable to find the sections of page: %s' % page_title)
+    extracted = {}
+    for page_info_type, identifiers in plan:
+        try:
+            rows = []
+            if page_info_type == 'panels':
+                rows += flatten_information(ConfluenceAPI.get_panels(document, identifiers, space_id))
+            elif page_info_type == 'headings':
+                rows += flatten_information(ConfluenceAPI.get_headings(document, identifiers))
+            elif page_info_type == 'page':
+                rows += flatten_information(ConfluenceAPI.get_page(document, page_title))
+            extracted[page_info_type] = rows
+        except:
+            logger.error('extract_page_rows: Error extracting %s for page: %s' % (page_info_type, page_title))
+            extracted[page_info_type] = None
+    return extracted
+
+
+class PageExtractor(object):
+    """Page Extractor Class
+
+    This class runs the CPU bound extraction of page information in a pool of worker processes, so that it is not
+    limited by the GIL of the crawling process. With no workers configured, or if the pool can not be used, the
+    extraction is run in series in the calling thread.
+    """
+    __executor = None
+
+    @classmethod
+    def setup(cls, config):
+        """Starts the extraction worker processes.
+
+        The workers are started from a fork server (or spawned, where there is no fork server) rather than forked from
+        the crawling process, whose threads may hold locks at the time of the fork. They are all started here, so that
+        a failure to start them shows up straight away rather than on the first page.
+        """
+        cls.teardown()
+        workers = config.get('sync', {}).get('extraction_workers', 0)
+        if workers:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            try:
+                cls.__executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context(method),
+                                                     initializer=ConfluenceAPI.set_html_parser,
+                                                     initargs=(ConfluenceAPI.html_parser,))
+                for future in [cls.__executor.submit(int) for _ in range(workers)]:
+                    future.result()
+            except (OSError, NotImplementedError, BrokenProcessPool):
+                logger.warning('setup: Unable to start extraction worker processes, extracting in series.')
+                cls.teardown()
+
+    @classmethod
+    def teardown(cls):
+        """Stops the extraction worker processes."""
+        if cls.__executor is not None:
+            cls.__executor.shutdown()
+            cls.__executor = None
+
+    @classmethod
+    def extract(cls, content, plan, space_id, page_title):
+        """Extracts the information from a page as flattened rows.
+
+        Args:
+            content (str): The content of the page.
+            plan (list): A (page_info_type, identifiers) tuple for each type of information to extract.
+            space_id (int): The top level space_id that the information relates to.
+            page_title (str): The title of the page.
+
+        Returns:
+            dict: The (key, value) rows for each page_info_type, or None for a type that could not be extracted.
+        """
+        executor = cls.__executor
+        if executor is not None:
+            try:
+                return executor.submit(extract_page_rows, content, plan, space_id, page_title).result()
+            except BrokenProcessPool:
+                logger.warning('extract: The extraction worker processes stopped, extracting in series.')
+                cls.__executor = None
+        return extract_page_rows(content, plan, space_id, page_title)
@@ -0,0 +1,117 @@
+import http.client
+import logging
+import threading
+
+from urllib import parse, error
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP connection pool.
+
+    This class keeps a number of persistent HTTP(S) connections open to a single host so that consecutive requests do
+    not need to perform a new TCP connection and TLS handshake each time. The pool is safe to share between threads.
+    """
+
+    def __init__(self, host, size=4, timeout=30):
+        """Creates a pool of connections to a host.
+
+        Args:
+            host (str): The host url, i.e. https://wiki.auckland.ac.nz (a path prefix is allowed).
+            size (int): The maximum number of connections that are open at the same time.
+            timeout (float): The socket timeout in seconds for each connection.
+
+        """
+        url = parse.urlsplit(host)
+        self.scheme = url.scheme
+        self.netloc = url.netloc
+        self.base_path = url.path.rstrip('/')
+        self.size = size
+        self.timeout = timeout
+        self.__idle = []
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(size)
+
+    def __new_connection(self):
+        """Opens a new connection to the host.
+
+        Returns:
+            http.client.HTTPConnection: A new connection.
+
+        """
+        logger.debug('ConnectionPool: Opening new connection to: %s' % self.netloc)
+        if self.scheme == 'https':
+            return http.client.HTTPSConnection(self.netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(self.netloc, timeout=self.timeout)
+
+    def __checkout(self):
+        with self.__lock:
+            if self.__idle:
+                return self.__idle.pop()
+        return self.__new_connection()
+
+    def __checkin(self, connection):
+        with self.__lock:
+            self.__idle.append(connection)
+
+    def request(self, path, headers=None):
+        """Makes a GET request using one of the pooled connections.
+
+        If a kept-alive connection has been closed by the server in the meantime, the request is retried once on a new
+        connection.
+
+        Args:
+            path (str): The path (and query) of the resource, relative to the host.
+            headers (dict): Any additional request headers.
+
+        Returns:
+            tuple: The response status (int), headers (http.client.HTTPMessage) and body (bytes).
+
+        """
+        with self.__slots:
+            for attempt in range(2):
+                connection = self.__checkout()
+                try:
+                    connection.request('GET', self.base_path + path, headers=headers or {})
+                    response = connection.getresponse()
+                    body = response.read()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The server may have closed an idle keep-alive connection, retry once on a fresh one.
+                    connection.close()
+                    if attempt == 0:
+                        continue
+                    raise
+                except Exception:
+                    connection.close()
+                    raise
+
+                if response.will_close:
+                    connection.close()
+                else:
+                    self.__checkin(connection)
+                return response.status, response.headers, body
+
+    def get_response(self, path, headers=None):
+        """Makes a GET request, raising an HTTPError for error responses like urllib.request.urlopen does.
+
+        Args:
+            path (str): The path (and query) of the resource, relative to the host.
+            headers (dict): Any additional request headers.
+
+        Returns:
+            tuple: The response status (int), headers (http.client.HTTPMessage) and body (bytes).
+
+        """
+        status, response_headers, body = self.request(path, headers)
+        if status >= 400:
+            raise error.HTTPError(self.scheme + '://' + self.netloc + self.base_path + path, status,
+                                  http.client.responses.get(status, ''), response_headers, None)
+        return status, response_headers, body
+
+    def close(self):
+        """Closes all idle connections."""
+        with self.__lock:
+            for connection in self.__idle:
+                connection.close()
+            self.__idle = []
@@ -0,0 +1,127 @@
+import datetime
+import email.utils
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AdaptiveRateLimiter(object):
+    """Adaptive client side rate limiter.
+
+    This class combines a token bucket, which limits the request rate, with an AIMD (additive-increase,
+    multiplicative-decrease) limit on the number of concurrent requests. Both are halved when the server throttles a
+    request (429/503) or the latency rises well above its usual value, and are increased again slowly while the server is
+    healthy. A Retry-After from the server pauses all requests until it has passed. The limiter is safe to share between
+    threads.
+    """
+    throttle_codes = [429, 503]
+
+    def __init__(self, requests_per_second=20.0, max_concurrency=4, min_requests_per_second=0.5,
+                 latency_factor=3.0, cooldown=1.0):
+        """Creates a rate limiter.
+
+        Args:
+            requests_per_second (float): The maximum request rate.
+            max_concurrency (int): The maximum number of concurrent requests.
+            min_requests_per_second (float): The request rate will not be decreased below this rate.
+            latency_factor (float): A request taking this many times the average latency is treated as congestion.
+            cooldown (float): The minimum number of seconds between two decreases.
+
+        """
+        self.max_rate = float(requests_per_second)
+        self.min_rate = float(min(min_requests_per_second, requests_per_second))
+        self.max_concurrency = max_concurrency
+        self.latency_factor = latency_factor
+        self.cooldown = cooldown
+        self.rate = self.max_rate
+        self.concurrency = float(max_concurrency)
+        self.latency = None
+        self.__samples = 0
+        self.__tokens = 1.0
+        self.__refilled = time.monotonic()
+        self.__paused_until = 0.0
+        self.__decreased = 0.0
+        self.__in_flight = 0
+        self.__condition = threading.Condition()
+
+    def __refill(self, now):
+        self.__tokens = min(max(1.0, self.rate), self.__tokens + (now - self.__refilled) * self.rate)
+        self.__refilled = now
+
+    def acquire(self):
+        """Waits until a request can be made, this must be followed by a call to release."""
+        with self.__condition:
+            while True:
+                now = time.monotonic()
+                self.__refill(now)
+                if now < self.__paused_until:
+                    wait = self.__paused_until - now
+                elif self.__in_flight >= max(1, int(self.concurrency)):
+                    wait = None
+                elif self.__tokens < 1.0:
+                    wait = (1.0 - self.__tokens) / self.rate
+                else:
+                    self.__tokens -= 1.0
+                    self.__in_flight += 1
+                    return
+                self.__condition.wait(wait)
+
+    def release(self, latency, status=None, retry_after=None):
+        """Records the outcome of a request and adjusts the rate and concurrency limits.
+
+        Args:
+            latency (float): The number of seconds the request took.
+            status (int): The HTTP status of the response (None if the request failed without a response).
+            retry_after (str): The Retry-After header of the response (if provided).
+
+        """
+        with self.__condition:
+            self.__in_flight -= 1
+            now = time.monotonic()
+            if status in AdaptiveRateLimiter.throttle_codes:
+                pause = self.__parse_retry_after(retry_after)
+                if pause:
+                    self.__paused_until = max(self.__paused_until, now + pause)
+                self.__decrease(now, 'HTTP %d' % status)
+            elif status is not None:
+                if self.latency is not None and self.__samples >= 10 and \
+                        latency > self.latency_factor * self.latency:
+                    self.__decrease(now, 'latency of %.2fs' % latency)
+                else:
+                    # Additive increase, roughly one more concurrent request per round trip of all in flight requests.
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1.0 / max(1.0, self.concurrency))
+                    self.rate = min(self.max_rate, self.rate + self.max_rate / 100.0)
+                    self.latency = latency if self.latency is None else 0.9 * self.latency + 0.1 * latency
+                    self.__samples += 1
+            self.__condition.notify_all()
+
+    def __decrease(self, now, reason):
+        if now - self.__decreased < self.cooldown:
+            return
+        self.__decreased = now
+        self.concurrency = max(1.0, self.concurrency / 2)
+        self.rate = max(self.min_rate, self.rate / 2)
+        logger.info('AdaptiveRateLimiter: Slowing down to %.2f requests per second and %d concurrent requests due '
+                    'to %s' % (self.rate, int(self.concurrency), reason))
+
+    @staticmethod
+    def __parse_retry_after(retry_after):
+        """Parses a Retry-After header, which is either a number of seconds or a HTTP date.
+
+        Returns:
+            float: The number of seconds to wait.
+
+        """
+        if not retry_after:
+            return 0.0
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        try:
+            date = email.utils.parsedate_to_datetime(retry_after)
+            return max(0.0, (date - datetime.datetime.now(date.tzinfo)).total_seconds())
+        except (TypeError, ValueError):
+            return 0.0
@@ -1,61 +1,139 @@
 import datetime
 import logging
+import random
+import threading
+import time
 
-import pymysql.cursors
+from database.backend import MySQLBackend
+from database.index import PageIndex
+from database.pool import ConnectionPool
+from database.rebuild import TableRebuild
+from database.schema import SchemaRegistry
+from database.sqlite import SQLiteBackend
 
 logger = logging.getLogger(__name__)
 
 
 # noinspection SqlResolve
 class DatabaseAPI(object):
+    # Values that are not useful and are not inserted.
+    empty_values = ['Name:Email:Phone:', 'Name:N/AEmail:N/APhone:N/A', 'N/A', 'None', '?', '? hours', '?hours', 'tbc',
+                    'TBC', 'n/a', 'None', None]
     __prefix = None
-    __connection = None
+    __backend = None
+    __pool = None
+    # The number of batches written in each transaction, and the batches that are waiting to be written. The batches
+    # are queued rather than left uncommitted on a pooled connection, so no transaction is left open between writes.
+    __commit_every = 1
+    __queue = []
+    # The number of rows read at a time when streaming a table.
+    __fetch_size = 1000
+    # The number of times a batch is tried when it conflicts with the batch of another worker.
+    __max_tries = 3
+    # The pages stored in the page tables, which are checked for every page on every run.
+    __index = None
+    # The tables in the database, which are checked for every page table on every run.
+    __schema = None
+    # The existing tables that have been checked for the indexes of the latest schema version during this run.
+    __upgraded = set()
+    # The pages of each page table that have a content digest stored, which are checked for every page on every run.
+    __digested = {}
+    # The tables that are being bulk rebuilt.
+    __rebuilds = {}
+    # The indexes of the page tables and the information tables. Pages and information are looked up by parent and key
+    # together. Only the first 191 characters of an information key are indexed, which keeps the utf8mb4 index within
+    # the 767 byte limit of older InnoDB row formats.
+    __page_indexes = [("parent__index", ("parent",), False), ("key__index", ("key",), False),
+                      ("parent_key__unique", ("parent", "key"), True)]
+    __info_indexes = [("parent__index", ("parent",), False), ("parent_key__index", ("parent", ("key", 191)), False)]
+    # The schema migrations, in order. Each adds an index to the existing page tables (or information tables, if
+    # True). The schema version of the database is the number of migrations that have been applied.
+    __migrations = [(False, "parent_key__unique"), (True, "parent_key__index")]
+    # The page index and schema registry are shared between the crawl worker threads. The lock may be held while
+    # waiting for a connection, but must not be acquired while holding one.
+    __lock = threading.RLock()
 
     @classmethod
     def connect(cls, config):
-        """Connect to the database."""
-        DatabaseAPI.__connection = pymysql.connect(host=config['mysql']['host'],
-                                                   port=config['mysql']['port'],
-                                                   db=config['mysql']['database'],
-                                                   user=config['mysql']['username'],
-                                                   password=config['mysql']['password'],
-                                                   charset='utf8mb4',
-                                                   cursorclass=pymysql.cursors.DictCursor)
+        """Connect to the database.
+
+        The embedded SQLite backend is used if the `sqlite` option is set, otherwise the MySQL server. A pool of
+        connections is opened (up to `pool_size`) so that the crawl worker threads can each use their own connection.
+        """
+        if config.get('sqlite'):
+            DatabaseAPI.__backend = SQLiteBackend(config['sqlite'])
+        else:
+            # Loading local files is only enabled for the bulk rebuild.
+            DatabaseAPI.__backend = MySQLBackend(config['mysql'],
+                                                 config.get('sync', {}).get('bulk_rebuild', False))
+        DatabaseAPI.__pool = ConnectionPool(DatabaseAPI.__backend.connect,
+                                            DatabaseAPI.__backend.pool_size or config['mysql'].get('pool_size', 4),
+                                            config['mysql'].get('ping_interval', 30))
+        # Open the first connection straight away, so that connection errors are raised here.
+        with DatabaseAPI.__pool.connection():
+            pass
         cls.__prefix = config['mysql']['table_prefix']
-        logger.debug('connect_to_database: Connected to MySQL database: %s' % str(config['mysql']['host']) + ':' + str(
-            config['mysql']['port']) + '/' + config['mysql']['database'])
+        cls.__commit_every = max(1, config['mysql'].get('commit_every', 1))
+        cls.__fetch_size = max(1, config['mysql'].get('fetch_size', 1000))
+        cls.__queue = []
+        cls.__digested = {}
+        cls.__upgraded = set()
+        cls.__index = PageIndex(cls.__load_index_table)
+        cls.__schema = SchemaRegistry(cls.__load_schema)
+        logger.debug('connect_to_database: Connected to %s' % DatabaseAPI.__backend.description)
+
+    @classmethod
+    def __load_index_table(cls, table):
+        """Loads the pages of a page table into the page index."""
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            sql = "SELECT `parent`, `key`, `last_updated` FROM `" + table + "`"
+            cursor.execute(sql)
+            return cursor.fetchall()
+
+    @classmethod
+    def __load_schema(cls):
+        """Loads the tables of the database into the schema registry."""
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            return DatabaseAPI.__backend.load_schema(cursor)
 
     @classmethod
     def disconnect(cls):
-        """ Disconnect from the database."""
-        DatabaseAPI.__connection.close()
+        """ Disconnect from the database, writing any batches that have not been written yet."""
+        try:
+            cls.flush()
+        except:
+            logger.error("disconnect: Unable to write the queued batches")
+        DatabaseAPI.__pool.close()
 
     @classmethod
     def create_spaces_table(cls):
         """Creates the PREFIX_spaces table within the database.
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
-            sql = "SHOW TABLES LIKE '" + cls.__prefix + "_spaces'"
-            cursor.execute(sql)
-            if cursor.fetchone() is None:
-                sql = "CREATE TABLE IF NOT EXISTS `" + cls.__prefix + "_spaces` (`id` INT(11) UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY , `space_id` INT(11) NOT NULL UNIQUE, `name` VARCHAR(256) NOT NULL, `last_updated` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP())"
-                cursor.execute(sql)
+        with DatabaseAPI.__lock:
+            if DatabaseAPI.__schema.exists(cls.__prefix + "_spaces"):
+                return
+            with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+                DatabaseAPI.__backend.create_table(cursor, cls.__prefix + "_spaces", [
+                    ("space_id", "INT(11) NOT NULL UNIQUE"), ("name", "VARCHAR(256) NOT NULL"),
+                    ("last_updated", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP")])
+                DatabaseAPI.__schema.add(cls.__prefix + "_spaces")
                 logger.debug("create_spaces_table: Created table: `" + cls.__prefix + "'_spaces`")
-                DatabaseAPI.__connection.commit()
+                connection.commit()
 
     @classmethod
     def create_application_table(cls):
         """Creates the PREFIX_conflex table within the database.
 
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
-            sql = "SHOW TABLES LIKE '" + cls.__prefix + "_conflex'"
-            cursor.execute(sql)
-            if cursor.fetchone() is None:
-                sql = "CREATE TABLE IF NOT EXISTS `" + cls.__prefix + "_conflex` (`id` INT(11) UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY , `key` VARCHAR(60) NOT NULL UNIQUE, `value` VARCHAR(256) NOT NULL)"
-                cursor.execute(sql)
+        with DatabaseAPI.__lock:
+            if DatabaseAPI.__schema.exists(cls.__prefix + "_conflex"):
+                return
+            with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+                DatabaseAPI.__backend.create_table(cursor, cls.__prefix + "_conflex", [
+                    ("key", "VARCHAR(60) NOT NULL UNIQUE"), ("value", "VARCHAR(256) NOT NULL")])
+                DatabaseAPI.__schema.add(cls.__prefix + "_conflex")
                 logger.debug("create_spaces_table: Created table: `" + cls.__prefix + "_conflex`")
-                DatabaseAPI.__connection.commit()
+                connection.commit()
 
     @classmethod
     def update_spaces(cls, space_id, space_name, last_updated):
@@ -70,23 +148,14 @@ class DatabaseAPI(object):
             last_updated (datetime.datetime): The last time the space was updated.
 
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
-            sql = "SELECT * FROM `" + cls.__prefix + "_spaces` WHERE `space_id`=%s"
-            cursor.execute(sql, space_id)
-
-            space = cursor.fetchone()
-            if space is not None:
-                # Object found, perform an update if last_update out of date.
-                if space['last_updated'] != last_updated.replace(tzinfo=None):
-                    sql = "UPDATE `" + cls.__prefix + "_spaces` SET `name`=%s, `last_updated`=%s WHERE `space_id`=%s"
-                    cursor.execute(sql, (space_name, last_updated.strftime('%Y-%m-%d %H:%M:%S'), space_id))
-                    logger.debug("update_spaces: Updating " + cls.__prefix + "_space %d: %s" % (space_id, space_name))
-            else:
-                sql = "INSERT INTO `" + cls.__prefix + "_spaces` (`space_id`, `name`, `last_updated`) VALUES (%s, %s, %s)"
-                cursor.execute(sql, (space_id, space_name, last_updated.strftime('%Y-%m-%d %H:%M:%S')))
-                logger.debug("update_spaces: Inserting " + cls.__prefix + "_space %d: %s" % (space_id, space_name))
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            # The name is only changed along with the last_updated time, the name must be set before the time.
+            sql = DatabaseAPI.__backend.upsert(cls.__prefix + "_spaces", ["space_id", "name", "last_updated"],
+                                               ["space_id"], ["name", "last_updated"], "last_updated")
+            if cursor.execute(sql, (space_id, space_name, last_updated.strftime('%Y-%m-%d %H:%M:%S'))):
+                logger.debug("update_spaces: Updating " + cls.__prefix + "_space %d: %s" % (space_id, space_name))
 
-            DatabaseAPI.__connection.commit()
+            connection.commit()
 
     @classmethod
     def update_conflex_application(cls, k, v):
@@ -101,47 +170,202 @@ class DatabaseAPI(object):
         Returns:
             str: The previous data that was in the key.
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
             sql = "SELECT * FROM `" + cls.__prefix + "_conflex` WHERE `key`=%s"
             cursor.execute(sql, k)
 
             info = cursor.fetchone()
-            if info is not None:
-                # Object found, perform an update.
-                if info['value'] != v:
-                    sql = "UPDATE `" + cls.__prefix + "_conflex` SET `value`=%s WHERE `key`=%s"
-                    cursor.execute(sql, (v, k))
-                    logger.debug("update_conflex_application: Updating " + cls.__prefix + "_conflex %s: %s" % (k, v))
-            else:
-                sql = "INSERT INTO `" + cls.__prefix + "_conflex` (`key`, `value`) VALUES (%s, %s)"
+            if info is None or info['value'] != v:
+                sql = DatabaseAPI.__backend.upsert(cls.__prefix + "_conflex", ["key", "value"], ["key"], ["value"])
                 cursor.execute(sql, (k, v))
-                logger.debug("update_conflex_application: Inserting " + cls.__prefix + "_conflex %s: %s" % (k, v))
+                logger.debug("update_conflex_application: Updating " + cls.__prefix + "_conflex %s: %s" % (k, v))
 
-            DatabaseAPI.__connection.commit()
+            connection.commit()
             return info
 
+    @classmethod
+    def get_conflex_application(cls, k):
+        """Retrieves a key value pair from the PREFIX_conflex table.
+
+        Args:
+            k (str): The key of the conflex_application row to retrieve.
+
+        Returns:
+            dict: The row if it exists.
+        """
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            sql = "SELECT * FROM `" + cls.__prefix + "_conflex` WHERE `key`=%s"
+            cursor.execute(sql, k)
+            return cursor.fetchone()
+
+    @classmethod
+    def create_digests_table(cls):
+        """Creates the PREFIX_digests table within the database.
+
+        The table holds a digest of the content of each page, so that the information of a page is only extracted
+        again when the content or the configuration of the page has changed.
+        """
+        with DatabaseAPI.__lock:
+            if DatabaseAPI.__schema.exists(cls.__prefix + "_digests"):
+                return
+            with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+                DatabaseAPI.__backend.create_table(cursor, cls.__prefix + "_digests", [
+                    ("page_table", "VARCHAR(256) NOT NULL"), ("key", "INT(11) UNSIGNED NOT NULL"),
+                    ("digest", "CHAR(40) NOT NULL")], [("page__index", ("page_table", "key"), True)])
+                DatabaseAPI.__schema.add(cls.__prefix + "_digests")
+                logger.debug("create_digests_table: Created table: `" + cls.__prefix + "_digests`")
+                connection.commit()
+
+    @classmethod
+    def get_digest(cls, table, k):
+        """Retrieves the content digest of a page.
+
+        Args:
+            table (str): The table that the page is stored in.
+            k (int): The id of the page.
+
+        Returns:
+            str: The digest, or None if no digest is stored for the page.
+        """
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            sql = "SELECT `digest` FROM `" + cls.__prefix + "_digests` WHERE `page_table`=%s AND `key`=%s"
+            cursor.execute(sql, (table, k))
+            result = cursor.fetchone()
+            return result['digest'] if result is not None else None
+
+    @classmethod
+    def has_digest(cls, table, k):
+        """Checks whether a content digest is stored for a page.
+
+        The digests of a page table are loaded the first time it is checked, so the table is not queried for each page.
+        A page without a digest has information that was not (or not fully) stored, so it should be extracted again.
+
+        Args:
+            table (str): The table that the page is stored in.
+            k (int): The id of the page.
+
+        Returns:
+            bool: Whether a digest is stored for the page.
+        """
+        with DatabaseAPI.__lock:
+            keys = DatabaseAPI.__digested.get(table)
+            if keys is None:
+                with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+                    sql = "SELECT `key` FROM `" + cls.__prefix + "_digests` WHERE `page_table`=%s"
+                    cursor.execute(sql, table)
+                    keys = DatabaseAPI.__digested[table] = set(row['key'] for row in cursor.fetchall())
+            return k in keys
+
+    @classmethod
+    def __record_digests(cls, digests):
+        """Records that digests were stored (or deleted, if None) for the has_digest checks of the loaded tables."""
+        with DatabaseAPI.__lock:
+            for table, k, digest in digests:
+                keys = DatabaseAPI.__digested.get(table)
+                if keys is not None and digest is not None:
+                    keys.add(k)
+                elif keys is not None:
+                    keys.discard(k)
+
+    @classmethod
+    def delete_digest(cls, table, k):
+        """Deletes the content digest of a page, so that its information is extracted the next time it is seen.
+
+        Args:
+            table (str): The table that the page is stored in.
+            k (int): The id of the page.
+        """
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            sql = "DELETE FROM `" + cls.__prefix + "_digests` WHERE `page_table`=%s AND `key`=%s"
+            cursor.execute(sql, (table, k))
+            connection.commit()
+        cls.__record_digests([(table, k, None)])
+
+    @classmethod
+    def migrate(cls, page_tables):
+        """Upgrades the existing page and information tables to the latest schema version.
+
+        The schema version is recorded in the PREFIX_conflex table. If the database is not at the latest version, the
+        indexes added by the migrations are added to the existing tables of the configured page trees (online where the
+        database allows it), skipping any table that already has them, and the version is recorded once all of the
+        tables have been upgraded. Any other existing table is upgraded by create_table the first time it is used.
+
+        Args:
+            page_tables (list): The page tables of the configured page trees, their information tables are upgraded
+                along with them.
+
+        Raises:
+            Exception: If a table can not be upgraded, in which case the page tables can not be written safely.
+        """
+        row = cls.get_conflex_application('schema_version')
+        version = int(row['value']) if row is not None else 0
+        if version >= len(DatabaseAPI.__migrations):
+            return
+        for table in sorted(set(page_tables)):
+            for name, varchar_key in ((table, False), (table + "__info", True)):
+                with DatabaseAPI.__lock:
+                    if DatabaseAPI.__schema.exists(name):
+                        cls.__upgrade_table(name, varchar_key)
+        cls.update_conflex_application('schema_version', str(len(DatabaseAPI.__migrations)))
+        logger.info("migrate: Upgraded database to schema version: %d" % len(DatabaseAPI.__migrations))
+
+    @classmethod
+    def __upgrade_table(cls, table, varchar_key):
+        """Adds the indexes of the migrations that an existing table is missing, once per run.
+
+        Must be called while holding the lock.
+        """
+        if table in DatabaseAPI.__upgraded:
+            return
+        indexes = DatabaseAPI.__info_indexes if varchar_key else DatabaseAPI.__page_indexes
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            existing = DatabaseAPI.__backend.indexes(cursor, table)
+            for migration_key, name in DatabaseAPI.__migrations:
+                if migration_key != varchar_key or name in existing:
+                    continue
+                columns, unique = next((columns, unique) for index, columns, unique in indexes if index == name)
+                logger.info("migrate: Adding index `%s` to table: `%s`" % (name, table))
+                try:
+                    DatabaseAPI.__backend.add_index(cursor, table, name, columns, unique)
+                except:
+                    logger.error("migrate: Unable to add index `%s` to table: `%s`" % (name, table))
+                    raise
+        DatabaseAPI.__upgraded.add(table)
+
     @classmethod
     def create_table(cls, table_name, varchar_key=False):
         """Creates a table with a specified name and can allow for a VARCHAR key..
 
+        A page table (with an INT(11) key) stores each page once per parent, so it has a unique `parent`-`key` index,
+        an information table (with a VARCHAR(512) key) has a composite `parent`-`key` index. An existing table is
+        upgraded to the latest schema version the first time it is used (if migrate has not upgraded it already). The
+        tables are looked up in the schema registry, so the catalog is not queried again for a table that has already
+        been seen.
+
         Args:
             table_name (str): A name for the table.
             varchar_key (bool): Will default to an INT(11) `key` column or a VARCHAR(512) if this is True.
 
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
-            sql = "SHOW TABLES LIKE '" + table_name + "'"
-            cursor.execute(sql)
-            if cursor.fetchone() is None:
+        with DatabaseAPI.__lock:
+            if DatabaseAPI.__schema.exists(table_name):
+                cls.__upgrade_table(table_name, varchar_key)
+                return
+
+            with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
                 if varchar_key:
-                    sql = "CREATE TABLE IF NOT EXISTS `" + table_name + "` (`id` INT(11) UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY, `parent` INT(11) UNSIGNED NOT NULL, `key` VARCHAR(512) NOT NULL, `value` TEXT, `last_updated` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP(), INDEX `parent__index` (`parent`))"
                     logger.debug("create_table: Creating table: `%s` with VARCHAR(256) key" % table_name)
                 else:
-                    sql = "CREATE TABLE IF NOT EXISTS `" + table_name + "` (`id` INT(11) UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY, `parent` INT(11) UNSIGNED NOT NULL, `key` INT(11) UNSIGNED NOT NULL, `value` TEXT, `last_updated` TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP(), INDEX `parent__index` (`parent`), INDEX `key__index` (`key`))"
                     logger.debug("create_table: Creating table: `%s` with INT(11) key" % table_name)
 
-                cursor.execute(sql)
-                DatabaseAPI.__connection.commit()
+                DatabaseAPI.__backend.create_table(cursor, table_name, [
+                    ("parent", "INT(11) UNSIGNED NOT NULL"),
+                    ("key", "VARCHAR(512) NOT NULL" if varchar_key else "INT(11) UNSIGNED NOT NULL"),
+                    ("value", "TEXT"), ("last_updated", "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP")],
+                    DatabaseAPI.__info_indexes if varchar_key else DatabaseAPI.__page_indexes)
+                connection.commit()
+                DatabaseAPI.__schema.add(table_name)
+                DatabaseAPI.__upgraded.add(table_name)
 
     @classmethod
     def insert_or_update(cls, table, parent, k, value, last_updated, update=False):
@@ -160,51 +384,339 @@ class DatabaseAPI(object):
 
         """
         # Perform a quick data cleanup first by not inserting information that is not useful.
-        if value in ['Name:Email:Phone:', 'Name:N/AEmail:N/APhone:N/A', 'N/A', 'None', '?', '? hours', '?hours', 'tbc', 'TBC', 'n/a', 'None', None]:
+        if value in DatabaseAPI.empty_values:
             return False
 
-        with DatabaseAPI.__connection.cursor() as cursor:
+        # The TIMESTAMP column has no fractional seconds, so they are dropped to compare like with like.
+        last_updated = last_updated.replace(microsecond=0)
+        with DatabaseAPI.__lock:
+            if update and DatabaseAPI.__index.get(table, parent, k) == last_updated.replace(tzinfo=None):
+                # The page is stored and has not changed.
+                return False
+
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
             try:
-                sql = "SELECT * FROM " + table + " WHERE `parent`=%s AND `key`=%s"
-                cursor.execute(sql, (parent, k))
-                result = cursor.fetchone()
-                if result is not None and update:
-                    if result['last_updated'] != last_updated.replace(microsecond=0, tzinfo=None):
-                        sql = "UPDATE `" + table + "` SET `parent`=%s, `key`=%s, `value`=%s, `last_updated`=%s WHERE `id`=%s"
-                        cursor.execute(sql, (parent, k, value, last_updated, result['id']))
-                        logger.debug("insert_or_update: Updating `%s`: parent: %s, key: %s" % (table, str(parent), str(k)))
-                        DatabaseAPI.__connection.commit()
-                        return True
+                if update:
+                    # Relies on the unique parent-key index of the table. The row is only changed (and counted as
+                    # affected) when the last_updated time differs.
+                    sql = DatabaseAPI.__backend.upsert(table, ["parent", "key", "value", "last_updated"],
+                                                       ["parent", "key"], ["value", "last_updated"], "last_updated")
                 else:
                     sql = "INSERT INTO `" + table + "` (`parent`, `key`, `value`, `last_updated`) VALUES (%s, %s, %s, %s)"
-                    cursor.execute(sql, (parent, k, value, last_updated))
-                    logger.debug("update_data: Inserting into `%s` new Data: parent: %s, key: %s" % (table, str(parent), str(k)))
-                    DatabaseAPI.__connection.commit()
-                    return True
-
-                return False
+                changed = cursor.execute(sql, (parent, k, value, last_updated))
+                if changed:
+                    logger.debug("insert_or_update: Inserting/updating `%s`: parent: %s, key: %s" % (table, str(parent), str(k)))
+                    connection.commit()
             except:
                 logger.error("insert_or_update: There was an issue updating some data in the database for table: %s, parent: %s, key: %s" % (table, str(parent), str(k)))
                 return False
 
+        if update:
+            with DatabaseAPI.__lock:
+                DatabaseAPI.__index.put(table, parent, k, last_updated.replace(tzinfo=None))
+        return changed > 0
+
+    @classmethod
+    def __diff_rows(cls, existing, rows):
+        """Works out the changes needed to turn the stored rows of a parent into a new set of rows.
+
+        Rows are matched on their key and value, a stored row that is matched is left as it is. The remaining stored
+        rows of a key are updated with the remaining new values of the key, and any left over are inserted or deleted.
+
+        Args:
+            existing (list): The `id`, `key` and `value` of each stored row.
+            rows (list): A (key, value, last_updated) tuple for each new row.
+
+        Returns:
+            tuple: The (key, value, last_updated) rows to insert, the (value, last_updated, id) rows to update and the
+                ids of the rows to delete.
+
+        """
+        stored = {}
+        for row in existing:
+            stored.setdefault(row['key'], []).append((row['id'], row['value']))
+
+        inserts, updates, deletes = [], [], []
+        new = {}
+        for k, value, last_updated in rows:
+            new.setdefault(k, []).append((value, last_updated))
+        for k, values in new.items():
+            unmatched = stored.pop(k, [])
+            changed = []
+            for value, last_updated in values:
+                match = next((i for i, (row_id, stored_value) in enumerate(unmatched)
+                              if stored_value == str(value)), None)
+                if match is None:
+                    changed.append((value, last_updated))
+                else:
+                    del unmatched[match]
+            for (row_id, stored_value), (value, last_updated) in zip(unmatched, changed):
+                updates.append((value, last_updated, row_id))
+            inserts.extend((k, value, last_updated) for value, last_updated in changed[len(unmatched):])
+            deletes.extend(row_id for row_id, stored_value in unmatched[len(changed):])
+        for unmatched in stored.values():
+            deletes.extend(row_id for row_id, stored_value in unmatched)
+        return inserts, updates, deletes
+
+    @classmethod
+    def sync(cls, table, parent, rows, digest_table=None, digest=None):
+        """Brings all of the data of a parent in a table in line with a batch of rows.
+
+        The stored rows of the parent are compared with the new rows, and only the rows whose value changed are
+        inserted, updated or deleted (along with the content digest of the parent) in a single transaction, so the data
+        of the parent is never seen half written. A row that has not changed keeps its last_updated time. The batches
+        are queued and written `commit_every` at a time in one transaction (see flush). If the table is being rebuilt,
+        the rows are added to the rebuild instead.
+
+        Args:
+            table (str): The table to sync the data in.
+            parent (int): The id of the parent whose data is synced.
+            rows (list): A (key, value, last_updated) tuple for each row of the parent.
+            digest_table (str): The page table to store the content digest of the parent for (if provided).
+            digest (str): The content digest of the parent, the stored digest is deleted if this is None.
+
+        Returns:
+            int: The number of rows inserted, updated or deleted by the batches written, 0 if the batch was queued.
+
+        """
+        # Perform a quick data cleanup first by not inserting information that is not useful.
+        rows = [(k, value, last_updated) for k, value, last_updated in rows if value not in DatabaseAPI.empty_values]
+
+        with DatabaseAPI.__lock:
+            rebuild = DatabaseAPI.__rebuilds.get(table)
+        if rebuild is not None:
+            # The rows are loaded into the table when the rebuild is finished.
+            if rows:
+                rebuild.write(parent, rows)
+            else:
+                # A parent without rows in the rebuild keeps its current rows, so they are deleted now.
+                cls.delete(table, parent)
+            if digest_table is not None:
+                rebuild.put_digest(digest_table, parent, digest)
+            return len(rows)
+
+        with DatabaseAPI.__lock:
+            DatabaseAPI.__queue.append((table, parent, rows, digest_table, digest))
+            if len(DatabaseAPI.__queue) < DatabaseAPI.__commit_every:
+                return 0
+            batches = DatabaseAPI.__queue
+            DatabaseAPI.__queue = []
+        return cls.__write_batches(batches)
+
+    @classmethod
+    def flush(cls):
+        """Writes the batches queued by sync.
+
+        Returns:
+            int: The number of rows inserted, updated or deleted.
+
+        """
+        with DatabaseAPI.__lock:
+            batches = DatabaseAPI.__queue
+            DatabaseAPI.__queue = []
+        return cls.__write_batches(batches) if batches else 0
+
+    @classmethod
+    def __write_batches(cls, batches):
+        """Writes batches of rows in one transaction.
+
+        Transactions that conflict with the transaction of another worker (a deadlock or lock wait timeout) are tried
+        again, after a short random wait. If the batches can not be written, the content digests of their parents are
+        deleted so that their information is extracted again on the next run (their page rows have already been
+        written).
+        """
+        discarded = []
+        for attempt in range(1, DatabaseAPI.__max_tries + 1):
+            try:
+                with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+                    try:
+                        changed = sum(cls.__write_rows(cursor, *batch) for batch in batches)
+                        connection.commit()
+                        break
+                    except Exception as error:
+                        if attempt == DatabaseAPI.__max_tries or not DatabaseAPI.__backend.conflict(error):
+                            discarded = cls.__discard_batches(connection, batches)
+                            raise
+                        connection.rollback()
+                        logger.warning("sync: Transaction conflict writing %d batches, retrying (attempt %d)" % (
+                            len(batches), attempt))
+            finally:
+                # The lock must not be taken while holding a connection, so the digests are recorded afterwards.
+                if discarded:
+                    cls.__record_digests(discarded)
+            time.sleep(random.uniform(0, 0.1 * 2 ** attempt))
+
+        cls.__record_digests([(digest_table, parent, digest) for table, parent, rows, digest_table, digest in batches
+                              if digest_table is not None])
+        return changed
+
+    @classmethod
+    def __write_rows(cls, cursor, table, parent, rows, digest_table, digest):
+        """Writes the changes to the rows of a parent (and its content digest), without committing them."""
+        sql = "SELECT `id`, `key`, `value` FROM `" + table + "` WHERE `parent`=%s ORDER BY `id`" + \
+              DatabaseAPI.__backend.for_update
+        cursor.execute(sql, parent)
+        inserts, updates, deletes = DatabaseAPI.__diff_rows(cursor.fetchall(), rows)
+        if deletes:
+            sql = "DELETE FROM `" + table + "` WHERE `id` IN (" + ", ".join(["%s"] * len(deletes)) + ")"
+            cursor.execute(sql, deletes)
+        if updates:
+            sql = "UPDATE `" + table + "` SET `value`=%s, `last_updated`=%s WHERE `id`=%s"
+            cursor.executemany(sql, updates)
+        if inserts:
+            sql = "INSERT INTO `" + table + "` (`parent`, `key`, `value`, `last_updated`) VALUES (%s, %s, %s, %s)"
+            cursor.executemany(sql, [(parent, k, value, last_updated) for k, value, last_updated in inserts])
+        if digest_table is not None and digest is not None:
+            sql = DatabaseAPI.__backend.upsert(cls.__prefix + "_digests", ["page_table", "key", "digest"],
+                                               ["page_table", "key"], ["digest"])
+            cursor.execute(sql, (digest_table, parent, digest))
+        elif digest_table is not None:
+            sql = "DELETE FROM `" + cls.__prefix + "_digests` WHERE `page_table`=%s AND `key`=%s"
+            cursor.execute(sql, (digest_table, parent))
+        logger.debug("sync: Synced data in `%s`: parent: %s, inserted: %d, updated: %d, deleted: %d" % (
+            table, str(parent), len(inserts), len(updates), len(deletes)))
+        return len(inserts) + len(updates) + len(deletes)
+
+    @classmethod
+    def __discard_batches(cls, connection, batches):
+        """Rolls back batches that could not be written and deletes the content digests of their parents.
+
+        Returns:
+            list: A (page_table, key, None) tuple for each deleted digest, to record once the connection is released.
+
+        """
+        digests = [(digest_table, parent, None) for table, parent, rows, digest_table, digest in batches
+                   if digest_table is not None]
+        try:
+            connection.rollback()
+            with connection.cursor() as cursor:
+                sql = "DELETE FROM `" + cls.__prefix + "_digests` WHERE `page_table`=%s AND `key`=%s"
+                cursor.executemany(sql, [digest[:2] for digest in digests])
+            connection.commit()
+        except:
+            logger.error("sync: Unable to delete the content digests of the rolled back pages: %s" % ", ".join(
+                str(parent) for digest_table, parent, digest in digests))
+        return digests
+
+    @classmethod
+    def begin_rebuild(cls, tables):
+        """Starts a bulk rebuild of information tables.
+
+        Until the rebuild is finished, the rows synced to the tables are collected in a file rather than written to
+        the tables, which are left as they are for readers.
+
+        Args:
+            tables (list): The names of the (VARCHAR key) tables to rebuild.
+
+        """
+        with DatabaseAPI.__lock:
+            for table in tables:
+                if table not in DatabaseAPI.__rebuilds:
+                    cls.create_table(table, True)
+                    DatabaseAPI.__rebuilds[table] = TableRebuild()
+                    logger.info("begin_rebuild: Rebuilding table: `%s`" % table)
+
+    @classmethod
+    def finish_rebuild(cls):
+        """Loads the rows collected for the tables that are being rebuilt and swaps them in.
+
+        The rows of each table are bulk loaded into a shadow table, along with the current rows of the parents that
+        were not rebuilt (i.e. whose digest had not changed, or that could not be extracted), and the shadow table then
+        replaces the table in one step (a `RENAME TABLE` on MySQL), so readers never see a half built table. `LOAD DATA
+        LOCAL INFILE` is used if the server allows it, otherwise the rows are written with multi-row inserts. If a table
+        can not be rebuilt it is left as it was, the other tables are still rebuilt and the first error is raised
+        afterwards.
+        """
+        with DatabaseAPI.__lock:
+            rebuilds = DatabaseAPI.__rebuilds
+            DatabaseAPI.__rebuilds = {}
+        failure = None
+        for table, rebuild in rebuilds.items():
+            try:
+                rebuild.close()
+                cls.__load_rebuild(table, rebuild)
+            except Exception as error:
+                logger.error("finish_rebuild: Unable to rebuild table: `%s`" % table)
+                failure = failure or error
+            finally:
+                rebuild.remove()
+        if failure is not None:
+            raise failure
+
+    @classmethod
+    def __load_rebuild(cls, table, rebuild):
+        shadow = table + "__rebuild"
+        columns = ["parent", "key", "value", "last_updated"]
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            # A shadow table left behind by a rebuild that failed is dropped first.
+            cursor.execute("DROP TABLE IF EXISTS `" + shadow + "`")
+            DatabaseAPI.__backend.create_shadow(cursor, table, shadow)
+            if not DatabaseAPI.__backend.bulk_load(cursor, shadow, rebuild.path, columns):
+                logger.debug("finish_rebuild: Unable to load data from a local file, inserting rows into table: `%s`" % table)
+                sql = "INSERT INTO `" + shadow + "` (`parent`, `key`, `value`, `last_updated`) VALUES (%s, %s, %s, %s)"
+                for rows in rebuild.read(DatabaseAPI.__fetch_size):
+                    cursor.executemany(sql, rows)
+            sql = "INSERT INTO `" + shadow + "` (`parent`, `key`, `value`, `last_updated`) SELECT `current`.`parent`, `current`.`key`, `current`.`value`, `current`.`last_updated` FROM `" + table + "` AS `current` WHERE NOT EXISTS (SELECT 1 FROM `" + shadow + "` AS `rebuilt` WHERE `rebuilt`.`parent`=`current`.`parent`)"
+            kept = cursor.execute(sql)
+            connection.commit()
+            DatabaseAPI.__backend.swap_tables(cursor, table, shadow, columns)
+
+            # The digests are only stored once the rows are in place, so pages are extracted again if the rebuild fails.
+            digests = rebuild.digests()
+            sql = DatabaseAPI.__backend.upsert(cls.__prefix + "_digests", ["page_table", "key", "digest"],
+                                               ["page_table", "key"], ["digest"])
+            cursor.executemany(sql, [digest for digest in digests if digest[2] is not None])
+            sql = "DELETE FROM `" + cls.__prefix + "_digests` WHERE `page_table`=%s AND `key`=%s"
+            cursor.executemany(sql, [digest[:2] for digest in digests if digest[2] is None])
+            connection.commit()
+            logger.info("finish_rebuild: Rebuilt table: `%s`, rows loaded: %d, rows kept: %d" % (table, rebuild.rows, kept))
+        cls.__record_digests(digests)
+
+    @classmethod
+    def abort_rebuild(cls):
+        """Abandons the tables that are being rebuilt, leaving them as they were."""
+        with DatabaseAPI.__lock:
+            rebuilds = DatabaseAPI.__rebuilds
+            DatabaseAPI.__rebuilds = {}
+        for table, rebuild in rebuilds.items():
+            logger.warning("abort_rebuild: Abandoning rebuild of table: `%s`" % table)
+            rebuild.remove()
+
     @classmethod
     def check_data_exists(cls, table, parent, k):
-        """Checks to see if the data exists in the table.
+        """Checks to see if a page exists in a page table.
+
+        The check is made against the page index, so the table is only queried the first time it is checked.
 
         Args:
-            table (str): The table to check for the data.
+            table (str): The page table to check for the page.
             parent (int): The parent component to find.
-            k (str): The key component to find.
+            k (int): The key component to find.
 
         Returns:
-            dict: The data if it exists in the table.
+            dict: The parent, key and last_updated of the page if it exists in the table.
 
         """
+        with DatabaseAPI.__lock:
+            last_updated = DatabaseAPI.__index.get(table, parent, k)
+            if last_updated is None:
+                return None
+            return {'parent': parent, 'key': k, 'last_updated': last_updated}
 
-        with DatabaseAPI.__connection.cursor() as cursor:
-            sql = "SELECT * FROM " + table + " WHERE `parent`=%s AND `key`=%s"
-            cursor.execute(sql, (parent, k))
-            return cursor.fetchone()
+    @classmethod
+    def check_key_exists(cls, table, k):
+        """Checks to see if a page exists in a page table under any parent.
+
+        Args:
+            table (str): The page table to check for the page.
+            k (int): The key component to find.
+
+        Returns:
+            bool: Whether the page exists in the table.
+
+        """
+        with DatabaseAPI.__lock:
+            return DatabaseAPI.__index.contains_key(table, k)
 
     @classmethod
     def delete(cls, table, parent, k=None):
@@ -216,14 +728,35 @@ class DatabaseAPI(object):
             k (str): The key component to delete (if provided).
 
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
             if k:
                 sql = "DELETE FROM `" + table + "` WHERE `parent`=%s AND `key`=%s"
                 cursor.execute(sql, (parent, k))
             else:
                 sql = "DELETE FROM `" + table + "` WHERE `parent`=%s"
                 cursor.execute(sql, parent)
-            DatabaseAPI.__connection.commit()
+            connection.commit()
+
+        with DatabaseAPI.__lock:
+            DatabaseAPI.__index.remove(table, parent, k or None)
+
+    @classmethod
+    def select_orphans(cls, table, parent_table):
+        """Retrieves the rows of a table whose parent is not stored in the parent table.
+
+        Args:
+            table (str): The table to find the data in.
+            parent_table (str): The table that should contain the parent of each row as a `key`.
+
+        Returns:
+            list: The list of rows without a parent.
+        """
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            sql = "SELECT `child`.* FROM `" + table + "` AS `child` LEFT JOIN `" + parent_table + \
+                  "` AS `parent` ON `parent`.`key` = `child`.`parent` WHERE `parent`.`id` IS NULL"
+            cursor.execute(sql)
+
+            return cursor.fetchall()
 
     @classmethod
     def get_spaces(cls):
@@ -233,8 +766,8 @@ class DatabaseAPI(object):
             list: The list of spaces.
 
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
-            sql = "SELECT * FROM `wiki_spaces`"
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+            sql = "SELECT * FROM `" + cls.__prefix + "_spaces`"
             cursor.execute(sql)
 
             return cursor.fetchall()
@@ -251,7 +784,7 @@ class DatabaseAPI(object):
         Returns:
             list: The list of information.
         """
-        with DatabaseAPI.__connection.cursor() as cursor:
+        with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
             if k and parent:
                 sql = "SELECT * FROM `" + table + "` WHERE `parent`=%s AND `key`=%s"
                 cursor.execute(sql, (parent, k))
@@ -266,3 +799,56 @@ class DatabaseAPI(object):
                 cursor.execute(sql)
 
             return cursor.fetchall()
+
+    @classmethod
+    def stream(cls, table, parent=None, k=None, order_by='id'):
+        """Retrieves information from the database given a parent-key combination, a chunk of rows at a time.
+
+        Unlike select, the rows are not all loaded into memory. They are read `fetch_size` rows at a time, paginated on
+        the `order_by` column, and a connection is only held while each chunk is read, so rows can be written and
+        deleted while iterating. Tables (or views) without a unique column to paginate on are read with a server side
+        cursor instead, which holds a connection until the iteration is finished, so nothing should be written to the
+        database while iterating over them.
+
+        Args:
+            table (str): The table to find the data in
+            parent (int): The parent component to find.
+            k (str): The key component to find (if provided).
+            order_by (str): A unique column to paginate on, or None to use a server side cursor.
+
+        Yields:
+            dict: Each row of information.
+        """
+        conditions = []
+        args = []
+        if parent:
+            conditions.append("`parent`=%s")
+            args.append(parent)
+        if k:
+            conditions.append("`key`=%s")
+            args.append(k)
+
+        if order_by is None:
+            sql = "SELECT * FROM `" + table + "`" + (" WHERE " + " AND ".join(conditions) if conditions else "")
+            with DatabaseAPI.__pool.connection() as connection, \
+                    DatabaseAPI.__backend.stream_cursor(connection) as cursor:
+                cursor.execute(sql, args)
+                for row in cursor:
+                    yield row
+            return
+
+        last = None
+        while True:
+            chunk_conditions = conditions + (["`" + order_by + "`>%s"] if last is not None else [])
+            chunk_args = args + ([last] if last is not None else [])
+            sql = "SELECT * FROM `" + table + "`" + (
+                " WHERE " + " AND ".join(chunk_conditions) if chunk_conditions else "") + \
+                " ORDER BY `" + order_by + "` LIMIT %s"
+            with DatabaseAPI.__pool.connection() as connection, connection.cursor() as cursor:
+                cursor.execute(sql, chunk_args + [DatabaseAPI.__fetch_size])
+                rows = cursor.fetchall()
+            for row in rows:
+                yield row
+            if len(rows) < DatabaseAPI.__fetch_size:
+                return
+            last = rows[-1][order_by]
@@ -0,0 +1,213 @@
+import logging
+
+import pymysql.cursors
+
+logger = logging.getLogger(__name__)
+
+
+class Backend(object):
+    """Storage backend of the DatabaseAPI.
+
+    A backend opens the connections to the database and provides the statements that differ between databases. The
+    DatabaseAPI writes the rest of its SQL once, with backtick quoted identifiers and `%s` placeholders, which every
+    backend accepts. Connections must behave like a pymysql connection with a DictCursor.
+    """
+
+    # A description of the database, for logging.
+    description = None
+    # The maximum number of connections the backend allows, None if the `pool_size` option applies.
+    pool_size = None
+    # The clause that locks the rows read by a select until the end of the transaction.
+    for_update = ""
+
+    def connect(self):
+        """Opens a new connection to the database."""
+        raise NotImplementedError()
+
+    def conflict(self, error):
+        """Checks whether an error aborted a statement because of a lock held by another transaction, i.e. a deadlock,
+        so that the transaction can be tried again."""
+        return False
+
+    def create_table(self, cursor, table, columns, indexes=()):
+        """Creates a table (if it does not exist) with an auto increment `id` primary key.
+
+        Args:
+            cursor (Cursor): The cursor to create the table with.
+            table (str): The name of the table.
+            columns (list): A (name, definition) tuple for each column, the definition is in MySQL syntax.
+            indexes (list): A (name, columns, unique) tuple for each index, a column can be a (name, length) tuple
+                to index only a prefix of the column (where the database supports it).
+
+        """
+        raise NotImplementedError()
+
+    def upsert(self, table, columns, unique, update, changed=None):
+        """Builds a statement that inserts a row, or updates the row with the same unique key if there is one.
+
+        Args:
+            table (str): The name of the table.
+            columns (list): The columns to insert.
+            unique (list): The columns of the unique key.
+            update (list): The columns to update if the row exists.
+            changed (str): A column that must differ for the existing row to be updated (and counted as affected).
+
+        Returns:
+            str: The statement.
+
+        """
+        raise NotImplementedError()
+
+    def load_schema(self, cursor):
+        """Reads the names of the tables of the database from the catalog."""
+        raise NotImplementedError()
+
+    def indexes(self, cursor, table):
+        """Reads the names of the indexes of a table from the catalog."""
+        raise NotImplementedError()
+
+    def add_index(self, cursor, table, index, columns, unique=False):
+        """Adds an index to an existing table.
+
+        Before a unique index is added, any duplicate rows are removed (keeping the most recently inserted row).
+
+        Args:
+            cursor (Cursor): The cursor to add the index with.
+            table (str): The name of the table.
+            index (str): The name of the index.
+            columns (list): The columns of the index, as for create_table.
+            unique (bool): Whether the index is unique.
+
+        """
+        raise NotImplementedError()
+
+    def stream_cursor(self, connection):
+        """Opens a cursor that reads the rows of a select as they are iterated over, rather than all at once."""
+        raise NotImplementedError()
+
+    def create_shadow(self, cursor, table, shadow):
+        """Creates an empty table with the columns of a table, to rebuild the table in."""
+        raise NotImplementedError()
+
+    def bulk_load(self, cursor, table, path, columns):
+        """Loads a file of rows (in the `LOAD DATA` format) into a table.
+
+        Returns:
+            bool: Whether the rows were loaded, False if the backend (or server) can not load files.
+
+        """
+        return False
+
+    def swap_tables(self, cursor, table, shadow, columns):
+        """Replaces the rows of a table with those of its shadow table in one step, and drops the shadow table."""
+        raise NotImplementedError()
+
+
+class MySQLBackend(Backend):
+    """MySQL storage backend, using PyMySQL."""
+
+    for_update = " FOR UPDATE"
+
+    def __init__(self, config, local_infile=False):
+        """Creates the backend.
+
+        Args:
+            config (dict): The `mysql` section of the configuration.
+            local_infile (bool): Whether to allow `LOAD DATA LOCAL INFILE`, which lets the server read files from the
+                client, so it is only enabled when it is used (by a bulk rebuild).
+
+        """
+        self.__config = config
+        self.__local_infile = local_infile
+        self.description = 'MySQL database: %s:%s/%s' % (config['host'], config['port'], config['database'])
+
+    def connect(self):
+        return pymysql.connect(host=self.__config['host'],
+                               port=self.__config['port'],
+                               db=self.__config['database'],
+                               user=self.__config['username'],
+                               password=self.__config['password'],
+                               charset='utf8mb4',
+                               local_infile=self.__local_infile,
+                               cursorclass=pymysql.cursors.DictCursor)
+
+    def conflict(self, error):
+        # Deadlock found when trying to get lock (1213), lock wait timeout exceeded (1205).
+        return isinstance(error, pymysql.err.MySQLError) and len(error.args) > 0 and error.args[0] in (1205, 1213)
+
+    @staticmethod
+    def __index(name, columns, unique):
+        columns = ["`" + column[0] + "`(" + str(column[1]) + ")" if isinstance(column, tuple) else "`" + column + "`"
+                   for column in columns]
+        return ("UNIQUE INDEX `" if unique else "INDEX `") + name + "` (" + ", ".join(columns) + ")"
+
+    def create_table(self, cursor, table, columns, indexes=()):
+        definitions = ["`id` INT(11) UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY"]
+        definitions.extend("`" + name + "` " + definition for name, definition in columns)
+        definitions.extend(self.__index(name, index_columns, unique) for name, index_columns, unique in indexes)
+        cursor.execute("CREATE TABLE IF NOT EXISTS `" + table + "` (" + ", ".join(definitions) + ")")
+
+    def upsert(self, table, columns, unique, update, changed=None):
+        if changed is None:
+            updates = ["`" + column + "`=VALUES(`" + column + "`)" for column in update]
+        else:
+            # The row is only changed when the changed column differs, so the affected row count is 0 for an unchanged
+            # row (1 for an insert, 2 for an update). The changed column must be set last.
+            updates = ["`" + column + "`=IF(`" + changed + "`<>VALUES(`" + changed + "`), VALUES(`" + column + "`), `" +
+                       column + "`)" for column in update if column != changed]
+            updates.append("`" + changed + "`=VALUES(`" + changed + "`)")
+        return "INSERT INTO `" + table + "` (`" + "`, `".join(columns) + "`) VALUES (" + \
+               ", ".join(["%s"] * len(columns)) + ") ON DUPLICATE KEY UPDATE " + ", ".join(updates)
+
+    def load_schema(self, cursor):
+        # Views (i.e. the application inventory views) are not tables that the application writes to.
+        sql = "SELECT `TABLE_NAME` AS `table_name` FROM `information_schema`.`TABLES` WHERE `TABLE_SCHEMA`=DATABASE() AND `TABLE_TYPE`='BASE TABLE'"
+        cursor.execute(sql)
+        return set(row['table_name'] for row in cursor.fetchall())
+
+    def indexes(self, cursor, table):
+        sql = "SELECT DISTINCT `INDEX_NAME` AS `index_name` FROM `information_schema`.`STATISTICS` WHERE `TABLE_SCHEMA`=DATABASE() AND `TABLE_NAME`=%s"
+        cursor.execute(sql, table)
+        return set(row['index_name'] for row in cursor.fetchall())
+
+    def add_index(self, cursor, table, index, columns, unique=False):
+        if unique:
+            sql = "DELETE `older` FROM `" + table + "` AS `older` JOIN `" + table + "` AS `newer` ON " + \
+                  " AND ".join("`older`.`" + column + "`=`newer`.`" + column + "`" for column in columns) + \
+                  " AND `older`.`id`<`newer`.`id`"
+            duplicates = cursor.execute(sql)
+            if duplicates:
+                logger.info("add_index: Removed %d duplicate rows from table: `%s`" % (duplicates, table))
+            cursor.connection.commit()
+        # The index is added without locking the table, so that the migration can run while the table is in use.
+        sql = "ALTER TABLE `" + table + "` ADD " + self.__index(index, columns, unique)
+        try:
+            cursor.execute(sql + ", ALGORITHM=INPLACE, LOCK=NONE")
+        except pymysql.err.MySQLError:
+            # Servers that can not add the index online have to lock the table while it is added.
+            logger.warning("add_index: Unable to add the index online, locking table: `%s`" % table)
+            cursor.execute(sql)
+        cursor.connection.commit()
+
+    def stream_cursor(self, connection):
+        return connection.cursor(pymysql.cursors.SSDictCursor)
+
+    def create_shadow(self, cursor, table, shadow):
+        cursor.execute("CREATE TABLE `" + shadow + "` LIKE `" + table + "`")
+
+    def bulk_load(self, cursor, table, path, columns):
+        if not self.__local_infile:
+            return False
+        sql = "LOAD DATA LOCAL INFILE %s INTO TABLE `" + table + "` CHARACTER SET utf8mb4 FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' (`" + "`, `".join(columns) + "`)"
+        try:
+            cursor.execute(sql, path)
+        except pymysql.err.MySQLError:
+            # The server does not allow local files to be loaded.
+            cursor.connection.rollback()
+            return False
+        return True
+
+    def swap_tables(self, cursor, table, shadow, columns):
+        cursor.execute("DROP TABLE IF EXISTS `" + table + "__old`")
+        cursor.execute("RENAME TABLE `" + table + "` TO `" + table + "__old`, `" + shadow + "` TO `" + table + "`")
+        cursor.execute("DROP TABLE `" + table + "__old`")
@@ -0,0 +1,78 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PageIndex(object):
+    """In memory index of the pages stored in the page tables.
+
+    This class keeps the parent, key and last_updated time of every row of a page table, so that checking whether a
+    page is stored (or has changed) does not need a query for each page. A table is loaded in full the first time it
+    is used and kept up to date as pages are written to and deleted from it. Changes to tables that have not been
+    loaded are ignored, as they are read from the database when the table is loaded. The index is not thread safe, the
+    DatabaseAPI only uses it while holding its lock.
+    """
+
+    def __init__(self, loader):
+        """Creates an empty index.
+
+        Args:
+            loader (callable): Called with a table name to get the `parent`, `key` and `last_updated` of all of its
+                rows.
+
+        """
+        self.__loader = loader
+        self.__tables = {}
+
+    def __table(self, table):
+        """Gets the index of a table, loading it if it has not been used before.
+
+        Returns:
+            dict: The last_updated time of each page in the table by key and then parent.
+
+        """
+        pages = self.__tables.get(table)
+        if pages is None:
+            pages = {}
+            for row in self.__loader(table):
+                pages.setdefault(row['key'], {})[row['parent']] = row['last_updated']
+            self.__tables[table] = pages
+            logger.debug('PageIndex: Loaded %d pages from table: %s' % (len(pages), table))
+        return pages
+
+    def get(self, table, parent, k):
+        """Gets the last_updated time of a page.
+
+        Args:
+            table (str): The page table.
+            parent (int): The id of the parent page.
+            k (int): The id of the page.
+
+        Returns:
+            datetime.datetime: The last_updated time of the page, or None if the page is not stored under the parent.
+
+        """
+        return self.__table(table).get(k, {}).get(parent)
+
+    def contains_key(self, table, k):
+        """Checks whether a page is stored under any parent."""
+        return len(self.__table(table).get(k, {})) > 0
+
+    def put(self, table, parent, k, last_updated):
+        """Records that a page has been written."""
+        pages = self.__tables.get(table)
+        if pages is not None:
+            pages.setdefault(k, {})[parent] = last_updated
+
+    def remove(self, table, parent, k=None):
+        """Records that a page (or all of the pages of a parent, if no key is provided) has been deleted."""
+        pages = self.__tables.get(table)
+        if pages is None:
+            return
+        keys = [k] if k is not None else list(pages.keys())
+        for key in keys:
+            parents = pages.get(key)
+            if parents is not None:
+                parents.pop(parent, None)
+                if not parents:
+                    del pages[key]
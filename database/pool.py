@@ -0,0 +1,117 @@
+import contextlib
+import logging
+import threading
+import time
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool(object):
+    """MySQL connection pool.
+
+    This class keeps a number of connections to the database open so that the crawl worker threads can each use their
+    own connection rather than sharing (and serialising on) a single one. A connection that has been idle for a while
+    is checked with a ping before it is handed out, which reconnects it if the server has closed it, and a connection
+    that is lost while in use is discarded so that the next user gets a new one. The pool is safe to share between
+    threads.
+    """
+
+    # The client error codes of a lost connection (server gone away, lost during a query, out of sync).
+    __disconnect_errors = (2006, 2013, 2055)
+
+    def __init__(self, connect, size=4, ping_interval=30):
+        """Creates a pool of connections.
+
+        Args:
+            connect (callable): Called without arguments to open a new connection.
+            size (int): The maximum number of connections that are open at the same time.
+            ping_interval (float): The number of seconds a connection can be idle before it is checked with a ping.
+
+        """
+        self.size = size
+        self.ping_interval = ping_interval
+        self.__connect = connect
+        self.__idle = []
+        self.__lock = threading.Lock()
+        self.__slots = threading.BoundedSemaphore(size)
+
+    def __checkout(self):
+        with self.__lock:
+            if self.__idle:
+                connection, returned = self.__idle.pop()
+            else:
+                connection, returned = None, None
+
+        if connection is None:
+            logger.debug('ConnectionPool: Opening new database connection')
+            return self.__connect()
+        if time.monotonic() - returned >= self.ping_interval:
+            try:
+                connection.ping(reconnect=True)
+            except pymysql.err.Error:
+                logger.warning('ConnectionPool: Database connection lost, opening a new connection')
+                self.__close(connection)
+                return self.__connect()
+        return connection
+
+    def __checkin(self, connection):
+        with self.__lock:
+            self.__idle.append((connection, time.monotonic()))
+
+    @classmethod
+    def __disconnected(cls, error):
+        """Checks whether an error means that the connection has been lost, rather than that a statement failed."""
+        if isinstance(error, pymysql.err.InterfaceError):
+            return True
+        return isinstance(error, pymysql.err.OperationalError) and len(error.args) > 0 and \
+            error.args[0] in cls.__disconnect_errors
+
+    @staticmethod
+    def __close(connection):
+        try:
+            connection.close()
+        except pymysql.err.Error:
+            pass
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Checks out a connection for the exclusive use of the caller.
+
+        The connection is returned to the pool when the block exits. If the block raises an error, the open transaction
+        is rolled back, or the connection is discarded if it has been lost. Other errors (i.e. a deadlock) leave the
+        connection usable, so it is kept.
+
+        Yields:
+            pymysql.connections.Connection: The connection.
+
+        """
+        with self.__slots:
+            connection = self.__checkout()
+            try:
+                yield connection
+            except BaseException as error:
+                if self.__disconnected(error):
+                    self.__close(connection)
+                    raise
+                try:
+                    connection.rollback()
+                except pymysql.err.Error:
+                    self.__close(connection)
+                    raise
+                self.__checkin(connection)
+                raise
+            else:
+                self.__checkin(connection)
+
+    def close(self):
+        """Commits any open transactions and closes all idle connections."""
+        with self.__lock:
+            for connection, returned in self.__idle:
+                try:
+                    connection.commit()
+                except pymysql.err.Error:
+                    logger.error('ConnectionPool: Unable to commit the open transaction of a database connection')
+                self.__close(connection)
+            self.__idle = []
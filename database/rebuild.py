@@ -0,0 +1,104 @@
+import logging
+import os
+import re
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class TableRebuild(object):
+    """Rows collected for the bulk rebuild of a table.
+
+    This class writes the rows of the pages that are rebuilt to a temporary file in the default `LOAD DATA` format (tab
+    separated, backslash escaped), so that they can be loaded into the table in one statement rather than written page
+    by page. The content digests of the pages are held back as well, so that they are only stored once the rows have
+    been loaded. The rebuild is safe to share between threads.
+    """
+
+    __escapes = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r', '\0': '\\0'})
+    __unescapes = {'t': '\t', 'n': '\n', 'r': '\r', '0': '\0'}
+
+    def __init__(self):
+        """Creates an empty rebuild, backed by a new temporary file."""
+        self.__lock = threading.Lock()
+        self.__file = tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', prefix='conflex-',
+                                                  suffix='.tsv', delete=False)
+        self.__digests = {}
+        self.path = self.__file.name
+        self.rows = 0
+
+    @classmethod
+    def escape(cls, value):
+        """Escapes a value for the `LOAD DATA` format."""
+        return str(value).translate(cls.__escapes)
+
+    @classmethod
+    def unescape(cls, field):
+        """Reverses escape."""
+        return re.sub(r'\\(.)', lambda match: cls.__unescapes.get(match.group(1), match.group(1)), field,
+                      flags=re.DOTALL)
+
+    def write(self, parent, rows):
+        """Adds the rows of a parent to the rebuild.
+
+        Args:
+            parent (int): The id of the parent.
+            rows (list): A (key, value, last_updated) tuple for each row of the parent.
+
+        """
+        lines = ''.join('\t'.join((str(parent), self.escape(k), self.escape(value),
+                                   last_updated.strftime('%Y-%m-%d %H:%M:%S'))) + '\n'
+                        for k, value, last_updated in rows)
+        with self.__lock:
+            self.__file.write(lines)
+            self.rows += len(rows)
+
+    def put_digest(self, page_table, k, digest):
+        """Holds back the content digest of a page (None to delete it) until the rows have been loaded."""
+        with self.__lock:
+            self.__digests[(page_table, k)] = digest
+
+    def digests(self):
+        """Gets the held back content digests.
+
+        Returns:
+            list: A (page_table, key, digest) tuple for each page.
+
+        """
+        with self.__lock:
+            return [(page_table, k, digest) for (page_table, k), digest in self.__digests.items()]
+
+    def close(self):
+        """Finishes writing the rows, so that the file can be loaded."""
+        with self.__lock:
+            self.__file.close()
+
+    def read(self, size):
+        """Reads the rows back from the file (which must be closed).
+
+        Args:
+            size (int): The maximum number of rows in each batch.
+
+        Yields:
+            list: Each batch of (parent, key, value, last_updated) tuples.
+
+        """
+        batch = []
+        with open(self.path, encoding='utf-8', newline='') as rows:
+            for line in rows:
+                parent, k, value, last_updated = line[:-1].split('\t')
+                batch.append((int(parent), self.unescape(k), self.unescape(value), last_updated))
+                if len(batch) >= size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def remove(self):
+        """Closes and deletes the file."""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            logger.warning('TableRebuild: Unable to remove file: %s' % self.path)
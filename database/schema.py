@@ -0,0 +1,36 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class SchemaRegistry(object):
+    """Registry of the tables in the database.
+
+    This class reads the tables of the database from the catalog once and then keeps track of the tables that are
+    created, so that checking whether a table exists does not need a catalog query each time. The registry is not
+    thread safe, the DatabaseAPI only uses it while holding its lock.
+    """
+
+    def __init__(self, loader):
+        """Creates a registry.
+
+        Args:
+            loader (callable): Called without arguments to get the set of table names in the database.
+
+        """
+        self.__loader = loader
+        self.__tables = None
+
+    def __load(self):
+        if self.__tables is None:
+            self.__tables = set(self.__loader())
+            logger.debug('SchemaRegistry: Loaded %d tables' % len(self.__tables))
+        return self.__tables
+
+    def exists(self, table):
+        """Checks whether a table exists."""
+        return table in self.__load()
+
+    def add(self, table):
+        """Records that a table has been created."""
+        self.__load().add(table)
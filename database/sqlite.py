@@ -0,0 +1,200 @@
+import datetime
+import logging
+import re
+import sqlite3
+
+from database.backend import Backend
+
+logger = logging.getLogger(__name__)
+
+# TIMESTAMP columns are read back as datetimes, like they are from MySQL.
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.datetime.strptime(value.decode('utf-8')[:19],
+                                                                                 '%Y-%m-%d %H:%M:%S'))
+
+
+class SQLiteCursor(object):
+    """Cursor of a SQLiteConnection, which takes `%s` placeholders and returns the rows as dicts like a DictCursor."""
+
+    def __init__(self, connection, cursor):
+        self.connection = connection
+        self.__cursor = cursor
+
+    @staticmethod
+    def __params(args):
+        if args is None:
+            return ()
+        if not isinstance(args, (list, tuple)):
+            args = (args,)
+        # Times are stored in the same format as MySQL TIMESTAMP columns (without a time zone).
+        return tuple(arg.strftime('%Y-%m-%d %H:%M:%S') if isinstance(arg, datetime.datetime) else arg for arg in args)
+
+    def execute(self, sql, args=None):
+        """Executes a statement.
+
+        Returns:
+            int: The number of rows affected.
+
+        """
+        self.__cursor.execute(sql.replace('%s', '?'), self.__params(args))
+        return self.__cursor.rowcount
+
+    def executemany(self, sql, args):
+        """Executes a statement for each set of arguments.
+
+        Returns:
+            int: The number of rows affected.
+
+        """
+        self.__cursor.executemany(sql.replace('%s', '?'), [self.__params(row) for row in args])
+        return self.__cursor.rowcount
+
+    def fetchone(self):
+        return self.__cursor.fetchone()
+
+    def fetchall(self):
+        return self.__cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self.__cursor)
+
+    def close(self):
+        self.__cursor.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SQLiteConnection(object):
+    """Connection to a SQLite database, with the parts of the pymysql connection interface that the DatabaseAPI uses.
+
+    The database is opened in WAL mode, so that it can be read while it is written to.
+    """
+
+    def __init__(self, path, timeout=30):
+        """Opens a connection.
+
+        Args:
+            path (str): The location of the database file.
+            timeout (float): The number of seconds to wait for another process to release a lock on the database.
+
+        """
+        # The connection is handed between the crawl worker threads by the connection pool, but only used by one
+        # thread at a time.
+        self.__connection = sqlite3.connect(path, timeout=timeout, detect_types=sqlite3.PARSE_DECLTYPES,
+                                            check_same_thread=False)
+        self.__connection.row_factory = lambda cursor, row: {column[0]: value for column, value in
+                                                             zip(cursor.description, row)}
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+
+    @property
+    def in_transaction(self):
+        return self.__connection.in_transaction
+
+    def cursor(self, cursorclass=None):
+        return SQLiteCursor(self, self.__connection.cursor())
+
+    def commit(self):
+        self.__connection.commit()
+
+    def rollback(self):
+        self.__connection.rollback()
+
+    def ping(self, reconnect=False):
+        # A local database file can not be disconnected.
+        pass
+
+    def close(self):
+        self.__connection.close()
+
+
+class SQLiteBackend(Backend):
+    """Embedded SQLite storage backend.
+
+    SQLite allows one writer at a time, so a single connection is shared by the crawl worker threads (the batches are
+    still committed every `commit_every` pages), which avoids waiting on the database lock.
+    """
+
+    pool_size = 1
+
+    def __init__(self, config):
+        """Creates the backend.
+
+        Args:
+            config (dict): The `sqlite` section of the configuration.
+
+        """
+        self.__path = config['path']
+        self.__timeout = config.get('timeout', 30)
+        self.description = 'SQLite database: %s' % self.__path
+
+    def connect(self):
+        return SQLiteConnection(self.__path, self.__timeout)
+
+    def conflict(self, error):
+        # The database stayed locked by another process for longer than the timeout.
+        return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+    def create_table(self, cursor, table, columns, indexes=()):
+        definitions = ["`id` INTEGER PRIMARY KEY AUTOINCREMENT"]
+        # SQLite has no unsigned types.
+        definitions.extend("`" + name + "` " + re.sub(r'\s+UNSIGNED', '', definition) for name, definition in columns)
+        cursor.execute("CREATE TABLE IF NOT EXISTS `" + table + "` (" + ", ".join(definitions) + ")")
+        for name, index_columns, unique in indexes:
+            self.__create_index(cursor, table, name, index_columns, unique)
+
+    @staticmethod
+    def __create_index(cursor, table, name, columns, unique=False):
+        # Index names are shared by all of the tables of a SQLite database, so they are prefixed with the table name.
+        # SQLite can not index a prefix of a column, so the whole column is indexed.
+        columns = [column[0] if isinstance(column, tuple) else column for column in columns]
+        cursor.execute(("CREATE UNIQUE INDEX" if unique else "CREATE INDEX") + " IF NOT EXISTS `" + table + "__" + name +
+                       "` ON `" + table + "` (`" + "`, `".join(columns) + "`)")
+
+    def upsert(self, table, columns, unique, update, changed=None):
+        sql = "INSERT INTO `" + table + "` (`" + "`, `".join(columns) + "`) VALUES (" + \
+              ", ".join(["%s"] * len(columns)) + ") ON CONFLICT (`" + "`, `".join(unique) + "`) DO UPDATE SET " + \
+              ", ".join("`" + column + "`=excluded.`" + column + "`" for column in update)
+        if changed is not None:
+            sql += " WHERE `" + table + "`.`" + changed + "`<>excluded.`" + changed + "`"
+        return sql
+
+    def load_schema(self, cursor):
+        cursor.execute("SELECT `name` FROM `sqlite_master` WHERE `type`='table'")
+        return set(row['name'] for row in cursor.fetchall())
+
+    def indexes(self, cursor, table):
+        cursor.execute("SELECT `name` FROM `sqlite_master` WHERE `type`='index' AND `tbl_name`=%s", table)
+        return set(row['name'][len(table) + 2:] for row in cursor.fetchall() if row['name'].startswith(table + "__"))
+
+    def add_index(self, cursor, table, index, columns, unique=False):
+        if unique:
+            sql = "DELETE FROM `" + table + "` WHERE `id` NOT IN (SELECT MAX(`id`) FROM `" + table + "` GROUP BY `" + \
+                  "`, `".join(columns) + "`)"
+            duplicates = cursor.execute(sql)
+            if duplicates:
+                logger.info("add_index: Removed %d duplicate rows from table: `%s`" % (duplicates, table))
+        self.__create_index(cursor, table, index, columns, unique)
+        cursor.connection.commit()
+
+    def stream_cursor(self, connection):
+        # SQLite cursors already read the rows as they are iterated over.
+        return connection.cursor()
+
+    def create_shadow(self, cursor, table, shadow):
+        cursor.execute("CREATE TABLE `" + shadow + "` AS SELECT * FROM `" + table + "` WHERE 0")
+        self.__create_index(cursor, shadow, 'parent__index', ['parent'])
+
+    def swap_tables(self, cursor, table, shadow, columns):
+        # SQLite can not rename a table over another, but its transactions include schema changes, so the rows are
+        # replaced in a single transaction instead. Readers see the old rows until it is committed.
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM `" + table + "`")
+        columns = "`" + "`, `".join(columns) + "`"
+        cursor.execute("INSERT INTO `" + table + "` (" + columns + ") SELECT " + columns + " FROM `" + shadow + "`")
+        cursor.execute("DROP TABLE `" + shadow + "`")
+        cursor.connection.commit()
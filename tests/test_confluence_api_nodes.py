@@ -0,0 +1,44 @@
+import glob
+import os
+import unittest
+
+from bs4 import BeautifulSoup
+
+from confluence.api import ConfluenceAPI
+
+
+# noinspection PyUnresolvedReferences
+class TestConfluenceAPINodeHandling(unittest.TestCase):
+
+    def setUp(self):
+        self.confluence = ConfluenceAPI
+        self.files = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'data', '**', '*.html'),
+                                      recursive=True))
+
+    def handle(self, content):
+        try:
+            return self.confluence._ConfluenceAPI__recursive_html_handler(content)
+        except Exception as e:
+            return type(e)
+
+    def test_nodes_match_strings(self):
+        # Handling a node in place should give the same output as handling the node turned back into a string.
+        for file in self.files:
+            html_doc = open(file, 'r')
+            html = BeautifulSoup(html_doc.read(), 'html.parser')
+            html_doc.close()
+            for node in html.find_all(True):
+                with self.subTest(file=file, node=node.name):
+                    self.assertEqual(self.handle(node), self.handle(str(node)))
+
+    def test_embedded_list_table(self):
+        html_doc = open('tests/data/tables/embedded_list.html', 'r')
+        html = BeautifulSoup(html_doc.read(), 'html.parser')
+        html_doc.close()
+
+        self.assertEqual(self.handle(html.find('table')), self.handle(str(html.find('table'))))
+        self.assertNotEqual(self.handle(html.find('table')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -35,6 +35,13 @@ class TestConfluenceAPIPageRetrieval(unittest.TestCase):
             125700626: {'last_updated': datetime.datetime(2017, 7, 27, 10, 41, 8, tzinfo=tzoffset(None, 43200)),
                         'name': 'Decision log'}})
 
+    def test_application_retrieve_children_with_title(self):
+        # Gets the children of the REFARCH space filtered on the server by title.
+        child_pages = ConfluenceAPI.get_child_pages(87201717, title='Reference Architecture')
+
+        self.assertEqual(list(child_pages.keys()), [63147993])
+        self.assertEqual(child_pages[63147993]['name'], 'Reference Architecture')
+
     def test_space_to_id_conversion(self):
         space_id = ConfluenceAPI.get_homepage_id_of_space('APPLCTN')
 
@@ -0,0 +1,109 @@
+import glob
+import os
+import re
+import unittest
+
+from bs4 import BeautifulSoup, FeatureNotFound
+
+from confluence.api import ConfluenceAPI
+
+
+def parser_installed(parser):
+    try:
+        BeautifulSoup('', parser)
+        return True
+    except FeatureNotFound:
+        return False
+
+
+# noinspection PyUnresolvedReferences
+class TestConfluenceAPIParserParity(unittest.TestCase):
+
+    def setUp(self):
+        self.confluence = ConfluenceAPI
+        self.files = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'data', '**', '*.html'),
+                                      recursive=True))
+
+    @staticmethod
+    def variants(content):
+        """The content as it is, without the whitespace between the tags (as the wiki returns it), and with a single
+        space between the tags."""
+        return [content, re.sub('>\\s+<', '><', content.replace('\n', '')), re.sub('>\\s*<', '> <', content)]
+
+    @staticmethod
+    def titles(content):
+        """Every panel (bold) and heading title in the content, so that every section of the fixtures is extracted."""
+        html = BeautifulSoup(content, 'html.parser')
+        panels = sorted(set(node.string for node in html.find_all('b') if node.string))
+        headings = sorted(set(node.string for node in html.find_all(['h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'p', 'th'])
+                              if node.string and node.string.strip()))
+        return panels, headings
+
+    def extract(self, parser):
+        self.confluence.set_html_parser(parser)
+        extracted = {}
+        for file in self.files:
+            html_doc = open(file, 'r')
+            content = html_doc.read()
+            html_doc.close()
+            panels, headings = self.titles(content)
+            for variant in self.variants(content):
+                information = [self.confluence.get_page(variant, 'page')]
+                # Each extractor is run on the content as it is and on a parsed document.
+                for document in [variant, self.confluence.parse_content(variant)]:
+                    for panel in panels:
+                        information.append(self.confluence.get_panel(document, panel, 65013279))
+                    for heading in headings:
+                        information.append(self.confluence.get_heading(document, heading))
+                    information.append(self.confluence.get_panels(document, panels, 65013279))
+                    information.append(self.confluence.get_headings(document, headings))
+                # The page properties are the cells of a master details response.
+                information.append(self.confluence._ConfluenceAPI__extract_page_properties(
+                    {'renderedHeadings': ['<b>Content</b>', ' Title '],
+                     'detailLines': [{'details': [variant, ' <p>' + file + '</p>']}]}))
+                extracted[file, variant] = information
+        return extracted
+
+    def assert_parity(self, parser):
+        expected = self.extract('html.parser')
+        extracted = self.extract(parser)
+        for key in expected:
+            with self.subTest(file=key[0]):
+                self.assertEqual(extracted[key], expected[key])
+
+    def assert_section_parity(self, parser):
+        content = '<h2>T</h2> <p>x</p><p><b>P</b></p>\n <p>y</p>'
+        self.confluence.set_html_parser('html.parser')
+        expected = [self.confluence.get_heading(content, 'T'), self.confluence.get_panel(content, 'P', 65013279)]
+        self.confluence.set_html_parser(parser)
+        self.assertEqual([self.confluence.get_heading(content, 'T'), self.confluence.get_panel(content, 'P', 65013279)],
+                         expected)
+        self.assertEqual(expected[0], {'T': ['']})
+
+    @unittest.skipUnless(parser_installed('lxml'), 'lxml is not installed')
+    def test_lxml_parity(self):
+        self.assert_parity('lxml')
+
+    @unittest.skipUnless(parser_installed('lxml'), 'lxml is not installed')
+    def test_lxml_whitespace_section_parity(self):
+        self.assert_section_parity('lxml')
+
+    @unittest.skipUnless(parser_installed('html5lib'), 'html5lib is not installed')
+    def test_html5lib_parity(self):
+        self.assert_parity('html5lib')
+
+    @unittest.skipUnless(parser_installed('html5lib'), 'html5lib is not installed')
+    def test_html5lib_whitespace_section_parity(self):
+        self.assert_section_parity('html5lib')
+
+    def test_unknown_parser_falls_back(self):
+        self.confluence.set_html_parser('unknown')
+
+        self.assertEqual(self.confluence.html_parser, 'html.parser')
+
+    def tearDown(self):
+        self.confluence.set_html_parser('html.parser')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import datetime
+import unittest
+from unittest import mock
+
+from confluence.api import ConfluenceAPI
+
+
+def page(page_id):
+    return {'id': str(page_id), 'title': 'Page %d' % page_id,
+            'version': {'when': '2017-07-27T10:41:08.000+12:00', 'number': 1},
+            'metadata': {'labels': {'results': [{'name': 'application'}]}},
+            'body': {'view': {'value': '<p>%d</p>' % page_id}}, '_links': {'webui': '/pages/%d' % page_id}}
+
+
+class TestConfluenceAPISearch(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+
+    def responses(self, pages):
+        """Serves the results in pages of the given sizes, which can be smaller than the limit asked for."""
+        def request(api_endpoint, content_id, url_params):
+            self.requests.append(url_params)
+            start = url_params['start']
+            for number, results in enumerate(pages):
+                if start == 0:
+                    links = {'base': 'https://wiki'}
+                    if number < len(pages) - 1:
+                        links['next'] = '/rest/api/content/search?start=%d' % (url_params['start'] + len(results))
+                    return {'results': [page(page_id) for page_id in results], 'size': len(results),
+                            'limit': url_params['limit'], '_links': links}
+                start -= len(results)
+            return {'results': [], 'size': 0, 'limit': url_params['limit'], '_links': {'base': 'https://wiki'}}
+        return request
+
+    def test_search_follows_next_links(self):
+        with mock.patch.object(ConfluenceAPI, '_ConfluenceAPI__make_rest_request',
+                               side_effect=self.responses([[1, 2], [3], [4, 5]])):
+            pages = ConfluenceAPI.search('parent = 1')
+
+        self.assertEqual(sorted(pages.keys()), [1, 2, 3, 4, 5])
+        self.assertEqual([request['start'] for request in self.requests], [0, 2, 3])
+        self.assertEqual(pages[3]['labels'], ['application'])
+
+    def test_existing_page_ids_follows_next_links(self):
+        with mock.patch.object(ConfluenceAPI, '_ConfluenceAPI__make_rest_request',
+                               side_effect=self.responses([[1], [3]])):
+            existing = ConfluenceAPI.get_existing_page_ids([1, 2, 3])
+
+        self.assertEqual(existing, {1, 3})
+
+    def test_failed_search_raises(self):
+        with mock.patch.object(ConfluenceAPI, '_ConfluenceAPI__make_rest_request', return_value=None):
+            with self.assertRaises(ValueError):
+                ConfluenceAPI.search('parent = 1')
+
+    def test_modified_since_in_wiki_timezone(self):
+        since = datetime.datetime(2017, 7, 27, 22, 30, tzinfo=datetime.timezone.utc)
+        with mock.patch.object(ConfluenceAPI, 'search', return_value={}) as search:
+            ConfluenceAPI.get_pages_modified_since('APPLCTN', since, datetime.timezone(datetime.timedelta(hours=12)))
+
+        self.assertIn('lastmodified >= "2017/07/28 10:30"', search.call_args[0][0])
+
+    def test_missing_page_properties_raise(self):
+        with mock.patch.object(ConfluenceAPI, '_ConfluenceAPI__make_master_detail_request', return_value=None):
+            with self.assertRaises(ValueError):
+                ConfluenceAPI.get_page_properties(1, 'APPLCTN', ['application'])
+
+
+if __name__ == '__main__':
+    unittest.main()
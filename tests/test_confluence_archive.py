@@ -0,0 +1,56 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from confluence.archive import PageArchive
+
+
+class TestPageArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'archive.db')
+        self.record = {'name': 'Web Single Sign On',
+                       'last_updated': datetime.datetime(2018, 5, 1, 10, 30, tzinfo=datetime.timezone.utc),
+                       'version': 3,
+                       'labels': ['application'],
+                       'content': '<p>Single Sign On</p>',
+                       'links': {'webui': '/display/APPLCTN/Web+Single+Sign+On', 'base': 'https://wiki'}}
+
+    def test_page_round_trip(self):
+        archive = PageArchive(self.path)
+        archive.put_page(112771136, self.record)
+        archive.close()
+
+        archive = PageArchive(self.path)
+        self.assertEqual(archive.get_page(112771136), self.record)
+        self.assertEqual(archive.get_page(112771136, 3), self.record)
+        self.assertIsNone(archive.get_page(112771136, 2))
+        self.assertIsNone(archive.get_page(1))
+        archive.close()
+
+    def test_latest_version(self):
+        archive = PageArchive(self.path)
+        archive.put_page(112771136, self.record)
+        archive.put_page(112771136, {**self.record, 'version': 4, 'content': '<p>Web SSO</p>'})
+        archive.put_page(112771136, {**self.record, 'version': 2, 'content': '<p>SSO</p>'})
+
+        self.assertEqual(archive.get_page(112771136)['content'], '<p>Web SSO</p>')
+        self.assertEqual(archive.get_page(112771136, 3)['content'], '<p>Single Sign On</p>')
+        archive.close()
+
+    def test_response_round_trip(self):
+        archive = PageArchive(self.path)
+        archive.put_response('key', b'{"detailLines": []}')
+
+        self.assertEqual(archive.get_response('key'), b'{"detailLines": []}')
+        self.assertIsNone(archive.get_response('missing'))
+        archive.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
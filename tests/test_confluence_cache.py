@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+
+from confluence.cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'cache.db')
+
+    def test_response_round_trip(self):
+        cache = ResponseCache(self.path)
+        key = ResponseCache.key('api', 'content', '112771136', {'expand': 'body.view'})
+        cache.put(key, '"abc"', 'Wed, 21 Oct 2015 07:28:00 GMT', b'{"id": "112771136"}')
+        cache.close()
+
+        cache = ResponseCache(self.path)
+        self.assertEqual(cache.get(key), ('"abc"', 'Wed, 21 Oct 2015 07:28:00 GMT', b'{"id": "112771136"}'))
+        self.assertIsNone(cache.get(ResponseCache.key('api', 'content', '112771136', {})))
+        cache.close()
+
+    def test_least_recently_used_evicted(self):
+        body = os.urandom(400)
+        cache = ResponseCache(self.path, 1000)
+        cache.put('one', '1', None, body)
+        cache.put('two', '2', None, body)
+        cache.get('one')
+        cache.put('three', '3', None, body)
+
+        self.assertIsNotNone(cache.get('one'))
+        self.assertIsNone(cache.get('two'))
+        self.assertIsNotNone(cache.get('three'))
+        cache.close()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import glob
+import os
+import unittest
+
+from confluence.api import ConfluenceAPI
+from confluence.document import PageDocument
+
+
+class TestPageDocument(unittest.TestCase):
+    panels = ['Info', 'Overview', 'Roadmap', 'Infrastructure', 'Stakeholders', 'Support', 'Missing']
+    headings = ['Key Locations', 'Servers', 'Overview', 'Definition', 'Missing']
+
+    def setUp(self):
+        self.files = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'data', '**', '*.html'),
+                                      recursive=True))
+
+    def test_sections_match_find(self):
+        # Finding all of the sections in one pass should find the same nodes as searching for each title.
+        for file in self.files:
+            html_doc = open(file, 'r')
+            document = PageDocument(html_doc.read())
+            html_doc.close()
+            sections = document.find_sections(self.panels, self.headings)
+            with self.subTest(file=file):
+                for panel in self.panels:
+                    title = document.html.find('b', string=panel)
+                    if title is None:
+                        self.assertNotIn(panel, sections['panels'])
+                    else:
+                        self.assertIs(sections['panels'][panel], title.parent.next_sibling)
+                for heading in self.headings:
+                    title = document.html.find(string=heading)
+                    if title is None:
+                        self.assertNotIn(heading, sections['headings'])
+                    else:
+                        self.assertIs(sections['headings'][heading], title.parent.next_sibling)
+
+    def test_sections_are_kept(self):
+        html_doc = open('tests/data/web_single_sign_on.html', 'r')
+        document = PageDocument(html_doc.read())
+        html_doc.close()
+
+        self.assertEqual(list(document.find_sections(['Info', 'Stakeholders'])['panels'].keys()),
+                         ['Info', 'Stakeholders'])
+        self.assertEqual(list(document.find_sections(['Stakeholders'])['panels'].keys()), ['Stakeholders'])
+        self.assertEqual(document.find_sections(headings=['Missing']), {'panels': {}, 'headings': {}})
+
+    def test_multiple_panels_match_single_panels(self):
+        html_doc = open('tests/data/web_single_sign_on.html', 'r')
+        content = html_doc.read()
+        html_doc.close()
+        single = {}
+        for panel in self.panels:
+            single.update(ConfluenceAPI.get_panel(content, panel, 65013279))
+
+        self.assertEqual(ConfluenceAPI.get_panels(content, self.panels, 65013279), single)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import re
+import unittest
+
+from confluence.extraction import PageExtractor, extract_page_rows, flatten_information, page_digest
+
+
+class TestPageExtraction(unittest.TestCase):
+    plan = [('panels', ['Info', 'Stakeholders']), ('headings', ['Key Locations']), ('page', None)]
+
+    def setUp(self):
+        html_doc = open('tests/data/web_single_sign_on.html', 'r')
+        self.content = re.sub('>\\s+<', '><', html_doc.read().replace('\n', ''))
+        html_doc.close()
+
+    def test_flatten_information(self):
+        rows = flatten_information({'Info': [{'Type': ['Application'], 'Platform': ['Java', 'Linux']}]})
+
+        self.assertEqual(sorted(rows), [('Info:Platform', 'Java'), ('Info:Platform', 'Linux'),
+                                        ('Info:Type', 'Application')])
+
+    def test_serial_extraction(self):
+        PageExtractor.setup({})
+        extracted = PageExtractor.extract(self.content, self.plan, 65013279, 'Web Single Sign On')
+
+        self.assertEqual(list(extracted.keys()), ['panels', 'headings', 'page'])
+        self.assertIn(('Info:Platform', 'Java'), extracted['panels'])
+
+    def test_worker_extraction_matches_serial(self):
+        PageExtractor.setup({'sync': {'extraction_workers': 2}})
+        extracted = PageExtractor.extract(self.content, self.plan, 65013279, 'Web Single Sign On')
+
+        self.assertEqual(extracted, extract_page_rows(self.content, self.plan, 65013279, 'Web Single Sign On'))
+
+    def test_page_digest(self):
+        node_config = {'panels': ['Info'], 'pages': {'titles': {'Child': {'page': None}}}}
+        digest = page_digest(self.content, 'Web Single Sign On', node_config)
+
+        # The configuration of the child pages does not change the information of the page.
+        self.assertEqual(digest, page_digest(self.content, 'Web Single Sign On', {'panels': ['Info']}))
+        self.assertNotEqual(digest, page_digest(self.content, 'Web Single Sign On', {'panels': ['Info', 'Support']}))
+        self.assertNotEqual(digest, page_digest(self.content + '<p>x</p>', 'Web Single Sign On', node_config))
+        self.assertNotEqual(digest, page_digest(self.content, 'Web SSO', node_config))
+
+    def test_page_digest_labels(self):
+        node_config = {'page_properties': ['inv_item_info']}
+        digest = page_digest(self.content, 'Web Single Sign On', node_config, ['application', 'inv_item_info'])
+
+        # The page properties depend on the labels of the page, but not on their order.
+        self.assertEqual(digest, page_digest(self.content, 'Web Single Sign On', node_config,
+                                             ['inv_item_info', 'application']))
+        self.assertNotEqual(digest, page_digest(self.content, 'Web Single Sign On', node_config, ['application']))
+
+    def tearDown(self):
+        PageExtractor.teardown()
+
+
+if __name__ == '__main__':
+    unittest.main()
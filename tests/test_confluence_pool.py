@@ -0,0 +1,63 @@
+import threading
+import unittest
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib import error
+
+from confluence.pool import ConnectionPool
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_GET(self):
+        KeepAliveHandler.connections.add(self.client_address)
+        status = 404 if self.path.endswith('/missing') else 200
+        body = b'{"path": "' + self.path.encode('utf-8') + b'"}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), KeepAliveHandler)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+
+    def setUp(self):
+        KeepAliveHandler.connections.clear()
+        self.pool = ConnectionPool('http://127.0.0.1:%d/wiki' % self.server.server_port, 2, 5)
+
+    def test_connection_reused(self):
+        for i in range(5):
+            self.assertEqual(self.pool.get_response('/rest/api/content/' + str(i))[2],
+                             b'{"path": "/wiki/rest/api/content/' + str(i).encode('utf-8') + b'"}')
+
+        self.assertEqual(len(KeepAliveHandler.connections), 1)
+
+    def test_http_error_raised(self):
+        with self.assertRaises(error.HTTPError) as context:
+            self.pool.get_response('/missing')
+
+        self.assertEqual(context.exception.code, 404)
+
+    def tearDown(self):
+        self.pool.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from confluence.ratelimit import AdaptiveRateLimiter
+
+
+class TestAdaptiveRateLimiter(unittest.TestCase):
+
+    def test_throttle_halves_limits(self):
+        limiter = AdaptiveRateLimiter(10, 8)
+        limiter.acquire()
+        limiter.release(0.1, 429)
+
+        self.assertEqual(limiter.rate, 5)
+        self.assertEqual(limiter.concurrency, 4)
+
+    def test_healthy_responses_increase_limits(self):
+        limiter = AdaptiveRateLimiter(100, 8, cooldown=0)
+        limiter.acquire()
+        limiter.release(0.1, 503)
+        for i in range(20):
+            limiter.acquire()
+            limiter.release(0.1, 200)
+
+        self.assertGreater(limiter.rate, 50)
+        self.assertGreater(limiter.concurrency, 4)
+        self.assertLessEqual(limiter.concurrency, 8)
+
+    def test_rising_latency_decreases_limits(self):
+        limiter = AdaptiveRateLimiter(1000, 8)
+        for i in range(10):
+            limiter.acquire()
+            limiter.release(0.1, 200)
+        limiter.acquire()
+        limiter.release(1.0, 200)
+
+        self.assertEqual(limiter.concurrency, 4)
+
+    def test_retry_after_parsed(self):
+        self.assertEqual(AdaptiveRateLimiter._AdaptiveRateLimiter__parse_retry_after('2'), 2.0)
+        self.assertEqual(AdaptiveRateLimiter._AdaptiveRateLimiter__parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'),
+                         0.0)
+        self.assertEqual(AdaptiveRateLimiter._AdaptiveRateLimiter__parse_retry_after(None), 0.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import datetime
+import unittest
+
+from database.index import PageIndex
+
+
+class TestPageIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.time = datetime.datetime(2018, 5, 1, 10, 30)
+        self.loaded = []
+        self.rows = {'wiki_app': [{'parent': 1, 'key': 10, 'last_updated': self.time},
+                                  {'parent': 2, 'key': 10, 'last_updated': self.time},
+                                  {'parent': 1, 'key': 11, 'last_updated': self.time}]}
+
+    def load(self, table):
+        self.loaded.append(table)
+        return self.rows.get(table, [])
+
+    def test_lookups_load_table_once(self):
+        index = PageIndex(self.load)
+
+        self.assertEqual(index.get('wiki_app', 1, 10), self.time)
+        self.assertEqual(index.get('wiki_app', 2, 10), self.time)
+        self.assertIsNone(index.get('wiki_app', 2, 11))
+        self.assertTrue(index.contains_key('wiki_app', 11))
+        self.assertFalse(index.contains_key('wiki_app', 12))
+        self.assertIsNone(index.get('wiki_other', 1, 10))
+        self.assertEqual(self.loaded, ['wiki_app', 'wiki_other'])
+
+    def test_writes_update_loaded_tables(self):
+        index = PageIndex(self.load)
+        index.get('wiki_app', 1, 10)
+        later = self.time + datetime.timedelta(days=1)
+
+        index.put('wiki_app', 1, 10, later)
+        index.put('wiki_app', 3, 12, later)
+        index.remove('wiki_app', 2, 10)
+        index.remove('wiki_app', 1)
+
+        self.assertIsNone(index.get('wiki_app', 1, 10))
+        self.assertFalse(index.contains_key('wiki_app', 10))
+        self.assertFalse(index.contains_key('wiki_app', 11))
+        self.assertEqual(index.get('wiki_app', 3, 12), later)
+
+    def test_writes_to_unloaded_tables_ignored(self):
+        index = PageIndex(self.load)
+        index.put('wiki_app', 3, 12, self.time)
+        index.remove('wiki_app', 1, 10)
+
+        # The table is read as it is stored when it is first used.
+        self.assertIsNone(index.get('wiki_app', 3, 12))
+        self.assertEqual(index.get('wiki_app', 1, 10), self.time)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import threading
+import unittest
+
+import pymysql
+
+from database.pool import ConnectionPool
+
+
+class FakeConnection(object):
+    """Stands in for a pymysql connection, recording the calls made on it."""
+
+    def __init__(self):
+        self.calls = []
+
+    def ping(self, reconnect=False):
+        self.calls.append('ping')
+
+    def commit(self):
+        self.calls.append('commit')
+
+    def rollback(self):
+        self.calls.append('rollback')
+
+    def close(self):
+        self.calls.append('close')
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.connections = []
+
+    def connect(self):
+        connection = FakeConnection()
+        self.connections.append(connection)
+        return connection
+
+    def test_connections_reused(self):
+        pool = ConnectionPool(self.connect, 2, ping_interval=0)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(len(self.connections), 1)
+        # The idle connection is checked before it is used again.
+        self.assertEqual(first.calls, ['ping'])
+
+    def test_concurrent_users_get_own_connection(self):
+        pool = ConnectionPool(self.connect, 2)
+        used = []
+        barrier = threading.Barrier(2)
+
+        def use():
+            with pool.connection() as connection:
+                used.append(connection)
+                barrier.wait(5)
+
+        threads = [threading.Thread(target=use) for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertIsNot(used[0], used[1])
+
+    def test_lost_connection_discarded(self):
+        pool = ConnectionPool(self.connect, 1)
+        with self.assertRaises(pymysql.err.OperationalError):
+            with pool.connection():
+                raise pymysql.err.OperationalError(2006, 'MySQL server has gone away')
+        with pool.connection() as connection:
+            pass
+
+        self.assertEqual(self.connections[0].calls, ['close'])
+        self.assertIs(connection, self.connections[1])
+
+    def test_deadlocked_connection_kept(self):
+        pool = ConnectionPool(self.connect, 1)
+        with self.assertRaises(pymysql.err.OperationalError):
+            with pool.connection():
+                raise pymysql.err.OperationalError(1213, 'Deadlock found when trying to get lock')
+        with pool.connection() as connection:
+            pass
+
+        self.assertIs(connection, self.connections[0])
+        self.assertEqual(connection.calls, ['rollback'])
+
+    def test_failed_transaction_rolled_back(self):
+        pool = ConnectionPool(self.connect, 1)
+        with self.assertRaises(ValueError):
+            with pool.connection():
+                raise ValueError()
+        pool.close()
+
+        self.assertEqual(self.connections[0].calls, ['rollback', 'commit', 'close'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import datetime
+import os
+import unittest
+
+from database.rebuild import TableRebuild
+
+
+class TestTableRebuild(unittest.TestCase):
+
+    def setUp(self):
+        self.rebuild = TableRebuild()
+
+    def tearDown(self):
+        self.rebuild.remove()
+
+    def test_rows_read_back(self):
+        last_updated = datetime.datetime(2019, 5, 1, 12, 30, 15)
+        rows = [('Overview', 'Line one\nLine two\twith a tab', last_updated),
+                ('Path', 'C:\\Program Files\\app', last_updated),
+                ('Empty', '', last_updated),
+                ('Number', 42, last_updated)]
+        self.rebuild.write(101, rows)
+        self.rebuild.write(102, rows[:1])
+        self.rebuild.close()
+
+        read = [row for batch in self.rebuild.read(2) for row in batch]
+        self.assertEqual(self.rebuild.rows, 5)
+        self.assertEqual(read[0], (101, 'Overview', 'Line one\nLine two\twith a tab', '2019-05-01 12:30:15'))
+        self.assertEqual(read[1][2], 'C:\\Program Files\\app')
+        self.assertEqual(read[2][2], '')
+        self.assertEqual(read[3][2], '42')
+        self.assertEqual(read[4][0], 102)
+
+    def test_file_format(self):
+        self.rebuild.write(101, [('key', 'a\tb\\c\n', datetime.datetime(2019, 5, 1))])
+        self.rebuild.close()
+
+        with open(self.rebuild.path, encoding='utf-8') as rows:
+            self.assertEqual(rows.read(), '101\tkey\ta\\tb\\\\c\\n\t2019-05-01 00:00:00\n')
+
+    def test_digests_held_back(self):
+        self.rebuild.put_digest('wiki_app', 101, 'abc')
+        self.rebuild.put_digest('wiki_app', 102, 'def')
+        self.rebuild.put_digest('wiki_app', 102, None)
+
+        self.assertEqual(sorted(self.rebuild.digests(), key=lambda digest: digest[1]),
+                         [('wiki_app', 101, 'abc'), ('wiki_app', 102, None)])
+
+    def test_remove(self):
+        self.rebuild.remove()
+
+        self.assertFalse(os.path.exists(self.rebuild.path))
+
+
+if __name__ == '__main__':
+    unittest.main()
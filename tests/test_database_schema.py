@@ -0,0 +1,33 @@
+import unittest
+
+from database.schema import SchemaRegistry
+
+
+class TestSchemaRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return {'wiki_spaces', 'wiki_app', 'wiki_app__info'}
+
+    def test_catalog_loaded_once(self):
+        registry = SchemaRegistry(self.load)
+
+        self.assertTrue(registry.exists('wiki_spaces'))
+        self.assertTrue(registry.exists('wiki_app__info'))
+        self.assertFalse(registry.exists('wiki_other'))
+        self.assertEqual(self.loads, 1)
+
+    def test_created_tables_recorded(self):
+        registry = SchemaRegistry(self.load)
+        registry.add('wiki_other')
+
+        self.assertTrue(registry.exists('wiki_other'))
+        self.assertTrue(registry.exists('wiki_spaces'))
+        self.assertEqual(self.loads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
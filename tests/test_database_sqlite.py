@@ -0,0 +1,265 @@
+import datetime
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from database.api import DatabaseAPI
+
+
+class TestDatabaseAPISQLite(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        DatabaseAPI.connect({'sqlite': {'path': os.path.join(self.directory, 'conflex.db')},
+                             'mysql': {'table_prefix': 'test', 'fetch_size': 2}})
+        DatabaseAPI.create_spaces_table()
+        DatabaseAPI.create_application_table()
+        DatabaseAPI.create_digests_table()
+        DatabaseAPI.create_table('test_app')
+        DatabaseAPI.create_table('test_app__info', True)
+        self.time = datetime.datetime(2017, 7, 27, 10, 41, 10)
+
+    def tearDown(self):
+        DatabaseAPI.disconnect()
+        shutil.rmtree(self.directory)
+
+    def test_insert_or_update(self):
+        self.assertTrue(DatabaseAPI.insert_or_update('test_app', 1, 123, 'hello', self.time, True))
+        self.assertFalse(DatabaseAPI.insert_or_update('test_app', 1, 123, 'hello', self.time, True))
+        later = self.time + datetime.timedelta(hours=1)
+        self.assertTrue(DatabaseAPI.insert_or_update('test_app', 1, 123, 'changed', later, True))
+
+        rows = DatabaseAPI.select('test_app', 1)
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['value'], 'changed')
+        self.assertEqual(rows[0]['last_updated'], later)
+        self.assertEqual(DatabaseAPI.check_data_exists('test_app', 1, 123)['last_updated'], later)
+        self.assertTrue(DatabaseAPI.check_key_exists('test_app', 123))
+
+    def test_empty_values_not_inserted(self):
+        self.assertFalse(DatabaseAPI.insert_or_update('test_app', 1, 123, 'N/A', self.time, True))
+        self.assertEqual(DatabaseAPI.select('test_app'), [])
+
+    def test_delete(self):
+        DatabaseAPI.insert_or_update('test_app', 1, 123, 'a', self.time, True)
+        DatabaseAPI.insert_or_update('test_app', 1, 124, 'b', self.time, True)
+        DatabaseAPI.insert_or_update('test_app', 2, 125, 'c', self.time, True)
+
+        DatabaseAPI.delete('test_app', 1, 123)
+        self.assertEqual([row['key'] for row in DatabaseAPI.select('test_app', 1)], [124])
+        self.assertIsNone(DatabaseAPI.check_data_exists('test_app', 1, 123))
+        DatabaseAPI.delete('test_app', 1)
+        self.assertEqual([row['key'] for row in DatabaseAPI.select('test_app')], [125])
+
+    def test_sync_only_changes_rows(self):
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time), ('Team', 'Ops', self.time),
+                                                 ('Tier', '1', self.time)], 'test_app', 'abc')
+        before = {row['key']: row for row in DatabaseAPI.select('test_app__info', 123)}
+
+        later = self.time + datetime.timedelta(hours=1)
+        changed = DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', later), ('Team', 'Dev', later),
+                                                           ('Region', 'EU', later)], 'test_app', 'def')
+        after = {row['key']: row for row in DatabaseAPI.select('test_app__info', 123)}
+
+        self.assertEqual(changed, 3)
+        self.assertEqual(sorted(after.keys()), ['Owner', 'Region', 'Team'])
+        self.assertEqual(after['Owner'], before['Owner'])
+        self.assertEqual(after['Team']['id'], before['Team']['id'])
+        self.assertEqual(after['Team']['value'], 'Dev')
+        self.assertEqual(after['Team']['last_updated'], later)
+        self.assertEqual(DatabaseAPI.get_digest('test_app', 123), 'def')
+
+    def test_sync_without_digest_deletes_digest(self):
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time)], 'test_app', 'abc')
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time)], 'test_app', None)
+
+        self.assertIsNone(DatabaseAPI.get_digest('test_app', 123))
+
+    def test_failed_sync_deletes_uncommitted_digests(self):
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time)], 'test_app', 'abc')
+        self.assertTrue(DatabaseAPI.has_digest('test_app', 123))
+        self.assertFalse(DatabaseAPI.has_digest('test_app', 124))
+        DatabaseAPI.disconnect()
+        DatabaseAPI.connect({'sqlite': {'path': os.path.join(self.directory, 'conflex.db')},
+                             'mysql': {'table_prefix': 'test', 'commit_every': 2}})
+
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Bob', self.time)], 'test_app', 'def')
+        with self.assertRaises(sqlite3.OperationalError):
+            DatabaseAPI.sync('test_app_missing__info', 124, [('Owner', 'Cy', self.time)], 'test_app', 'def')
+
+        # The uncommitted batch is rolled back, and its page is extracted again on the next run.
+        self.assertEqual(DatabaseAPI.select('test_app__info', 123)[0]['value'], 'Ann')
+        self.assertIsNone(DatabaseAPI.get_digest('test_app', 123))
+        self.assertFalse(DatabaseAPI.has_digest('test_app', 123))
+
+    def test_sync_queues_batches(self):
+        DatabaseAPI.disconnect()
+        path = os.path.join(self.directory, 'conflex.db')
+        DatabaseAPI.connect({'sqlite': {'path': path}, 'mysql': {'table_prefix': 'test', 'commit_every': 2}})
+
+        self.assertEqual(DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time)], 'test_app', 'abc'), 0)
+        # Queued batches are not written, so no transaction is left open on the pooled connection.
+        self.assertEqual(DatabaseAPI.select('test_app__info'), [])
+        self.assertEqual(DatabaseAPI.sync('test_app__info', 124, [('Owner', 'Bob', self.time)], 'test_app', 'abc'), 2)
+        DatabaseAPI.sync('test_app__info', 125, [('Owner', 'Cy', self.time)], 'test_app', 'abc')
+        self.assertEqual(DatabaseAPI.flush(), 1)
+
+        database = sqlite3.connect(path)
+        self.assertEqual(database.execute("SELECT COUNT(*) FROM `test_app__info`").fetchone()[0], 3)
+        database.close()
+        self.assertTrue(DatabaseAPI.has_digest('test_app', 125))
+
+    def test_failed_sync_concurrent_with_digest_check(self):
+        results = []
+
+        def failing_sync():
+            for parent in range(200):
+                try:
+                    DatabaseAPI.sync('test_app_missing__info', parent, [('Owner', 'Ann', self.time)], 'test_app', 'a')
+                except sqlite3.OperationalError:
+                    results.append(parent)
+
+        def digest_check():
+            for table in range(200):
+                DatabaseAPI.has_digest('test_table_%d' % table, 1)
+
+        threads = [threading.Thread(target=failing_sync, daemon=True),
+                   threading.Thread(target=digest_check, daemon=True)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+
+        self.assertFalse(any(thread.is_alive() for thread in threads))
+        self.assertEqual(len(results), 200)
+
+    def test_stream(self):
+        for k in range(5):
+            DatabaseAPI.insert_or_update('test_app', 1 + k % 2, 100 + k, str(k), self.time, True)
+
+        self.assertEqual([row['key'] for row in DatabaseAPI.stream('test_app')], [100, 101, 102, 103, 104])
+        self.assertEqual([row['key'] for row in DatabaseAPI.stream('test_app', 1)], [100, 102, 104])
+        self.assertEqual(len(list(DatabaseAPI.stream('test_app', order_by=None))), 5)
+
+    def test_rebuild(self):
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time)], 'test_app', 'abc')
+        DatabaseAPI.sync('test_app__info', 124, [('Owner', 'Bob', self.time)], 'test_app', 'abc')
+        DatabaseAPI.sync('test_app__info', 125, [('Owner', 'Cy', self.time)], 'test_app', 'abc')
+
+        DatabaseAPI.begin_rebuild(['test_app__info'])
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann\tand\nAl', self.time), ('Team', 'Ops', self.time)],
+                         'test_app', 'def')
+        DatabaseAPI.sync('test_app__info', 124, [], 'test_app', None)
+        # The table is left as it is until the rebuild is finished.
+        self.assertEqual(len(DatabaseAPI.select('test_app__info', 123)), 1)
+        self.assertEqual(DatabaseAPI.get_digest('test_app', 123), 'abc')
+        DatabaseAPI.finish_rebuild()
+
+        rows = {(row['parent'], row['key']): row['value'] for row in DatabaseAPI.select('test_app__info')}
+        self.assertEqual(rows, {(123, 'Owner'): 'Ann\tand\nAl', (123, 'Team'): 'Ops', (125, 'Owner'): 'Cy'})
+        self.assertEqual(DatabaseAPI.get_digest('test_app', 123), 'def')
+        self.assertIsNone(DatabaseAPI.get_digest('test_app', 124))
+
+    def test_abort_rebuild(self):
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time)], 'test_app', 'abc')
+
+        DatabaseAPI.begin_rebuild(['test_app__info'])
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Bob', self.time)], 'test_app', 'def')
+        DatabaseAPI.abort_rebuild()
+
+        self.assertEqual(DatabaseAPI.select('test_app__info', 123)[0]['value'], 'Ann')
+        self.assertEqual(DatabaseAPI.get_digest('test_app', 123), 'abc')
+
+    def test_failed_rebuild_does_not_stop_others(self):
+        DatabaseAPI.create_table('test_app_child__info', True)
+        DatabaseAPI.begin_rebuild(['test_app__info', 'test_app_child__info'])
+        DatabaseAPI.sync('test_app__info', 123, [('Owner', 'Ann', self.time)], 'test_app', 'abc')
+        DatabaseAPI.sync('test_app_child__info', 200, [('Owner', 'Bob', self.time)], 'test_app_child', 'def')
+        # The first table is dropped, so it can not be rebuilt.
+        connection = sqlite3.connect(os.path.join(self.directory, 'conflex.db'))
+        connection.execute("DROP TABLE `test_app__info`")
+        connection.commit()
+        connection.close()
+
+        with self.assertRaises(sqlite3.OperationalError):
+            DatabaseAPI.finish_rebuild()
+
+        self.assertEqual(DatabaseAPI.select('test_app_child__info', 200)[0]['value'], 'Bob')
+        self.assertEqual(DatabaseAPI.get_digest('test_app_child', 200), 'def')
+        self.assertIsNone(DatabaseAPI.get_digest('test_app', 123))
+
+    def test_orphans(self):
+        DatabaseAPI.create_table('test_app_child')
+        DatabaseAPI.insert_or_update('test_app', 1, 123, 'parent', self.time, True)
+        DatabaseAPI.insert_or_update('test_app_child', 123, 200, 'child', self.time, True)
+        DatabaseAPI.insert_or_update('test_app_child', 999, 201, 'orphan', self.time, True)
+
+        self.assertEqual([row['key'] for row in DatabaseAPI.select_orphans('test_app_child', 'test_app')], [201])
+
+    def test_spaces_and_application(self):
+        DatabaseAPI.update_spaces(65013279, 'APPLCTN', self.time)
+        DatabaseAPI.update_spaces(65013279, 'APPLCTN', self.time + datetime.timedelta(days=1))
+        self.assertEqual(DatabaseAPI.get_spaces()[0]['last_updated'], self.time + datetime.timedelta(days=1))
+
+        self.assertIsNone(DatabaseAPI.update_conflex_application('last_config_change', '1.5'))
+        self.assertEqual(DatabaseAPI.update_conflex_application('last_config_change', '2.5')['value'], '1.5')
+        self.assertEqual(DatabaseAPI.get_conflex_application('last_config_change')['value'], '2.5')
+
+    def test_migrate_new_database(self):
+        DatabaseAPI.migrate(['test_app', 'test_missing'])
+
+        self.assertEqual(DatabaseAPI.get_conflex_application('schema_version')['value'], '2')
+
+    def test_migrate_existing_tables(self):
+        DatabaseAPI.disconnect()
+        path = os.path.join(self.directory, 'old.db')
+        database = sqlite3.connect(path)
+        database.execute("CREATE TABLE `old_app` (`id` INTEGER PRIMARY KEY AUTOINCREMENT, `parent` INT, `key` INT, "
+                         "`value` TEXT, `last_updated` TIMESTAMP)")
+        database.execute("CREATE TABLE `old_app__info` (`id` INTEGER PRIMARY KEY AUTOINCREMENT, `parent` INT, "
+                         "`key` VARCHAR(512), `value` TEXT, `last_updated` TIMESTAMP)")
+        # Tables and views outside of the configured page trees are left alone.
+        database.execute("CREATE TABLE `old_other` (`id` INTEGER PRIMARY KEY AUTOINCREMENT, `parent` INT, `key` INT)")
+        database.execute("CREATE VIEW `old_view` AS SELECT * FROM `old_app`")
+        database.executemany("INSERT INTO `old_app` (`parent`, `key`, `value`) VALUES (?, ?, ?)",
+                             [(1, 123, 'old'), (1, 123, 'new'), (1, 124, 'other')])
+        database.commit()
+        database.close()
+
+        DatabaseAPI.connect({'sqlite': {'path': path}, 'mysql': {'table_prefix': 'old'}})
+        DatabaseAPI.create_application_table()
+        DatabaseAPI.migrate(['old_app'])
+        DatabaseAPI.migrate(['old_app'])
+
+        database = sqlite3.connect(path)
+        indexes = set(row[0] for row in database.execute("SELECT `name` FROM `sqlite_master` WHERE `type`='index'"))
+        database.close()
+        self.assertIn('old_app__parent_key__unique', indexes)
+        self.assertIn('old_app__info__parent_key__index', indexes)
+        self.assertFalse(any(index.startswith('old_other') for index in indexes))
+
+        # A table that is added to the configuration later is upgraded when it is first used.
+        DatabaseAPI.create_table('old_other')
+        database = sqlite3.connect(path)
+        indexes = set(row[0] for row in database.execute("SELECT `name` FROM `sqlite_master` WHERE `type`='index'"))
+        database.close()
+        self.assertIn('old_other__parent_key__unique', indexes)
+        self.assertEqual(sorted((row['key'], row['value']) for row in DatabaseAPI.select('old_app')),
+                         [(123, 'new'), (124, 'other')])
+        self.assertEqual(DatabaseAPI.get_conflex_application('schema_version')['value'], '2')
+
+    def test_tables_found_on_reconnect(self):
+        DatabaseAPI.insert_or_update('test_app', 1, 123, 'hello', self.time, True)
+        DatabaseAPI.disconnect()
+        DatabaseAPI.connect({'sqlite': {'path': os.path.join(self.directory, 'conflex.db')},
+                             'mysql': {'table_prefix': 'test'}})
+
+        DatabaseAPI.create_table('test_app')
+        self.assertTrue(DatabaseAPI.check_key_exists('test_app', 123))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,305 @@
+import datetime
+import importlib.util
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from confluence.api import ConfluenceAPI
+from database.api import DatabaseAPI
+
+
+def load_main():
+    """Loads the application module, which can not be imported by its name (__main__)."""
+    spec = importlib.util.spec_from_file_location('conflex_main',
+                                                  os.path.join(os.path.dirname(__file__), '..', '__main__.py'))
+    main = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(main)
+    # The logger is only created when the application is run.
+    main.logger = logging.getLogger('conflex')
+    return main
+
+
+class Wiki(object):
+    """A fake wiki, whose pages are served through mocked ConfluenceAPI methods."""
+
+    def __init__(self):
+        self.pages = {}
+        self.modified = set()
+
+    def add(self, page_id, parent, name, labels=(), content='', properties=None):
+        self.pages[page_id] = {'parent': parent, 'name': name, 'labels': list(labels), 'content': content,
+                               'properties': properties or {}, 'version': 1}
+
+    def edit(self, page_id, **changes):
+        self.pages[page_id].update(changes)
+        self.pages[page_id]['version'] += 1
+
+    def remove(self, page_id):
+        for child_page_id in [child_page_id for child_page_id, page in self.pages.items() if page['parent'] == page_id]:
+            self.remove(child_page_id)
+        del self.pages[page_id]
+
+    def ancestors(self, page_id):
+        parent = self.pages[page_id]['parent']
+        return [] if parent is None else self.ancestors(parent) + [parent]
+
+    def record(self, page_id):
+        page = self.pages[page_id]
+        return {'name': page['name'],
+                'last_updated': datetime.datetime(2018, 5, 1, 10, 30) + datetime.timedelta(minutes=page['version']),
+                'version': page['version'], 'labels': list(page['labels']), 'content': page['content'],
+                'links': {'webui': '/pages/%d' % page_id, 'base': 'https://wiki'},
+                'ancestors': self.ancestors(page_id)}
+
+    def get_child_pages(self, parent_id, label=None, title=None):
+        return {page_id: self.record(page_id) for page_id, page in sorted(self.pages.items())
+                if page['parent'] == parent_id and (label is None or label in page['labels']) and
+                (title is None or page['name'] == title)}
+
+    def get_page_record(self, content_id):
+        return self.record(content_id) if content_id in self.pages else None
+
+    def get_existing_page_ids(self, page_ids, chunk_size=200):
+        return set(page_ids) & set(self.pages)
+
+    def get_page_properties(self, content_id, space_key, labels):
+        return self.pages[content_id]['properties']
+
+    def get_pages_modified_since(self, space, since, timezone=None):
+        return {page_id: self.record(page_id) for page_id in self.pages if page_id in self.modified}
+
+    def patch(self):
+        patches = [mock.patch.object(ConfluenceAPI, name, side_effect=getattr(self, name))
+                   for name in ['get_child_pages', 'get_page_record', 'get_existing_page_ids', 'get_page_properties',
+                                'get_pages_modified_since']]
+        patches.append(mock.patch.object(ConfluenceAPI, 'get_homepage_id_of_space', return_value=1))
+        patches.append(mock.patch.object(ConfluenceAPI, 'get_last_update_time_of_content',
+                                         return_value=datetime.datetime(2018, 5, 1, 12, 0)))
+        return patches
+
+
+@unittest.skipIf(importlib.util.find_spec('pandas') is None, 'pandas is not installed')
+class TestMainCrawl(unittest.TestCase):
+    pages = {'labels': {'application': {'panels': ['Info'], 'page_properties': ['application'],
+                                        'pages': {'titles': {'Support': {'headings': ['Contact']}}}}}}
+    tables = ['test_appli', 'test_appli__info', 'test_appli_suppo', 'test_appli_suppo__info', 'test_digests']
+
+    @classmethod
+    def setUpClass(cls):
+        cls.main = load_main()
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.wiki = Wiki()
+        self.wiki.add(1, None, 'Applications')
+        for number in range(20):
+            page_id = 100 + number
+            self.wiki.add(page_id, 1, 'Application %d' % number, ['application'] if number % 5 else ['retired'],
+                          '<p><b>Info</b></p><p>Owned by team %d</p>' % number, {'Owner': ['Team %d' % number]})
+            self.wiki.add(1000 + number, page_id, 'Support', content='<h2>Contact</h2><p>support%d@wiki</p>' % number)
+            self.wiki.add(2000 + number, page_id, 'Roadmap', content='<p>Plans</p>')
+        self.patches = self.wiki.patch()
+        for patch in self.patches:
+            patch.start()
+
+    def connect(self, name, commit_every=1):
+        DatabaseAPI.connect({'sqlite': {'path': os.path.join(self.directory, name + '.db')},
+                             'mysql': {'table_prefix': 'test', 'commit_every': commit_every}})
+        DatabaseAPI.create_spaces_table()
+        DatabaseAPI.create_application_table()
+        DatabaseAPI.create_digests_table()
+
+    def config(self, max_workers):
+        return {'mysql': {'table_prefix': 'test'}, 'sync': {'max_workers': max_workers},
+                'wiki': {'spaces': {'APPLCTN': {'pages': self.pages}}}}
+
+    def state(self):
+        """The rows of the page, information and digest tables, without their auto increment ids."""
+        return {table: sorted(tuple(sorted((k, str(v)) for k, v in row.items() if k != 'id'))
+                              for row in DatabaseAPI.select(table)) for table in self.tables}
+
+    def crawl(self, max_workers, commit_every=1):
+        """Runs full and half syncs while the wiki is edited, and returns the end state of each run."""
+        wiki = self.wiki.pages.copy()
+        self.wiki.pages = {page_id: dict(page) for page_id, page in wiki.items()}
+        self.connect('crawl-%d-%d' % (max_workers, commit_every), commit_every)
+        config = self.config(max_workers)
+        states = []
+        try:
+            self.assertTrue(self.main.run(config, True, False))
+            states.append(self.state())
+            # A rerun with nothing changed on the wiki.
+            self.assertTrue(self.main.run(config, True, False))
+            states.append(self.state())
+            # Pages are edited, relabelled, added, moved and deleted.
+            self.wiki.edit(101, content='<p><b>Info</b></p><p>Owned by team X</p>', properties={'Owner': ['X']})
+            self.wiki.edit(102, labels=['retired'])
+            self.wiki.edit(1003, content='<h2>Contact</h2><p>helpdesk@wiki</p>')
+            self.wiki.edit(2004, name='Support', content='<h2>Contact</h2><p>roadmap@wiki</p>')
+            self.wiki.edit(1006, parent=107)
+            self.wiki.remove(108)
+            self.wiki.remove(1009)
+            self.wiki.add(130, 1, 'Application 30', ['application'], '<p><b>Info</b></p><p>New</p>')
+            self.wiki.add(1030, 130, 'Support', content='<h2>Contact</h2><p>new@wiki</p>')
+            self.assertTrue(self.main.run(config, True, False))
+            states.append(self.state())
+            self.wiki.edit(111, content='<p><b>Info</b></p><p>Owned by team Y</p>')
+            self.assertTrue(self.main.run(config, False, False))
+            states.append(self.state())
+        finally:
+            DatabaseAPI.disconnect()
+            self.wiki.pages = wiki
+        return states
+
+    def test_concurrent_crawl_matches_serial(self):
+        serial = self.crawl(1)
+        self.assertEqual(serial[0], serial[1])
+        self.assertNotEqual(serial[1], serial[2])
+        self.assertEqual(len(serial[0]['test_appli']), 16)
+        self.assertEqual(len(serial[0]['test_appli_suppo']), 16)
+
+        self.assertEqual(self.crawl(8), serial)
+        self.assertEqual(self.crawl(8, 3), serial)
+
+    def test_crawl_end_state(self):
+        self.crawl(1)
+        self.connect('crawl-1-1')
+        stored = set(row['key'] for row in DatabaseAPI.select('test_appli'))
+        support = {row['key']: row['parent'] for row in DatabaseAPI.select('test_appli_suppo')}
+        info = {(row['parent'], row['key']): row['value'] for row in DatabaseAPI.select('test_appli__info')}
+
+        # The relabelled and deleted applications are removed, along with the pages below them.
+        self.assertNotIn(102, stored)
+        self.assertNotIn(108, stored)
+        self.assertIn(130, stored)
+        self.assertNotIn(1002, support)
+        self.assertNotIn(1008, support)
+        self.assertNotIn(1009, support)
+        # Moved and renamed pages are found below their new parent.
+        self.assertEqual(support[1006], 107)
+        self.assertEqual(support[2004], 104)
+        self.assertEqual(info[101, 'Owner'], 'X')
+        self.assertEqual(info[111, 'Info'], 'Owned by team Y')
+        self.assertNotIn((102, 'Owner'), info)
+
+    def test_search_left_out_page_kept(self):
+        self.connect('search')
+        self.assertTrue(self.main.run(self.config(1), True, False))
+        before = self.state()
+
+        # The search leaves a page out, and a page is moved below another application without being edited.
+        with mock.patch.object(ConfluenceAPI, 'get_child_pages',
+                               side_effect=lambda parent_id, label=None, title=None: {
+                                   page_id: page for page_id, page in
+                                   self.wiki.get_child_pages(parent_id, label, title).items() if page_id != 103}):
+            self.wiki.pages[1004]['parent'] = 105
+            self.main.crawl_child_pages(self.pages, 1, 1, 'test', True)
+            self.main.crawl_child_pages(self.pages['labels']['application']['pages'], 1, 104, 'test_appli', True)
+        DatabaseAPI.flush()
+
+        self.assertEqual(self.state()['test_appli'], before['test_appli'])
+        self.assertIsNone(DatabaseAPI.check_data_exists('test_appli_suppo', 104, 1004))
+        DatabaseAPI.disconnect()
+
+    def test_cleanup_removes_deleted_and_orphaned_pages(self):
+        self.connect('cleanup')
+        self.assertTrue(self.main.run(self.config(1), True, False))
+        self.wiki.remove(1001)
+        self.wiki.remove(103)
+
+        with mock.patch.object(ConfluenceAPI, 'get_existing_page_ids',
+                               side_effect=self.wiki.get_existing_page_ids) as get_existing_page_ids:
+            self.main.recursive_db_cleanup(self.pages, 1, 'test', True)
+
+        self.assertIsNone(DatabaseAPI.check_data_exists('test_appli', 1, 103))
+        self.assertIsNone(DatabaseAPI.check_data_exists('test_appli_suppo', 101, 1001))
+        # The support page below the deleted application is an orphan, which is deleted without being checked.
+        self.assertIsNone(DatabaseAPI.check_data_exists('test_appli_suppo', 103, 1003))
+        self.assertEqual(DatabaseAPI.select('test_appli__info', 103), [])
+        self.assertIsNone(DatabaseAPI.get_digest('test_appli', 103))
+        # The pages of each table are checked in one batch.
+        self.assertEqual(get_existing_page_ids.call_count, 2)
+        DatabaseAPI.disconnect()
+
+    def test_incremental_sync(self):
+        self.connect('incremental')
+        config = self.config(1)
+        self.assertTrue(self.main.run(config, True, False))
+        self.wiki.edit(101, content='<p><b>Info</b></p><p>Owned by team X</p>')
+        self.wiki.add(130, 1, 'Application 30', ['application'], '<p><b>Info</b></p><p>New</p>')
+        self.wiki.add(1030, 130, 'Support', content='<h2>Contact</h2><p>new@wiki</p>')
+        self.wiki.remove(104)
+        self.wiki.modified = {101, 130, 1030}
+        wiki_time = datetime.timezone(datetime.timedelta(hours=12))
+        since = datetime.datetime(2018, 5, 1, 0, 0, tzinfo=datetime.timezone.utc)
+
+        with mock.patch.object(ConfluenceAPI, 'get_last_update_time_of_content',
+                               return_value=datetime.datetime(2018, 5, 1, 12, 0, tzinfo=wiki_time)):
+            self.assertTrue(self.main.run_incremental({**config, 'sync': {'watermark_margin': 30}}, since, False))
+
+        # The search starts a margin before the watermark, in the timezone of the wiki.
+        self.assertEqual(ConfluenceAPI.get_pages_modified_since.call_args[0],
+                         ('APPLCTN', since - datetime.timedelta(minutes=30), wiki_time))
+        info = {(row['parent'], row['key']): row['value'] for row in DatabaseAPI.select('test_appli__info')}
+        self.assertEqual(info[101, 'Info'], 'Owned by team X')
+        self.assertIsNotNone(DatabaseAPI.check_data_exists('test_appli', 1, 130))
+        self.assertIsNotNone(DatabaseAPI.check_data_exists('test_appli_suppo', 130, 1030))
+        # The deleted page is removed.
+        self.assertIsNone(DatabaseAPI.check_data_exists('test_appli', 1, 104))
+        DatabaseAPI.disconnect()
+
+    def test_digest_skips_unchanged_pages(self):
+        self.connect('digest')
+        self.assertTrue(self.main.run(self.config(1), True, False))
+        # The version changes without a change to the content (i.e. a comment was added).
+        self.wiki.edit(101)
+
+        with mock.patch.object(ConfluenceAPI, 'get_page_properties',
+                               side_effect=self.wiki.get_page_properties) as get_page_properties:
+            self.assertTrue(self.main.run(self.config(1), False, False))
+            self.assertEqual(get_page_properties.call_count, 0)
+            # A change to the labels changes the page properties.
+            self.wiki.edit(101, labels=['application', 'critical'], properties={'Owner': ['Critical']})
+            self.assertTrue(self.main.run(self.config(1), False, False))
+            self.assertEqual(get_page_properties.call_count, 1)
+
+        info = {(row['parent'], row['key']): row['value'] for row in DatabaseAPI.select('test_appli__info')}
+        self.assertEqual(info[101, 'Owner'], 'Critical')
+        DatabaseAPI.disconnect()
+
+    def test_reextract_keeps_incomplete_pages(self):
+        self.connect('reextract')
+        self.assertTrue(self.main.run(self.config(1), True, False))
+        before = self.state()
+
+        # Only the page properties of the first application are archived.
+        def get_page_properties(content_id, space_key, labels):
+            if content_id != 101:
+                raise ValueError('Unable to retrieve the page properties of page with id: %s' % content_id)
+            return {'Owner': ['Archived']}
+
+        with mock.patch.object(ConfluenceAPI, 'get_archived_page', side_effect=self.wiki.get_page_record), \
+                mock.patch.object(ConfluenceAPI, 'get_page_properties', side_effect=get_page_properties):
+            self.main.reextract(self.pages, 1, 'test')
+        DatabaseAPI.flush()
+
+        info = {(row['parent'], row['key']): row['value'] for row in DatabaseAPI.select('test_appli__info')}
+        self.assertEqual(info[101, 'Owner'], 'Archived')
+        self.assertEqual(sorted(row for row in self.state()['test_appli__info'] if ('parent', '103') in row),
+                         sorted(row for row in before['test_appli__info'] if ('parent', '103') in row))
+        # The incomplete pages are extracted again on the next sync.
+        self.assertIsNone(DatabaseAPI.get_digest('test_appli', 103))
+        self.assertIsNotNone(DatabaseAPI.get_digest('test_appli', 101))
+        DatabaseAPI.disconnect()
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.directory)
+
+
+if __name__ == '__main__':
+    unittest.main()